@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+cli_startup - A benchmark of the start up time of the command line tools.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: A benchmark of the start up time of the command line tools.
+#          The commands which do not access the database (i.e., the help
+#          for each tool and query and recording an event with
+#          cjr_record.py through a recorder daemon) are compared with the
+#          start up budget and run with '-X importtime' to check sqlalchemy
+#          is not imported. The commands which query or write to the
+#          database (JOBS, ALLTASKS, TASK and SUMMARY queries and START and
+#          FINISH events written without the daemon) are run against a
+#          temporary sqlite database, populated with a job of 100 tasks,
+#          and compared with a separate (larger) database budget. The warm
+#          runs are run once to warm the file system and bytecode caches
+#          and then a number of times in a new python process and the median
+#          time is compared with the budget. Each command is then run once
+#          cold: with a copy of the package without any bytecode files
+#          (and PYTHONDONTWRITEBYTECODE set), with '-X importtime' and,
+#          where the benchmark has permission (i.e., run as root), after
+#          the page cache has been dropped. The cold runs are reported
+#          separately and are not compared with the budgets. The exit code
+#          is 1 if any warm run is over budget or a command which does not
+#          access the database imports sqlalchemy.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.1
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+# Version 1.1 - Added the database commands and the cold runs 17/10/2026.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN_DIR = os.path.join(PKG_DIR, "bin")
+
+QUERY_TYPES = ["JOBS", "ALLTASKS", "INCOMPLETE", "TASK", "SUMMARY", "EXPORT", "WATCH", "STALLED"]
+DB_QUERY_ARGS = [("JOBS", []), ("ALLTASKS", ["-j", "cli_startup"]), ("TASK", ["-j", "cli_startup", "-t", "task_0"]),
+                 ("SUMMARY", ["-j", "cli_startup"])]
+HELP_SCRIPTS = ["cjr_query.py", "cjr_record.py", "cjr_db_admin.py", "cjr_init_db.py", "cjr_flush_journal.py",
+                "cjr_recorder_daemon.py"]
+HEAVY_MODULES = ["sqlalchemy", "numpy", "pyarrow"]
+N_DB_TASKS = 100
+
+
+def get_cli_commands(socket_path=None, db_commands=False):
+    """
+    A function which gets the commands to be benchmarked.
+
+    :param socket_path: optionally the socket of a running recorder daemon, where the task 'cli_startup' of the
+                        job 'cli_startup' has been started. If provided then recording an update for the task with
+                        cjr_record.py is benchmarked.
+    :param db_commands: if True then the commands which access the database are included. The database (defined
+                        by CJR_DB_FILE) needs to have been populated with _populate_db.
+
+    :return: list of (name, argument list, accesses database) tuples. '{run}' within the arguments is replaced
+             with the (unique) number of each run.
+    """
+    cli_commands = list()
+    if socket_path is not None:
+        cli_commands.append(("cjr_record.py -s UPDATE (daemon)",
+                             [os.path.join(BIN_DIR, "cjr_record.py"), "-s", "UPDATE", "-j", "cli_startup",
+                              "-t", "cli_startup", "-i", '{"progress": 1}', "--socket", socket_path], False))
+    for query_type in QUERY_TYPES:
+        cli_commands.append(("cjr_query.py -q {} --queryhelp".format(query_type),
+                             [os.path.join(BIN_DIR, "cjr_query.py"), "-q", query_type, "--queryhelp"], False))
+    for script in HELP_SCRIPTS:
+        cli_commands.append(("{} --help".format(script), [os.path.join(BIN_DIR, script), "--help"], False))
+    if db_commands:
+        for query_type, query_args in DB_QUERY_ARGS:
+            cli_commands.append(("cjr_query.py -q {} (db)".format(query_type),
+                                 [os.path.join(BIN_DIR, "cjr_query.py"), "-q", query_type] + query_args, True))
+        # Each run starts a new task and finishes one of the tasks started by _populate_db.
+        for status, task_id in [("START", "start_{run}"), ("FINISH", "finish_{run}")]:
+            cli_commands.append(("cjr_record.py -s {} (db)".format(status),
+                                 [os.path.join(BIN_DIR, "cjr_record.py"), "-s", status, "-j", "cli_startup",
+                                  "-t", task_id, "-i", '{"progress": 1}'], True))
+    return cli_commands
+
+
+def _run_command(cmd_args, env, run_idx=0, import_time=False):
+    py_args = [sys.executable]
+    if import_time:
+        py_args.append("-Ximporttime")
+    cmd_args = [cmd_arg.replace("{run}", str(run_idx)) for cmd_arg in cmd_args]
+    start_time = time.perf_counter()
+    proc = subprocess.run(py_args + cmd_args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    run_time = time.perf_counter() - start_time
+    if proc.returncode != 0:
+        raise Exception("Command failed ({}): {}".format(" ".join(cmd_args), proc.stderr.decode("utf-8")))
+    return run_time, proc.stderr.decode("utf-8")
+
+
+def _get_imported_modules(import_time_log):
+    imported_modules = set()
+    for log_line in import_time_log.splitlines():
+        if log_line.startswith("import time:") and ("|" in log_line):
+            module_name = log_line.split("|")[-1].strip()
+            imported_modules.add(module_name.split(".")[0])
+    return imported_modules
+
+
+def _get_import_time(import_time_log):
+    """
+    A function which gets the total import time (seconds) from the output of '-X importtime', which is the sum
+    of the cumulative times of the top level imports.
+    """
+    import_time = 0
+    for log_line in import_time_log.splitlines():
+        if log_line.startswith("import time:") and ("|" in log_line):
+            log_vals = log_line[len("import time:"):].split("|")
+            if (not log_vals[2].startswith("  ")) and log_vals[1].strip().isdigit():
+                import_time += int(log_vals[1])
+    return import_time / 1e6
+
+
+def _drop_page_cache():
+    """
+    A function which drops the page cache so the files read by a command are read from the disk. This
+    requires permission to write to /proc/sys/vm/drop_caches (i.e., to be run as root) on linux.
+
+    :return: boolean as to whether the page cache was dropped.
+    """
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as drop_caches_file:
+            drop_caches_file.write("3\n")
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def _populate_db(tmp_dir, env, n_runs):
+    """
+    A function which populates the database (defined by CJR_DB_FILE in env) with the tasks queried by the
+    database commands and the tasks finished by the FINISH command. The events are written with cjr_record.py
+    so sqlalchemy is not imported by the benchmark.
+    """
+    events_file = os.path.join(tmp_dir, "cjr_startup_events.jsonl")
+    with open(events_file, "w") as events_file_obj:
+        for i in range(N_DB_TASKS):
+            task_id = "task_{}".format(i)
+            events_file_obj.write(json.dumps({"status": "START", "jobname": "cli_startup", "taskid": task_id,
+                                              "taskinfo": {"param": i}}) + "\n")
+            events_file_obj.write(json.dumps({"status": "UPDATE", "jobname": "cli_startup", "taskid": task_id,
+                                              "taskinfo": {"progress": 50}}) + "\n")
+            if (i % 2) == 0:
+                events_file_obj.write(json.dumps({"status": "FINISH", "jobname": "cli_startup", "taskid": task_id,
+                                                  "taskinfo": {"progress": 100}}) + "\n")
+        # The warm up, timed, import time and cold runs each finish a task.
+        for i in range(n_runs + 3):
+            events_file_obj.write(json.dumps({"status": "START", "jobname": "cli_startup",
+                                              "taskid": "finish_{}".format(i), "taskinfo": {}}) + "\n")
+    _run_command([os.path.join(BIN_DIR, "cjr_record.py"), "--batch", events_file], env)
+
+
+def _start_daemon(tmp_dir, env):
+    """
+    A function which starts a recorder daemon with the database defined by CJR_DB_FILE in env and starts the
+    task used to benchmark cjr_record.py.
+
+    :return: (daemon process, socket path) tuple.
+    """
+    sys.path.insert(0, PKG_DIR)
+    import cjrlib.cjr_client
+
+    socket_path = os.path.join(tmp_dir, "cjr_daemon.sock")
+    daemon_proc = subprocess.Popen([sys.executable, os.path.join(BIN_DIR, "cjr_recorder_daemon.py"),
+                                    "--socket", socket_path], env=env)
+    for i in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    success, message = cjrlib.cjr_client.send_task_event(socket_path, "START", "cli_startup", "cli_startup", 0, {})
+    if not success:
+        raise Exception("Could not start the benchmark task: {}".format(message))
+    return daemon_proc, socket_path
+
+
+def _copy_package(tmp_dir):
+    """
+    A function which copies the package (cjrlib and bin) without any bytecode files for the cold runs.
+
+    :return: the directory of the copy.
+    """
+    cold_pkg_dir = os.path.join(tmp_dir, "cold_pkg")
+    for sub_dir in ["cjrlib", "bin"]:
+        shutil.copytree(os.path.join(PKG_DIR, sub_dir), os.path.join(cold_pkg_dir, sub_dir),
+                        ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+    return cold_pkg_dir
+
+
+def run_cli_benchmark(n_runs=5, budget=0.25, db_budget=1.0, print_progress=True):
+    """
+    A function which runs the start up benchmark. A temporary database is created and populated for the
+    database commands and a recorder daemon is started, using the same database, for the cjr_record.py
+    command. Each command is run warm (n_runs times) and then cold (once).
+
+    :param n_runs: the number of times each command is run warm.
+    :param budget: the maximum median warm time (seconds) for each command which does not access the database.
+    :param db_budget: the maximum median warm time (seconds) for each command which accesses the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: True)
+
+    :return: a list of dicts (name, median, max, cold, cold_import, heavy_imports, passed) for each command.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([PKG_DIR] + [path for path in [env.get("PYTHONPATH", None)] if path])
+    env.pop("CJR_DAEMON_SOCKET", None)
+
+    tmp_dir = tempfile.mkdtemp(prefix="cjr_startup_")
+    env["CJR_DB_FILE"] = "sqlite:///{}".format(os.path.join(tmp_dir, "cjr_startup.db"))
+    daemon_proc = None
+    try:
+        _populate_db(tmp_dir, env, n_runs)
+        daemon_proc, socket_path = _start_daemon(tmp_dir, env)
+        cli_commands = get_cli_commands(socket_path, db_commands=True)
+        results = _run_cli_commands(cli_commands, env, n_runs, budget, db_budget, print_progress)
+        _run_cold_commands(cli_commands, results, env, tmp_dir, n_runs, print_progress)
+        return results
+    finally:
+        if daemon_proc is not None:
+            daemon_proc.terminate()
+            daemon_proc.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _run_cli_commands(cli_commands, env, n_runs, budget, db_budget, print_progress):
+    results = list()
+    if print_progress:
+        print("Warm runs (budget: {:.3f}s, database budget: {:.3f}s):".format(budget, db_budget))
+    for cmd_name, cmd_args, db_access in cli_commands:
+        # Warm the file system cache (and python bytecode cache) before timing.
+        _run_command(cmd_args, env, 0)
+        run_times = [_run_command(cmd_args, env, i + 1)[0] for i in range(n_runs)]
+        heavy_imports = list()
+        if not db_access:
+            heavy_imports = sorted(_get_imported_modules(_run_command(cmd_args, env, n_runs + 1,
+                                                                      import_time=True)[1]).intersection(HEAVY_MODULES))
+        median_time = statistics.median(run_times)
+        passed = (median_time <= (db_budget if db_access else budget)) and (len(heavy_imports) == 0)
+        results.append({"name": cmd_name, "median": median_time, "max": max(run_times),
+                        "heavy_imports": heavy_imports, "passed": passed})
+        if print_progress:
+            print("{:<45} median: {:.3f}s max: {:.3f}s {}{}".format(cmd_name, median_time, max(run_times),
+                                                                  "OK" if passed else "FAIL",
+                                                                  "" if len(heavy_imports) == 0 else
+                                                                  " (imports: {})".format(", ".join(heavy_imports))))
+    return results
+
+
+def _run_cold_commands(cli_commands, results, env, tmp_dir, n_runs, print_progress):
+    """
+    A function which runs each command once cold, using a copy of the package without bytecode files, and adds
+    the time (cold) and total import time (cold_import) to the results.
+    """
+    cold_env = dict(env)
+    cold_pkg_dir = _copy_package(tmp_dir)
+    cold_env["PYTHONPATH"] = os.pathsep.join([cold_pkg_dir] + env["PYTHONPATH"].split(os.pathsep)[1:])
+    cold_env["PYTHONDONTWRITEBYTECODE"] = "1"
+    cold_bin_dir = os.path.join(cold_pkg_dir, "bin")
+
+    page_cache_dropped = True
+    for cmd_name, cmd_args, db_access in cli_commands:
+        cold_cmd_args = [cold_bin_dir + cmd_arg[len(BIN_DIR):] if cmd_arg.startswith(BIN_DIR) else cmd_arg
+                         for cmd_arg in cmd_args]
+        page_cache_dropped = _drop_page_cache() and page_cache_dropped
+        run_time, import_time_log = _run_command(cold_cmd_args, cold_env, n_runs + 2, import_time=True)
+        for result in results:
+            if result["name"] == cmd_name:
+                result["cold"] = run_time
+                result["cold_import"] = _get_import_time(import_time_log)
+    if print_progress:
+        print("Cold runs (no bytecode files, {}):".format("page cache dropped" if page_cache_dropped else
+                                                          "page cache not dropped - not run as root"))
+        for result in results:
+            print("{:<45} time: {:.3f}s imports: {:.3f}s".format(result["name"], result["cold"],
+                                                                 result["cold_import"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nruns", type=int, default=5, required=False,
+                        help="Specify the number of times each command is run.")
+    parser.add_argument("-b", "--budget", type=float, default=float(os.environ.get('CJR_CLI_BUDGET', 0.25)),
+                        required=False, help="Specify the maximum median time (seconds) for each command "
+                                             "(Default: CJR_CLI_BUDGET environmental variable or 0.25).")
+    parser.add_argument("--dbbudget", type=float, default=float(os.environ.get('CJR_CLI_DB_BUDGET', 1.0)),
+                        required=False, help="Specify the maximum median time (seconds) for each command which "
+                                             "accesses the database (Default: CJR_CLI_DB_BUDGET environmental "
+                                             "variable or 1.0).")
+    args = parser.parse_args()
+
+    results = run_cli_benchmark(args.nruns, args.budget, args.dbbudget)
+    n_failed = len([result for result in results if not result["passed"]])
+    if n_failed > 0:
+        print("{} of {} commands are over budget or import heavy modules.".format(n_failed, len(results)))
+        sys.exit(1)
+    print("All {} commands are within budget.".format(len(results)))
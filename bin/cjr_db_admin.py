@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+compute_job_recorder - Command to administer the compute job database.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2019 Pete Bunting
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose:  Command line tool for administering the database.
+#
+# Author: Pete Bunting
+# Email: pfb@aber.ac.uk
+# Date: 08/02/2019
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created.
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--action", type=str, required=True, default=None,
+                        choices=["MIGRATEUPDATES", "INDEXES", "EXPLAIN", "ARCHIVE", "ARCHIVES", "COMPACT"],
+                        help="Specify the administration action to be performed.")
+    parser.add_argument("-j", "--jobname", type=str, required=False, default=None,
+                        help="Specify the job name used within the queries for EXPLAIN or the job to be archived "
+                             "(ARCHIVE and ARCHIVES). For ARCHIVE, if not specified then all jobs are archived.")
+    parser.add_argument("-v", "--version", type=int, default=None, required=False,
+                        help="Specify the version used within the queries for EXPLAIN or the version to be "
+                             "archived (ARCHIVE, requires --jobname). For ARCHIVE, if not specified then all the "
+                             "completed versions are archived.")
+    parser.add_argument("--archivedir", type=str, required=False, default=None,
+                        help="Specify the directory the archive files are written to for ARCHIVE.")
+    parser.add_argument("--olderthan", type=float, required=False, default=None,
+                        help="Specify that ARCHIVE only archives the versions where the last task finished more "
+                             "than this number of days ago.")
+    parser.add_argument("--nocompact", action='store_true', default=False,
+                        help="Specify that the database is not compacted (VACUUM/ANALYZE) after ARCHIVE.")
+    parser.add_argument("--deletepayloads", action='store_true', default=False,
+                        help="Specify that the payloads no longer referenced by any task are deleted from the "
+                             "payload store when the database is compacted (ARCHIVE and COMPACT). With MySQL, "
+                             "tasks should not be recorded at the same time.")
+    parser.add_argument("--batchsize", type=int, default=1000, required=False,
+                        help="Specify the number of records processed within each transaction.")
+    parser.add_argument("--printprogress", action='store_true', default=False,
+                        help="Specify that progress statements should be printed to the console - "
+                             "useful for debugging.")
+
+    args = parser.parse_args()
+
+    import cjrlib.cjr_db_admin
+
+    if args.action == "MIGRATEUPDATES":
+        n_tasks = cjrlib.cjr_db_admin.migrate_task_updates(args.batchsize, args.printprogress)
+        print("Migrated the updates for {} tasks.".format(n_tasks))
+    elif args.action == "INDEXES":
+        created_indexes = cjrlib.cjr_db_admin.create_indexes(args.printprogress)
+        print("Created {} indexes: {}".format(len(created_indexes), ", ".join(created_indexes)))
+    elif args.action == "EXPLAIN":
+        job_name = args.jobname
+        if job_name is None:
+            job_name = "JobName"
+        version = args.version
+        if version is None:
+            version = 0
+        query_plans = cjrlib.cjr_db_admin.explain_queries(job_name, version)
+        for query_name in query_plans:
+            query_sql, query_plan = query_plans[query_name]
+            print("{}:".format(query_name))
+            print("\t{}".format(" ".join(query_sql.split())))
+            for plan_line in query_plan:
+                print("\t\t{}".format(plan_line))
+    elif args.action == "ARCHIVE":
+        import cjrlib.cjr_archive
+        if args.archivedir is None:
+            parser.error("--archivedir is required for ARCHIVE.")
+        if args.version is not None:
+            if args.jobname is None:
+                parser.error("--jobname is required when a version is specified for ARCHIVE.")
+            n_tasks = cjrlib.cjr_archive.archive_job_version(args.jobname, args.version, args.archivedir,
+                                                             args.batchsize, args.printprogress)
+            archived_versions = [(args.jobname, args.version, n_tasks)]
+            if not args.nocompact:
+                cjrlib.cjr_archive.compact_db(args.printprogress, args.deletepayloads)
+        else:
+            archived_versions = cjrlib.cjr_archive.archive_completed_versions(args.archivedir, args.jobname,
+                                                                              args.olderthan, args.batchsize,
+                                                                              not args.nocompact, args.printprogress,
+                                                                              args.deletepayloads)
+        for job_name, version, n_tasks in archived_versions:
+            print("Archived {} v{}: {} tasks".format(job_name, version, n_tasks))
+        print("Archived {} versions.".format(len(archived_versions)))
+    elif args.action == "ARCHIVES":
+        import cjrlib.cjr_archive
+        for archived_version in cjrlib.cjr_archive.get_archived_versions(args.jobname):
+            print("{} v{}: {} tasks archived {} to '{}'".format(archived_version['job_name'],
+                                                               archived_version['version'],
+                                                               archived_version['n_tasks'],
+                                                               archived_version['archive_time'],
+                                                               archived_version['archive_file']))
+    elif args.action == "COMPACT":
+        import cjrlib.cjr_archive
+        cjrlib.cjr_archive.compact_db(args.printprogress, args.deletepayloads)
+    else:
+        raise Exception("Action provided was not recognised.")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+compute_job_recorder - Command to flush a local journal of task events to the database.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2019 Pete Bunting
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose:  Command line tool for flushing a journal to the database.
+#
+# Author: Pete Bunting
+# Email: pfb@aber.ac.uk
+# Date: 08/02/2019
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created.
+
+import argparse
+import os
+import time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--journal", type=str, required=False, default=os.environ.get('CJR_JOURNAL_FILE', None),
+                        help="Specify the journal file (Default: CJR_JOURNAL_FILE environmental variable).")
+    parser.add_argument("--maxbatch", type=int, required=False,
+                        default=int(os.environ.get('CJR_JOURNAL_MAX_BATCH', 500)),
+                        help="Specify the maximum number of events written within a transaction.")
+    parser.add_argument("--interval", type=float, required=False, default=None,
+                        help="If specified, keep running and flush the journal every 'interval' seconds.")
+    parser.add_argument("--printprogress", action='store_true', default=False,
+                        help="Specify that progress statements should be printed to the console - "
+                             "useful for debugging.")
+
+    args = parser.parse_args()
+
+    import cjrlib.cjr_journal
+
+    if args.journal is None:
+        raise Exception("A journal file must be specified using --journal or CJR_JOURNAL_FILE.")
+
+    journal = cjrlib.cjr_journal.CJRJournal(args.journal)
+    while True:
+        failed_events = journal.flush(args.maxbatch, args.printprogress)
+        for event, message in failed_events:
+            print("Event for '{} - {} v{}' was not recorded: {}".format(event[1], event[2], event[3], message))
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+compute_job_recorder - Command to create or upgrade the compute job database.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2019 Pete Bunting
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose:  Command line tool for creating or upgrading the database
+#           defined by the CJR_DB_FILE environmental variable.
+#
+# Author: Pete Bunting
+# Email: pfb@aber.ac.uk
+# Date: 08/02/2019
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created.
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nomigrateupdates", action='store_true', default=False,
+                        help="Specify that task updates within the legacy TaskUpdates column should not be "
+                             "moved to the CJRTaskUpdate table.")
+    parser.add_argument("--printprogress", action='store_true', default=False,
+                        help="Specify that progress statements should be printed to the console - "
+                             "useful for debugging.")
+
+    args = parser.parse_args()
+
+    import cjrlib.cjr_db_admin
+
+    schema_version = cjrlib.cjr_db_admin.init_db(not args.nomigrateupdates, args.printprogress)
+    if schema_version is None:
+        print("Created the database.")
+    else:
+        print("Database was at schema version {}, now version {}.".format(schema_version,
+                                                                         cjrlib.cjr_db_admin.CJR_SCHEMA_VERSION))
@@ -31,33 +31,64 @@ compute_job_recorder - Command to record the status of a compute job.
 
 import argparse
 import pprint
-import cjrlib.cjr_queries
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-q", "--query", type=str, required=True, default=None,
-                        choices=["JOBS", "ALLTASKS", "INCOMPLETE", "TASK"], help="Specify the query to be made.")
+                        choices=["JOBS", "ALLTASKS", "INCOMPLETE", "TASK", "SUMMARY", "EXPORT", "WATCH",
+                                 "STALLED"],
+                        help="Specify the query to be made.")
     parser.add_argument("-j", "--jobname", type=str, required=False, default=None,
                         help="Specify the job name, a generic name for a group of jobs.")
     parser.add_argument("-t", "--taskid", type=str, required=False, default=None,
                         help="Specify a job ID, unique within the 'jobname'.")
     parser.add_argument("-v", "--version", type=int, default=0, required=False,
                         help="Specify the version of the job and task.")
+    parser.add_argument("-f", "--fields", type=str, required=False, default=None,
+                        help="Specify a comma separated list of the fields to be printed for the tasks (ALLTASKS, "
+                             "INCOMPLETE, TASK, WATCH and STALLED queries). Options: task_id, job_name, version, start, "
+                             "end, params, update_info, end_info, completed, last_modified, last_heartbeat.")
+    parser.add_argument("-o", "--output", type=str, required=False, default=None,
+                        help="Specify the output file for the EXPORT query.")
+    parser.add_argument("--format", type=str, required=False, default="JSONL", choices=["JSONL", "CSV", "PARQUET"],
+                        help="Specify the output format for the EXPORT query.")
+    parser.add_argument("--compression", type=str, required=False, default=None,
+                        help="Specify the compression for the EXPORT query (JSONL and CSV: gzip, bz2 or xz; "
+                             "PARQUET: snappy, gzip, brotli, zstd etc.).")
+    parser.add_argument("--allversions", action='store_true', default=False,
+                        help="Specify that the EXPORT and WATCH queries should use all the versions of the job.")
+    parser.add_argument("--cursor", type=str, required=False, default=None,
+                        help="Specify the cursor to start the WATCH query from (as printed when it stops).")
+    parser.add_argument("--interval", type=float, required=False, default=10.0,
+                        help="Specify the time (seconds) between checking for changes in the WATCH query.")
+    parser.add_argument("--archived", action='store_true', default=False,
+                        help="Specify that the ALLTASKS and TASK queries should read the tasks from the archive "
+                             "if the version has been archived and that the JOBS query should include the jobs "
+                             "which have been fully archived.")
+    parser.add_argument("--olderthan", type=float, required=False, default=3600.0,
+                        help="Specify the time (seconds) since the last start or update for a task to be stalled "
+                             "in the STALLED query.")
     parser.add_argument("--queryhelp", action='store_true', default=False,
                         help="Get help for the command, if specify a query then help for that query will be printed.")
 
     args = parser.parse_args()
 
+    fields = None
+    if args.fields is not None:
+        fields = [field.strip() for field in args.fields.split(",")]
+
     if args.queryhelp:
         if args.query == "JOBS":
             print("Prints a list of job names.")
-            print("\tDoes not require any inputs.")
+            print("\tProvide:")
+            print("\t\t --archived (Optional)")
         elif args.query == "ALLTASKS":
             print("Prints all tasks associated with a job name and version")
             print("\tProvide:")
             print("\t\t --jobname <string>")
             print("\t\t --version <integer>")
+            print("\t\t --archived (Optional)")
         elif args.query == "INCOMPLETE":
             print("Prints all uncompleted tasks associated with a job name and version")
             print("\tProvide:")
@@ -69,26 +100,110 @@ if __name__ == "__main__":
             print("\t\t --jobname <string>")
             print("\t\t --taskid <string>")
             print("\t\t --version <integer>")
+            print("\t\t --archived (Optional)")
+        elif args.query == "SUMMARY":
+            print("Prints a summary (number of tasks completed and runtime statistics) of the tasks associated with "
+                  "a job name and version")
+            print("\tProvide:")
+            print("\t\t --jobname <string>")
+            print("\t\t --version <integer>")
+        elif args.query == "EXPORT":
+            print("Exports the tasks associated with a job name and version (or all versions) to a file")
+            print("\tProvide:")
+            print("\t\t --jobname <string>")
+            print("\t\t --version <integer> or --allversions")
+            print("\t\t --output <file path>")
+            print("\t\t --format <JSONL|CSV|PARQUET> (Optional)")
+            print("\t\t --compression <string> (Optional)")
+        elif args.query == "WATCH":
+            print("Prints the tasks associated with a job name (or all jobs) as they are started, updated or finished, "
+                  "as a JSON object per line. Without a cursor all the tasks are printed first. When stopped (Ctrl-C) "
+                  "the cursor to resume from is printed to stderr.")
+            print("\tProvide:")
+            print("\t\t --jobname <string> (Optional)")
+            print("\t\t --version <integer> or --allversions (only used with --jobname)")
+            print("\t\t --cursor <string> (Optional)")
+            print("\t\t --interval <float> (Optional)")
+        elif args.query == "STALLED":
+            print("Prints the uncompleted tasks associated with a job name and version which have not been started "
+                  "or updated within a period of time (oldest first)")
+            print("\tProvide:")
+            print("\t\t --jobname <string>")
+            print("\t\t --version <integer>")
+            print("\t\t --olderthan <float> (Optional)")
         else:
             raise Exception("Query type provided was not recognised.")
     else:
+        # Only import the query functions (and sqlalchemy) when a query is to be made.
+        import cjrlib.cjr_queries
         if args.query == "JOBS":
-            job_names = cjrlib.cjr_queries.query_job_names()
+            job_names = cjrlib.cjr_queries.query_job_names(include_archived=args.archived)
             i = 0
             for job_name in job_names:
                 print("{}: {}".format(i, job_name))
                 i = i + 1
         elif args.query == "ALLTASKS":
-            tasks_dict = cjrlib.cjr_queries.get_all_tasks(args.jobname, args.version, datetimeobjs=True)
+            tasks_dict = cjrlib.cjr_queries.get_all_tasks(args.jobname, args.version, datetimeobjs=True, fields=fields,
+                                                          include_archived=args.archived)
             for task in tasks_dict:
                 pprint.pprint(task)
         elif args.query == "INCOMPLETE":
-            tasks_dict = cjrlib.cjr_queries.get_uncompleted_tasks(args.jobname, args.version, datetimeobjs=True)
+            tasks_dict = cjrlib.cjr_queries.get_uncompleted_tasks(args.jobname, args.version, datetimeobjs=True,
+                                                                 fields=fields)
+            for task in tasks_dict:
+                pprint.pprint(task)
+        elif args.query == "STALLED":
+            tasks_dict = cjrlib.cjr_queries.get_stalled_tasks(args.jobname, args.version, args.olderthan,
+                                                              datetimeobjs=True, fields=fields)
             for task in tasks_dict:
                 pprint.pprint(task)
         elif args.query == "TASK":
-            task_dict = cjrlib.cjr_queries.get_task(args.jobname, args.taskid, args.version, datetimeobjs=True)
+            task_dict = cjrlib.cjr_queries.get_task(args.jobname, args.taskid, args.version, datetimeobjs=True,
+                                                    fields=fields, include_archived=args.archived)
             pprint.pprint(task_dict)
+        elif args.query == "SUMMARY":
+            summary = cjrlib.cjr_queries.get_job_summary(args.jobname, args.version)
+            print("Tasks: {}".format(summary['n_tasks']))
+            print("Completed: {}".format(summary['n_completed']))
+            print("Uncompleted: {}".format(summary['n_uncompleted']))
+            if summary['completed_frac'] is not None:
+                print("Completed Fraction: {:.4f}".format(summary['completed_frac']))
+            print("First Start: {}".format(summary['first_start']))
+            print("Last End: {}".format(summary['last_end']))
+            if summary['runtime_mean'] is not None:
+                print("Runtime (seconds):")
+                for runtime_stat in ['mean', 'min', 'max', 'p50', 'p95']:
+                    print("\t{}: {:.3f}".format(runtime_stat, summary['runtime_{}'.format(runtime_stat)]))
+        elif args.query == "EXPORT":
+            import cjrlib.cjr_export
+            if args.output is None:
+                raise Exception("An output file must be specified using --output.")
+            version = args.version
+            if args.allversions:
+                version = None
+            n_tasks = cjrlib.cjr_export.export_tasks(args.jobname, args.output, args.format, version,
+                                                     args.compression)
+            print("Exported {} tasks to '{}'.".format(n_tasks, args.output))
+        elif args.query == "WATCH":
+            import json
+            import sys
+            import time
+            version = None
+            if (args.jobname is not None) and (not args.allversions):
+                version = args.version
+            cursor = args.cursor
+            try:
+                while True:
+                    tasks, cursor = cjrlib.cjr_queries.get_tasks_changed_since(cursor, args.jobname, version,
+                                                                                datetimeobjs=True, fields=fields)
+                    for task in tasks:
+                        print(json.dumps(task, default=str))
+                    sys.stdout.flush()
+                    if len(tasks) == 0:
+                        time.sleep(args.interval)
+            except KeyboardInterrupt:
+                if cursor is not None:
+                    print("Cursor: {}".format(cursor), file=sys.stderr)
         else:
             raise Exception("Query type provided was not recognised.")
 
@@ -31,42 +31,96 @@ compute_job_recorder - Command to record the status of a compute job.
 
 import argparse
 import json
-import cjrlib.cjr_recorder
+import cjrlib.cjr_client
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s", "--status", type=str, required=True, default=None,
+    parser.add_argument("-s", "--status", type=str, required=False, default=None,
                         choices=["START", "UPDATE", "FINISH"], help="Specify the job status.")
-    parser.add_argument("-j", "--jobname", type=str, required=True,
+    parser.add_argument("-j", "--jobname", type=str, required=False,
                         help="Specify the job name, a generic name for a group of jobs.")
-    parser.add_argument("-t", "--taskid", type=str, required=True,
+    parser.add_argument("-t", "--taskid", type=str, required=False,
                         help="Specify a job ID, unique within the 'jobname'.")
     parser.add_argument("-v", "--version", type=int, default=0, required=False,
                         help="Specify the version of the job and task.")
-    parser.add_argument("-i", "--taskinfo", type=str, required=True,
+    parser.add_argument("-i", "--taskinfo", type=str, required=False,
                         help='''Specify the status info, this is stored in JSON and should be provided in that format:
                                 * START - input parameters, helpful to include enough information to re-run the job.
                                 * UPDATE - any information on job progress.
                                 * FINISH - information on completion.
                              ''')
+    parser.add_argument("--batch", type=str, required=False, default=None,
+                        help="Specify a JSON Lines file (or '-' for stdin) of events to be recorded, one JSON object "
+                             "per line with status, jobname, taskid, version (optional), taskinfo (optional) and "
+                             "time (optional, ISO format) values. Replaces the --status, --jobname, --taskid, "
+                             "--version and --taskinfo options. The events are written directly to the database "
+                             "and the lines which could not be recorded are reported.")
+    parser.add_argument("--batchsize", type=int, default=500, required=False,
+                        help="Specify the number of events recorded within each transaction in --batch mode.")
+    parser.add_argument("--socket", type=str, required=False,
+                        default=cjrlib.cjr_client.get_daemon_socket_path(),
+                        help="Specify the socket of a recorder daemon (cjr_recorder_daemon.py) to send the event to "
+                             "(Default: CJR_DAEMON_SOCKET environmental variable). If the daemon is not running the "
+                             "event is written directly to the database.")
     parser.add_argument("--printprogress", action='store_true', default=False,
                         help="Specify that progress statements should be printed to the console - "
                              "useful for debugging.")
-
     args = parser.parse_args()
 
-    if args.status == "START":
-        status = cjrlib.cjr_recorder.JobStatus.START
-    elif args.status == "FINISH":
-        status = cjrlib.cjr_recorder.JobStatus.FINISH
-    elif args.status == "UPDATE":
-        status = cjrlib.cjr_recorder.JobStatus.UPDATE
-    else:
-        raise Exception("Status provided was not recognised.")
+    if args.batch is not None:
+        import sys
+        import cjrlib.cjr_recorder
+
+        if args.batch == "-":
+            results = cjrlib.cjr_recorder.record_task_statuses_jsonl(sys.stdin, args.batchsize, args.printprogress)
+        else:
+            with open(args.batch, "r") as events_file_obj:
+                results = cjrlib.cjr_recorder.record_task_statuses_jsonl(events_file_obj, args.batchsize,
+                                                                         args.printprogress)
+        n_failed = 0
+        for line_number, success, message in results:
+            if not success:
+                print("Line {}: {}".format(line_number, message), file=sys.stderr)
+                n_failed = n_failed + 1
+        if args.printprogress or (n_failed > 0):
+            print("Recorded {} of {} events.".format(len(results) - n_failed, len(results)), file=sys.stderr)
+        sys.exit(1 if n_failed > 0 else 0)
+
+    for arg_name in ["status", "jobname", "taskid", "taskinfo"]:
+        if getattr(args, arg_name) is None:
+            parser.error("the --{} argument is required (unless using --batch)".format(arg_name))
 
     # Parse the
     task_info_str = args.taskinfo
     task_info_dict = json.loads(task_info_str)
 
-    cjrlib.cjr_recorder.record_task_status(status, args.jobname, args.taskid, args.version,
-                                           task_info_dict, args.printprogress)
+    # Only fall back to writing directly to the database if the daemon could not be connected to; once the
+    # event has been sent the daemon may have recorded it, so any errors are reported.
+    daemon_sock = None
+    if args.socket is not None:
+        try:
+            daemon_sock = cjrlib.cjr_client.connect_daemon(args.socket)
+        except OSError as error:
+            if args.printprogress:
+                print("Could not connect to the recorder daemon ({}) - writing to the database.".format(error))
+
+    if daemon_sock is not None:
+        success, message = cjrlib.cjr_client.send_daemon_task_event(daemon_sock, args.status, args.jobname,
+                                                                    args.taskid, args.version, task_info_dict)
+        if not success:
+            raise Exception(message)
+    else:
+        # Only import the recorder (and sqlalchemy) when writing directly to the database.
+        import cjrlib.cjr_recorder
+
+        if args.status == "START":
+            status = cjrlib.cjr_recorder.JobStatus.START
+        elif args.status == "FINISH":
+            status = cjrlib.cjr_recorder.JobStatus.FINISH
+        elif args.status == "UPDATE":
+            status = cjrlib.cjr_recorder.JobStatus.UPDATE
+        else:
+            raise Exception("Status provided was not recognised.")
+
+        cjrlib.cjr_recorder.record_task_status(status, args.jobname, args.taskid, args.version,
+                                               task_info_dict, args.printprogress)
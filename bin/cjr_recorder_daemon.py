@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+compute_job_recorder - Command to run the recorder daemon.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2019 Pete Bunting
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose:  Command line tool for running the recorder daemon, which
+#           cjr_record.py sends events to when CJR_DAEMON_SOCKET is set.
+#
+# Author: Pete Bunting
+# Email: pfb@aber.ac.uk
+# Date: 08/02/2019
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created.
+
+import argparse
+import os
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--socket", type=str, required=False, default=os.environ.get('CJR_DAEMON_SOCKET', None),
+                        help="Specify the path of the unix domain socket (Default: CJR_DAEMON_SOCKET "
+                             "environmental variable).")
+    parser.add_argument("--maxbatch", type=int, required=False, default=500,
+                        help="Specify the maximum number of events written within a transaction.")
+    parser.add_argument("--maxwait", type=float, required=False, default=0.05,
+                        help="Specify the maximum time (seconds) to wait for further events before writing a batch.")
+    parser.add_argument("--printprogress", action='store_true', default=False,
+                        help="Specify that progress statements should be printed to the console - "
+                             "useful for debugging.")
+
+    args = parser.parse_args()
+
+    import cjrlib.cjr_daemon
+
+    if args.socket is None:
+        raise Exception("A socket path must be specified using --socket or CJR_DAEMON_SOCKET.")
+
+    cjrlib.cjr_daemon.run_recorder_daemon(args.socket, args.maxbatch, args.maxwait, args.printprogress)
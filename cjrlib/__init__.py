@@ -30,18 +30,35 @@ cjr_db_connection - DB Connection class. Singleton class to reuse database conne
 # History:
 # Version 1.0 - Created.
 
+import sys
 import logging
-from distutils.version import LooseVersion
 
 CJR_VERSION_MAJOR = 0
 CJR_VERSION_MINOR = 1
 CJR_VERSION_PATCH = 1
 
 CJR_VERSION = str(CJR_VERSION_MAJOR) + "."  + str(CJR_VERSION_MINOR) + "." + str(CJR_VERSION_PATCH)
-CJR_VERSION_OBJ = LooseVersion(CJR_VERSION)
 
 CJR_COPYRIGHT_YEAR = "2019"
 CJR_COPYRIGHT_NAMES = "Pete Bunting"
 CJR_SUPPORT_EMAIL = "pete.bunting@aber.ac.uk"
 CJR_WEBSITE = "https://www.remotesensing.info/cjr"
 
+
+def _get_version_obj():
+    try:
+        from distutils.version import LooseVersion
+        return LooseVersion(CJR_VERSION)
+    except ImportError:
+        return (CJR_VERSION_MAJOR, CJR_VERSION_MINOR, CJR_VERSION_PATCH)
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # CJR_VERSION_OBJ is created when first used so importing the package does not import distutils.
+        if name == "CJR_VERSION_OBJ":
+            return _get_version_obj()
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+else:
+    # Module __getattr__ (PEP 562) requires python 3.7 so CJR_VERSION_OBJ is created on import.
+    CJR_VERSION_OBJ = _get_version_obj()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+"""
+cjr_archive - Functions to archive completed job versions to compressed files and remove them from the database.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: Functions to archive job versions where all the tasks have
+#          been completed. The tasks of a version are exported to a gzip
+#          compressed JSON Lines file (see cjrlib.cjr_export), the file
+#          is registered within the CJRArchive table and the archived
+#          tasks are then deleted from the CJRTaskInfo and CJRTaskUpdate
+#          tables in batches. Once archived the database can be compacted (VACUUM
+#          and ANALYZE) so the queries on the current jobs stay fast.
+#
+#          The archived tasks can be read with read_archived_tasks or by
+#          the query functions using the include_archived option. If an
+#          archive is interrupted it is completed by archiving the version
+#          again.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import os
+import os.path
+import re
+import gzip
+import json
+import hashlib
+import datetime
+import sqlalchemy
+from cjrlib import cjr_metrics
+from cjrlib.cjr_db_connection import CJRDBConnection, CJRTaskInfo, CJRTaskUpdate, CJRArchive, CJRPayload, \
+                                     get_task_fields, iso_str_to_datetime, bump_catalog_generation, \
+                                     retry_on_db_lock, get_db_engine, datetime_to_field, get_cjr_db_session, \
+                                     get_cjr_db_url
+from cjrlib.cjr_queries import invalidate_catalog_cache
+from cjrlib.cjr_export import export_tasks
+
+
+def _get_cjrdb_conn():
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    cjrdb_conn.create_db_tables()
+    return cjrdb_conn
+
+
+def get_archive_file_name(job_name, version):
+    """
+    A function which gets the file name used for the archive of a job version. Characters which are not
+    safe within a file name are replaced and a hash of the job name is added so the names are unique.
+
+    :param job_name: the name of the job.
+    :param version: the version of the job.
+
+    :return: string
+    """
+    job_name_hash = hashlib.sha1(job_name.encode("utf-8")).hexdigest()[:8]
+    return "{}_{}_v{}.jsonl.gz".format(re.sub(r"[^A-Za-z0-9._-]", "_", job_name), job_name_hash, version)
+
+
+def _get_version_task_counts(db_ses_obj, job_name=None, version=None):
+    """
+    A function which gets the number of tasks, the number of uncompleted tasks and the last end time for
+    each job version (optionally for a single job or job version).
+
+    :return: dict with (job name, version) keys and (n_tasks, n_uncompleted, last_end) values.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    uncompleted_expr = sqlalchemy.case([(task_tbl.c.TaskCompleted == True, 0)], else_=1)
+    count_select = sqlalchemy.select([task_tbl.c.JobName, task_tbl.c.Version, sqlalchemy.func.count(),
+                                      sqlalchemy.func.sum(uncompleted_expr), sqlalchemy.func.max(task_tbl.c.EndTime)])
+    if job_name is not None:
+        count_select = count_select.where(task_tbl.c.JobName == job_name)
+    if version is not None:
+        count_select = count_select.where(task_tbl.c.Version == version)
+    count_select = count_select.group_by(task_tbl.c.JobName, task_tbl.c.Version)
+    version_counts = dict()
+    for job_name_val, version_val, n_tasks, n_uncompleted, last_end in db_ses_obj.execute(count_select):
+        version_counts[(job_name_val, version_val)] = (n_tasks, int(n_uncompleted), last_end)
+    return version_counts
+
+
+def _iter_archive_file(archive_file):
+    """
+    A generator which reads the tasks within an archive file a line at a time, so the whole archive is never
+    held in memory.
+
+    :return: task dicts (as exported by cjrlib.cjr_export).
+    """
+    with gzip.open(archive_file, "rt") as archive_file_obj:
+        for task_line in archive_file_obj:
+            if task_line.strip() != "":
+                yield json.loads(task_line)
+
+
+def _iter_archived_task_id_batches(archive_file, batch_size):
+    """
+    A generator which reads the task IDs within an archive file in batches.
+
+    :return: lists of task IDs.
+    """
+    task_ids = list()
+    for archived_task in _iter_archive_file(archive_file):
+        task_ids.append(archived_task['task_id'])
+        if len(task_ids) >= batch_size:
+            yield task_ids
+            task_ids = list()
+    if len(task_ids) > 0:
+        yield task_ids
+
+
+@retry_on_db_lock
+def _register_archive(cjrdb_conn, job_name, version, archive_file, n_archived, archive_time):
+    """
+    A function which registers an archive file within the CJRArchive table. Within the same transaction the
+    tasks of the job version are checked against the archive; if a task has been added, left uncompleted or
+    changed since archive_time then the archive is not registered.
+
+    :return: boolean, True if the archive was registered.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    db_ses_obj = cjrdb_conn.get_db_session(write=True)
+    try:
+        n_tasks, n_uncompleted, last_end = _get_version_task_counts(db_ses_obj, job_name, version).\
+                                               get((job_name, version), (0, 0, None))
+        n_modified = db_ses_obj.execute(sqlalchemy.select([sqlalchemy.func.count()]).
+                                        where(sqlalchemy.and_(task_tbl.c.JobName == job_name,
+                                                              task_tbl.c.Version == version,
+                                                              task_tbl.c.LastModified > archive_time))).scalar()
+        if (n_tasks != n_archived) or (n_uncompleted > 0) or (n_modified > 0):
+            db_ses_obj.rollback()
+            return False
+        db_ses_obj.add(CJRArchive(JobName=job_name, Version=version, ArchiveFile=archive_file,
+                                  NTasks=n_archived, ArchiveTime=archive_time))
+        db_ses_obj.commit()
+    finally:
+        db_ses_obj.close()
+    return True
+
+
+@retry_on_db_lock
+def _delete_task_batch(cjrdb_conn, job_name, version, task_ids, archive_time):
+    """
+    A function which deletes a batch of the archived tasks (and their updates) of a job version within a
+    transaction. Only the tasks which have been completed and have not been changed since archive_time (i.e.,
+    the tasks as written to the archive) are deleted.
+
+    :return: the number of tasks deleted.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    updt_tbl = CJRTaskUpdate.__table__
+    db_ses_obj = cjrdb_conn.get_db_session(write=True)
+    try:
+        task_ids = [task_row[0] for task_row in db_ses_obj.execute(
+            sqlalchemy.select([task_tbl.c.TaskID]).
+            where(sqlalchemy.and_(task_tbl.c.JobName == job_name, task_tbl.c.Version == version,
+                                  task_tbl.c.TaskID.in_(task_ids), task_tbl.c.TaskCompleted == True,
+                                  sqlalchemy.or_(task_tbl.c.LastModified.is_(None),
+                                                 task_tbl.c.LastModified <= archive_time)))).fetchall()]
+        if len(task_ids) > 0:
+            db_ses_obj.execute(updt_tbl.delete().where(sqlalchemy.and_(updt_tbl.c.JobName == job_name,
+                                                                       updt_tbl.c.Version == version,
+                                                                       updt_tbl.c.TaskID.in_(task_ids))))
+            db_ses_obj.execute(task_tbl.delete().where(sqlalchemy.and_(task_tbl.c.JobName == job_name,
+                                                                       task_tbl.c.Version == version,
+                                                                       task_tbl.c.TaskID.in_(task_ids))))
+        db_ses_obj.commit()
+    finally:
+        db_ses_obj.close()
+    return len(task_ids)
+
+
+@retry_on_db_lock
+def _count_remaining_tasks(cjrdb_conn, job_name, version):
+    """
+    A function which counts the tasks of a job version remaining within the database once the archived tasks
+    have been deleted. If none remain then the catalog generation is updated for the removed version.
+
+    :return: the number of tasks remaining.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    db_ses_obj = cjrdb_conn.get_db_session(write=True)
+    try:
+        n_remaining = db_ses_obj.execute(sqlalchemy.select([sqlalchemy.func.count()]).
+                                         where(sqlalchemy.and_(task_tbl.c.JobName == job_name,
+                                                               task_tbl.c.Version == version))).scalar()
+        if n_remaining == 0:
+            bump_catalog_generation(db_ses_obj)
+        db_ses_obj.commit()
+    finally:
+        db_ses_obj.close()
+    return n_remaining
+
+
+@cjr_metrics.timed_function("archive_job_version")
+def archive_job_version(job_name, version, archive_dir, batch_size=1000, print_progress=False):
+    """
+    A function which archives a job version where all the tasks have been completed. The tasks are exported to
+    a gzip compressed JSON Lines file within archive_dir, the file is registered within the CJRArchive table and
+    then the archived tasks are deleted from the database in batches (a transaction per batch). Tasks which are
+    not within the archive, or were changed after they were exported, are not deleted. If the version has
+    already been registered (e.g., the previous archive was interrupted) then the remaining archived tasks are
+    deleted. The database is not compacted, see compact_db.
+
+    :param job_name: the name of the job.
+    :param version: the version of the job.
+    :param archive_dir: the directory the archive file is written to.
+    :param batch_size: the number of tasks deleted within each transaction.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: the number of tasks within the archive.
+    """
+    cjrdb_conn = _get_cjrdb_conn()
+    db_ses_obj = cjrdb_conn.get_db_session()
+    try:
+        archive_rcd = db_ses_obj.query(CJRArchive).filter(CJRArchive.JobName == job_name,
+                                                          CJRArchive.Version == version).one_or_none()
+        version_counts = _get_version_task_counts(db_ses_obj, job_name, version)
+    finally:
+        db_ses_obj.close()
+
+    if archive_rcd is None:
+        if (job_name, version) not in version_counts:
+            raise Exception("The job '{}' v{} does not have any tasks - check inputs.".format(job_name, version))
+        n_tasks, n_uncompleted, last_end = version_counts[(job_name, version)]
+        if n_uncompleted > 0:
+            raise Exception("The job '{}' v{} has {} uncompleted tasks so can not be archived.".format(
+                            job_name, version, n_uncompleted))
+
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        archive_file = os.path.abspath(os.path.join(archive_dir, get_archive_file_name(job_name, version)))
+        if print_progress:
+            print("Exporting {} tasks to '{}'.".format(n_tasks, archive_file))
+        # Tasks changed after this time are not within the archive so are not deleted.
+        archive_time = datetime.datetime.now()
+        tmp_archive_file = "{}.{}.tmp".format(archive_file, os.getpid())
+        n_archived = export_tasks(job_name, tmp_archive_file, "JSONL", version, "gzip",
+                                  cjr_db_file=cjrdb_conn.cjr_db_file)
+        os.replace(tmp_archive_file, archive_file)
+        if not _register_archive(cjrdb_conn, job_name, version, archive_file, n_archived, archive_time):
+            os.remove(archive_file)
+            raise Exception("The tasks for the job '{}' v{} changed while it was being archived - "
+                            "check whether tasks are still being recorded.".format(job_name, version))
+    else:
+        archive_file = archive_rcd.ArchiveFile
+        archive_time = archive_rcd.ArchiveTime
+        n_archived = archive_rcd.NTasks
+        if print_progress:
+            print("The job '{}' v{} has already been archived to '{}'.".format(job_name, version, archive_file))
+        if not os.path.exists(archive_file):
+            raise Exception("The archive file '{}' for the job '{}' v{} does not exist.".format(archive_file,
+                                                                                                job_name, version))
+
+    n_deleted = 0
+    for task_ids in _iter_archived_task_id_batches(archive_file, batch_size):
+        n_batch = _delete_task_batch(cjrdb_conn, job_name, version, task_ids, archive_time)
+        n_deleted = n_deleted + n_batch
+        if print_progress and (n_batch > 0):
+            print("Deleted {} tasks from the database.".format(n_deleted))
+    n_remaining = _count_remaining_tasks(cjrdb_conn, job_name, version)
+    if print_progress and (n_remaining > 0):
+        print("Warning: {} tasks of the job '{}' v{} were added or changed after the archive was written so "
+              "were not deleted.".format(n_remaining, job_name, version))
+    invalidate_catalog_cache(cjrdb_conn.cjr_db_file)
+    return n_archived
+
+
+def archive_completed_versions(archive_dir, job_name=None, older_than=None, batch_size=1000, compact=True,
+                               print_progress=False, delete_payloads=False):
+    """
+    A function which archives all the job versions (optionally for a single job) where all the tasks have been
+    completed (see archive_job_version) and then compacts the database.
+
+    :param archive_dir: the directory the archive files are written to.
+    :param job_name: optionally the name of the job, if None then the versions of all the jobs are archived.
+    :param older_than: optionally only archive the versions where the last task finished more than this period
+                       ago, either a datetime.timedelta or a number of days.
+    :param batch_size: the number of tasks deleted within each transaction.
+    :param compact: if True then the database is compacted (see compact_db) once the versions have been archived.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+    :param delete_payloads: if True then the unused payloads are deleted when the database is compacted (see
+                            compact_db). (Default: False)
+
+    :return: list of (job name, version, number of tasks) tuples for the versions which were archived.
+    """
+    end_before = None
+    if older_than is not None:
+        if not isinstance(older_than, datetime.timedelta):
+            older_than = datetime.timedelta(days=older_than)
+        end_before = datetime.datetime.now() - older_than
+
+    cjrdb_conn = _get_cjrdb_conn()
+    db_ses_obj = cjrdb_conn.get_db_session()
+    try:
+        version_counts = _get_version_task_counts(db_ses_obj, job_name)
+    finally:
+        db_ses_obj.close()
+
+    archived_versions = list()
+    for (job_name_val, version_val), (n_tasks, n_uncompleted, last_end) in sorted(version_counts.items()):
+        if n_uncompleted > 0:
+            continue
+        if (end_before is not None) and ((last_end is None) or (last_end >= end_before)):
+            continue
+        n_archived = archive_job_version(job_name_val, version_val, archive_dir, batch_size, print_progress)
+        archived_versions.append((job_name_val, version_val, n_archived))
+
+    if compact and (len(archived_versions) > 0):
+        compact_db(print_progress, delete_payloads)
+    return archived_versions
+
+
+@retry_on_db_lock
+def delete_unused_payloads(print_progress=False):
+    """
+    A function which deletes the payloads within the payload store which are not referenced by any of the
+    tasks (e.g., once the tasks have been archived). A task's payload is inserted within the same transaction
+    as the task so, for SQLite, the single writer means the payloads of tasks being recorded are not deleted.
+    For PostgreSQL the CJRPayload and CJRTaskInfo tables are locked (SHARE mode), waiting for the transactions
+    recording tasks to be committed and blocking new ones until the payloads have been deleted. For MySQL this
+    should not be run while tasks are being recorded, as the payload of a task being started could be deleted.
+
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: the number of payloads deleted.
+    """
+    cjrdb_conn = _get_cjrdb_conn()
+    task_tbl = CJRTaskInfo.__table__
+    payload_tbl = CJRPayload.__table__
+    db_ses_obj = cjrdb_conn.get_db_session(write=True)
+    try:
+        if db_ses_obj.get_bind().dialect.name == "postgresql":
+            db_ses_obj.execute('LOCK TABLE "CJRPayload", "CJRTaskInfo" IN SHARE MODE')
+        params_refs = sqlalchemy.select([task_tbl.c.TaskParamsRef]).where(task_tbl.c.TaskParamsRef.isnot(None))
+        end_info_refs = sqlalchemy.select([task_tbl.c.TaskEndInfoRef]).where(task_tbl.c.TaskEndInfoRef.isnot(None))
+        qury_rslt = db_ses_obj.execute(payload_tbl.delete().
+                                       where(sqlalchemy.and_(payload_tbl.c.PayloadHash.notin_(params_refs),
+                                                             payload_tbl.c.PayloadHash.notin_(end_info_refs))))
+        n_deleted = qury_rslt.rowcount
+        db_ses_obj.commit()
+    finally:
+        db_ses_obj.close()
+    if print_progress:
+        print("Deleted {} unused payloads.".format(n_deleted))
+    return n_deleted
+
+
+def compact_db(print_progress=False, delete_payloads=False):
+    """
+    A function which compacts the database, after tasks have been deleted, and updates the statistics used by
+    the query planner: VACUUM and ANALYZE (SQLite and PostgreSQL) or OPTIMIZE TABLE (MySQL). For SQLite the
+    database is locked while it is compacted.
+
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+    :param delete_payloads: if True then the unused payloads are deleted from the payload store first (see
+                            delete_unused_payloads for when this is safe). (Default: False)
+
+    """
+    if delete_payloads:
+        delete_unused_payloads(print_progress)
+    cjrdb_conn = _get_cjrdb_conn()
+    db_engine = cjrdb_conn.db_engine
+    dialect_name = db_engine.dialect.name
+    if print_progress:
+        print("Compacting the database.")
+    # VACUUM can not be run within a transaction.
+    with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as db_conn:
+        if dialect_name == "sqlite":
+            db_conn.execute("VACUUM")
+            db_conn.execute("ANALYZE")
+        elif dialect_name == "postgresql":
+            db_conn.execute('VACUUM ANALYZE "CJRTaskInfo"')
+            db_conn.execute('VACUUM ANALYZE "CJRTaskUpdate"')
+            db_conn.execute('VACUUM ANALYZE "CJRPayload"')
+        elif dialect_name == "mysql":
+            db_conn.execute("OPTIMIZE TABLE CJRTaskInfo, CJRTaskUpdate, CJRPayload")
+
+
+def get_archived_versions(job_name=None, cjr_db_file=None):
+    """
+    A function which gets the job versions which have been archived.
+
+    :param job_name: optionally the name of the job, if None then the archived versions of all the jobs are returned.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+
+    :return: list of dicts with the job_name, version, archive_file, n_tasks and archive_time.
+    """
+    db_engine = get_db_engine(get_cjr_db_url(cjr_db_file))
+    if not db_engine.dialect.has_table(db_engine, CJRArchive.__tablename__):
+        return list()
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        qury = db_ses_obj.query(CJRArchive)
+        if job_name is not None:
+            qury = qury.filter(CJRArchive.JobName == job_name)
+        archived_versions = [{'job_name': archive_rcd.JobName, 'version': archive_rcd.Version,
+                              'archive_file': archive_rcd.ArchiveFile, 'n_tasks': archive_rcd.NTasks,
+                              'archive_time': archive_rcd.ArchiveTime}
+                             for archive_rcd in qury.order_by(CJRArchive.JobName, CJRArchive.Version)]
+    finally:
+        db_ses_obj.close()
+    return archived_versions
+
+
+def _archived_task_to_dict(archived_task, datetimeobjs, fields):
+    """
+    A function which converts an archived task to the dictionary returned by the query functions (see
+    cjrlib.cjr_db_connection.task_to_dict). The last_modified and last_heartbeat fields are not archived
+    so are None.
+    """
+    task_dict = dict()
+    for field in fields:
+        if field in ['start', 'end']:
+            date_time = None
+            if archived_task[field] is not None:
+                date_time = iso_str_to_datetime(archived_task[field])
+            task_dict[field] = datetime_to_field(date_time, datetimeobjs)
+            if (date_time is None) and (not datetimeobjs):
+                task_dict[field] = dict()
+        elif field in ['last_modified', 'last_heartbeat']:
+            task_dict[field] = None
+        else:
+            task_dict[field] = archived_task[field]
+    return task_dict
+
+
+@cjr_metrics.timed_function("read_archived_tasks")
+def read_archived_tasks(job_name, version, task_id=None, datetimeobjs=False, cjr_db_file=None, fields=None,
+                        include_payload=True):
+    """
+    A function which reads the tasks of an archived job version from its archive file.
+
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task.
+    :param task_id: optionally the task ID, if None then all the tasks of the version are returned.
+    :param datetimeobjs: If true the start and end fields are returned as python datetime objects rather than
+                         nested dictionaries.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS).
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned.
+
+    :return: list of dictionaries of the tasks or None if the version has not been archived.
+    """
+    fields = get_task_fields(fields, include_payload)
+    archived_versions = get_archived_versions(job_name, cjr_db_file)
+    archive_file = None
+    for archived_version in archived_versions:
+        if archived_version['version'] == version:
+            archive_file = archived_version['archive_file']
+    if archive_file is None:
+        return None
+    if not os.path.exists(archive_file):
+        raise Exception("The archive file '{}' for the job '{}' v{} does not exist.".format(archive_file, job_name,
+                                                                                            version))
+
+    # The archive is read a line at a time and, for a single task, only until the task has been found.
+    task_lst = list()
+    for archived_task in _iter_archive_file(archive_file):
+        if task_id is None:
+            task_lst.append(_archived_task_to_dict(archived_task, datetimeobjs, fields))
+        elif archived_task['task_id'] == task_id:
+            task_lst.append(_archived_task_to_dict(archived_task, datetimeobjs, fields))
+            break
+    return task_lst
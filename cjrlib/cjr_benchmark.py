@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+"""
+cjr_benchmark - A benchmark of recording and querying tasks using synthetic workloads.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: A benchmark of recording and querying tasks. A synthetic
+#          database is created with a configurable number of jobs,
+#          versions, tasks and updates per task, recorded by a number of
+#          concurrent processes and threads. The throughput and latency
+#          (p50/p99) of recording the start, updates and finish of the
+#          tasks and of the get_all_tasks, get_uncompleted_tasks and
+#          get_task queries are reported as JSON, so runs can be compared
+#          between releases. Run with the cjr_benchmark command.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy
+
+import cjrlib
+from cjrlib.cjr_db_connection import CJRDBConnection, dispose_db_engines, get_lock_stats
+from cjrlib.cjr_job_status import JobStatus
+
+BENCHMARK_DBS = ["sqlite-file", "sqlite-memory"]
+
+# URL of a named in-memory SQLite database which is shared by the threads of a process.
+SQLITE_MEMORY_URL = "sqlite:///file:cjr_benchmark?mode=memory&cache=shared&uri=true"
+
+
+def _percentile(sorted_values, percentile):
+    """
+    A function which gets a percentile (nearest rank) from a sorted list of values.
+    """
+    if len(sorted_values) == 0:
+        return None
+    rank = max(0, int(round(percentile / 100.0 * len(sorted_values) + 0.5)) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def _latency_stats(latencies, wall_time):
+    """
+    A function which summarises the latencies (seconds) of a set of operations.
+
+    :return: dict with the number of operations (n), throughput (operations per second over wall_time) and the
+             mean, p50, p99 and max latency in milliseconds.
+    """
+    latencies = sorted(latencies)
+    stats = {"n": len(latencies), "throughput": None, "mean_ms": None, "p50_ms": None, "p99_ms": None,
+             "max_ms": None}
+    if len(latencies) > 0:
+        if wall_time > 0:
+            stats["throughput"] = len(latencies) / wall_time
+        stats["mean_ms"] = sum(latencies) / len(latencies) * 1000.0
+        stats["p50_ms"] = _percentile(latencies, 50) * 1000.0
+        stats["p99_ms"] = _percentile(latencies, 99) * 1000.0
+        stats["max_ms"] = latencies[-1] * 1000.0
+    return stats
+
+
+def _use_db(db_url):
+    """
+    A function which points the recorder (CJRDBConnection) at a database.
+    """
+    os.environ['CJR_DB_FILE'] = db_url
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    if cjrdb_conn.cjr_db_file != db_url:
+        cjrdb_conn.refresh_db()
+    # The benchmark measures writing to the database rather than a journal.
+    cjrdb_conn.set_journal(None)
+    return cjrdb_conn
+
+
+def get_workload_tasks(n_jobs, n_versions, n_tasks):
+    """
+    A function which gets the (job_name, version, task_id) of each task within the synthetic workload.
+
+    :param n_jobs: the number of jobs.
+    :param n_versions: the number of versions of each job.
+    :param n_tasks: the number of tasks for each version of a job.
+
+    :return: list of (job_name, version, task_id) tuples.
+    """
+    return [("cjr_bench_job{}".format(i_job), i_version, "task{:08d}".format(i_task))
+            for i_job in range(n_jobs) for i_version in range(n_versions) for i_task in range(n_tasks)]
+
+
+def _record_tasks(workload_tasks, n_updates, incomplete_frac, payload_size, latencies):
+    from cjrlib.cjr_recorder import record_task_status
+    payload = "x" * payload_size
+    for job_name, version, task_id in workload_tasks:
+        start_time = time.perf_counter()
+        record_task_status(JobStatus.START, job_name, task_id, version, {"task": task_id, "payload": payload})
+        latencies["start"].append(time.perf_counter() - start_time)
+        for i_update in range(n_updates):
+            start_time = time.perf_counter()
+            record_task_status(JobStatus.UPDATE, job_name, task_id, version, {"progress": i_update,
+                                                                              "payload": payload})
+            latencies["update"].append(time.perf_counter() - start_time)
+        # Use the task ID so the same tasks are uncompleted, whatever the number of processes and threads.
+        if random.Random(task_id).random() >= incomplete_frac:
+            start_time = time.perf_counter()
+            record_task_status(JobStatus.FINISH, job_name, task_id, version, {"output": payload})
+            latencies["finish"].append(time.perf_counter() - start_time)
+
+
+def _record_worker(db_url, workload_tasks, n_threads, n_updates, incomplete_frac, payload_size):
+    """
+    A function, run within a process, which records a list of tasks using a number of threads.
+
+    :return: dict of the latencies for each operation and the database lock statistics.
+    """
+    _use_db(db_url)
+    get_lock_stats(reset=True)
+    thread_latencies = list()
+    threads = list()
+    for i_thread in range(n_threads):
+        latencies = {"start": list(), "update": list(), "finish": list()}
+        thread_latencies.append(latencies)
+        threads.append(threading.Thread(target=_record_tasks,
+                                        args=(workload_tasks[i_thread::n_threads], n_updates, incomplete_frac,
+                                              payload_size, latencies)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = {"start": list(), "update": list(), "finish": list()}
+    for thread_latency in thread_latencies:
+        for op_name in latencies:
+            latencies[op_name].extend(thread_latency[op_name])
+    return {"latencies": latencies, "lock_stats": get_lock_stats()}
+
+
+def _run_queries(db_url, job_versions, workload_tasks, n_query_samples):
+    from cjrlib.cjr_queries import get_all_tasks, get_uncompleted_tasks, get_task
+    latencies = {"get_all_tasks": list(), "get_uncompleted_tasks": list(), "get_task": list()}
+    wall_times = dict()
+
+    start_wall_time = time.perf_counter()
+    for job_name, version in job_versions:
+        start_time = time.perf_counter()
+        get_all_tasks(job_name, version, cjr_db_file=db_url)
+        latencies["get_all_tasks"].append(time.perf_counter() - start_time)
+    wall_times["get_all_tasks"] = time.perf_counter() - start_wall_time
+
+    start_wall_time = time.perf_counter()
+    for job_name, version in job_versions:
+        start_time = time.perf_counter()
+        get_uncompleted_tasks(job_name, version, cjr_db_file=db_url)
+        latencies["get_uncompleted_tasks"].append(time.perf_counter() - start_time)
+    wall_times["get_uncompleted_tasks"] = time.perf_counter() - start_wall_time
+
+    sample_rand = random.Random(42)
+    start_wall_time = time.perf_counter()
+    for i_sample in range(n_query_samples):
+        job_name, version, task_id = sample_rand.choice(workload_tasks)
+        start_time = time.perf_counter()
+        get_task(job_name, task_id, version, cjr_db_file=db_url)
+        latencies["get_task"].append(time.perf_counter() - start_time)
+    wall_times["get_task"] = time.perf_counter() - start_wall_time
+
+    return {op_name: _latency_stats(latencies[op_name], wall_times[op_name]) for op_name in latencies}
+
+
+def run_benchmark(db="sqlite-file", n_jobs=2, n_versions=1, n_tasks=500, n_updates=2, n_processes=2, n_threads=2,
+                  n_query_samples=200, incomplete_frac=0.1, payload_size=64, db_profile="concurrent",
+                  db_dir=None, print_progress=False):
+    """
+    A function which runs the benchmark against a database: the synthetic tasks are recorded by n_processes
+    processes each with n_threads threads and then the tasks are queried.
+
+    :param db: the database to use: 'sqlite-file' (a new SQLite file, removed afterwards), 'sqlite-memory' (an
+               in-memory SQLite database, which can only be used by one process so n_processes is set to 1)
+               or an sqlalchemy database URL (which should be an empty database).
+    :param n_jobs: the number of jobs.
+    :param n_versions: the number of versions of each job.
+    :param n_tasks: the number of tasks for each version of a job.
+    :param n_updates: the number of updates recorded for each task.
+    :param n_processes: the number of processes recording the tasks.
+    :param n_threads: the number of threads within each process recording the tasks.
+    :param n_query_samples: the number of get_task queries.
+    :param incomplete_frac: the fraction of the tasks which are not finished.
+    :param payload_size: the number of characters within the information recorded for each event.
+    :param db_profile: the database profile (see CJRDBConnection.set_db_profile): 'default' or 'concurrent'.
+    :param db_dir: the directory for the 'sqlite-file' database, if None the system temporary directory is used.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: a dict of the parameters and results, which can be written as JSON.
+    """
+    db_file = None
+    memory_keeper = None
+    if db == "sqlite-file":
+        db_file_handle, db_file = tempfile.mkstemp(prefix="cjr_benchmark_", suffix=".db", dir=db_dir)
+        os.close(db_file_handle)
+        os.remove(db_file)
+        db_url = "sqlite:///{}".format(db_file)
+    elif db == "sqlite-memory":
+        db_url = SQLITE_MEMORY_URL
+        n_processes = 1
+        # The in-memory database only exists while a connection to it is open.
+        memory_keeper = sqlalchemy.create_engine(db_url, poolclass=sqlalchemy.pool.NullPool).connect()
+    else:
+        db_url = db
+
+    os.environ['CJR_DB_PROFILE'] = db_profile
+    cjrdb_conn = _use_db(db_url)
+    cjrdb_conn.set_db_profile(db_profile)
+    from cjrlib.cjr_db_admin import init_db
+    init_db(migrate_updates=False)
+
+    workload_tasks = get_workload_tasks(n_jobs, n_versions, n_tasks)
+    job_versions = sorted(set([(job_name, version) for job_name, version, task_id in workload_tasks]))
+    results = {"db": db, "db_profile": db_profile, "n_jobs": n_jobs, "n_versions": n_versions, "n_tasks": n_tasks,
+               "n_updates": n_updates, "n_processes": n_processes, "n_threads": n_threads,
+               "n_query_samples": n_query_samples, "incomplete_frac": incomplete_frac,
+               "payload_size": payload_size}
+    try:
+        if print_progress:
+            print("Recording {} tasks on {} ({} processes x {} threads)...".format(len(workload_tasks), db,
+                                                                                  n_processes, n_threads),
+                  file=sys.stderr)
+        start_wall_time = time.perf_counter()
+        if n_processes == 1:
+            worker_results = [_record_worker(db_url, workload_tasks, n_threads, n_updates, incomplete_frac,
+                                             payload_size)]
+        else:
+            # The engines are created again within each process (see cjrlib.cjr_db_connection).
+            with multiprocessing.Pool(n_processes) as process_pool:
+                worker_results = process_pool.starmap(_record_worker,
+                                                      [(db_url, workload_tasks[i_process::n_processes], n_threads,
+                                                        n_updates, incomplete_frac, payload_size)
+                                                       for i_process in range(n_processes)])
+        record_wall_time = time.perf_counter() - start_wall_time
+
+        latencies = {"start": list(), "update": list(), "finish": list()}
+        lock_stats = dict()
+        for worker_result in worker_results:
+            for op_name in latencies:
+                latencies[op_name].extend(worker_result["latencies"][op_name])
+            for stat_key, stat_value in worker_result["lock_stats"].items():
+                lock_stats[stat_key] = lock_stats.get(stat_key, 0) + stat_value
+        results["record_wall_time"] = record_wall_time
+        results["record"] = {op_name: _latency_stats(latencies[op_name], record_wall_time) for op_name in latencies}
+        results["record"]["all"] = _latency_stats(latencies["start"] + latencies["update"] + latencies["finish"],
+                                                  record_wall_time)
+        results["lock_stats"] = lock_stats
+
+        if print_progress:
+            print("Querying tasks on {}...".format(db), file=sys.stderr)
+        results["query"] = _run_queries(db_url, job_versions, workload_tasks, n_query_samples)
+    finally:
+        dispose_db_engines(db_url)
+        if memory_keeper is not None:
+            memory_keeper.close()
+        if db_file is not None:
+            for db_file_path in [db_file, db_file + "-wal", db_file + "-shm", db_file + "-journal"]:
+                if os.path.exists(db_file_path):
+                    os.remove(db_file_path)
+    return results
+
+
+def main(argv=None):
+    """
+    The command line interface for the benchmark (the cjr_benchmark command).
+
+    :param argv: the command line arguments, if None then sys.argv is used.
+
+    """
+    parser = argparse.ArgumentParser(description="Benchmark recording and querying tasks with a synthetic workload.")
+    parser.add_argument("--db", type=str, action='append', default=None,
+                        help="Specify a database to benchmark: sqlite-file, sqlite-memory or an sqlalchemy URL of "
+                             "an empty database. Can be given more than once (Default: sqlite-file and "
+                             "sqlite-memory).")
+    parser.add_argument("--jobs", type=int, default=2, help="Specify the number of jobs.")
+    parser.add_argument("--versions", type=int, default=1, help="Specify the number of versions of each job.")
+    parser.add_argument("--tasks", type=int, default=500, help="Specify the number of tasks for each job version.")
+    parser.add_argument("--updates", type=int, default=2, help="Specify the number of updates for each task.")
+    parser.add_argument("--processes", type=int, default=2, help="Specify the number of recording processes.")
+    parser.add_argument("--threads", type=int, default=2, help="Specify the number of threads in each process.")
+    parser.add_argument("--querysamples", type=int, default=200, help="Specify the number of get_task queries.")
+    parser.add_argument("--incompletefrac", type=float, default=0.1,
+                        help="Specify the fraction of the tasks which are not finished.")
+    parser.add_argument("--payloadsize", type=int, default=64,
+                        help="Specify the number of characters within the information recorded for each event.")
+    parser.add_argument("--profile", type=str, default="concurrent", choices=["default", "concurrent"],
+                        help="Specify the database profile.")
+    parser.add_argument("--dbdir", type=str, default=None,
+                        help="Specify the directory for the sqlite-file database (Default: temporary directory).")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Specify a file for the JSON results (Default: printed to the console).")
+    parser.add_argument("--printprogress", action='store_true', default=False,
+                        help="Specify that progress statements should be printed to the console.")
+    args = parser.parse_args(argv)
+
+    dbs = args.db
+    if dbs is None:
+        dbs = BENCHMARK_DBS
+
+    benchmark_results = {"cjr_version": cjrlib.CJR_VERSION, "sqlalchemy_version": sqlalchemy.__version__,
+                         "python_version": platform.python_version(), "platform": platform.platform(),
+                         "time": datetime.datetime.now().isoformat(), "runs": list()}
+    for db in dbs:
+        benchmark_results["runs"].append(run_benchmark(db, args.jobs, args.versions, args.tasks, args.updates,
+                                                       args.processes, args.threads, args.querysamples,
+                                                       args.incompletefrac, args.payloadsize, args.profile,
+                                                       args.dbdir, args.printprogress))
+
+    if args.output is None:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        with open(args.output, "w") as out_file_obj:
+            json.dump(benchmark_results, out_file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+cjr_client - A lightweight client to send task events to the recorder daemon.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: A lightweight client to send task events to the recorder
+#          daemon (see cjrlib.cjr_daemon) over a unix domain socket.
+#          This module does not import sqlalchemy so it is quick to
+#          import from command line tools.
+#
+#          Each request and response is a JSON object on a single line.
+#          Request: {"status": "START", "job_name": ..., "task_id": ...,
+#                    "version": ..., "task_info": ..., "time": <ISO time>}
+#          Response: {"success": true/false, "message": null or string}
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import os
+import json
+import socket
+import datetime
+
+STATUS_NAMES = ["START", "FINISH", "UPDATE"]
+
+
+def get_daemon_socket_path():
+    """
+    A function which gets the path of the recorder daemon socket from the CJR_DAEMON_SOCKET environmental variable.
+
+    :return: string with the path or None if not defined.
+    """
+    return os.environ.get('CJR_DAEMON_SOCKET', None)
+
+
+def connect_daemon(socket_path, timeout=60.0):
+    """
+    A function which connects to the recorder daemon. Nothing has been sent to the daemon if this fails, so
+    the event can be written directly to the database instead.
+
+    :param socket_path: the path to the unix domain socket of the daemon.
+    :param timeout: the time (seconds) to wait for the daemon to connect and to respond.
+
+    :return: a connected socket object. If the daemon could not be connected to then an OSError (e.g.,
+             ConnectionRefusedError or FileNotFoundError) is raised.
+    """
+    daemon_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    daemon_sock.settimeout(timeout)
+    try:
+        daemon_sock.connect(socket_path)
+    except BaseException:
+        daemon_sock.close()
+        raise
+    return daemon_sock
+
+
+def send_daemon_task_event(daemon_sock, status, job_name, task_id, version, task_info):
+    """
+    A function which sends a task event to the recorder daemon, using a socket from connect_daemon, and waits
+    for it to be recorded. The socket is closed once the response has been received.
+
+    :param daemon_sock: a connected socket (see connect_daemon).
+    :param status: string with the status of the event: START, FINISH or UPDATE.
+    :param job_name: The name of the job.
+    :param task_id: The unique name for the task within the job.
+    :param version: The version of the job and task.
+    :param task_info: A dictionary of information which is to be stored for the task.
+
+    :return: a (success, message) tuple, where message is None or a string describing why the event was not
+             recorded. If the event could not be sent or no response was received (e.g., a timeout) then an
+             Exception is raised; the event may have been recorded by the daemon so it should not be written
+             to the database again.
+    """
+    try:
+        if status not in STATUS_NAMES:
+            raise Exception("Do not recognise the status inputted.")
+        event = {"status": status, "job_name": job_name, "task_id": task_id, "version": version,
+                 "task_info": task_info, "time": datetime.datetime.now().isoformat()}
+        try:
+            daemon_sock.sendall((json.dumps(event) + "\n").encode("utf-8"))
+            response_data = b""
+            while not response_data.endswith(b"\n"):
+                recv_data = daemon_sock.recv(4096)
+                if len(recv_data) == 0:
+                    raise ConnectionError("the connection was closed without a response")
+                response_data = response_data + recv_data
+        except OSError as error:
+            raise Exception("No response was received from the recorder daemon ({}) - the event for the task "
+                            "'{} - {} v{}' may have been recorded.".format(error, job_name, task_id, version))
+    finally:
+        daemon_sock.close()
+
+    response = json.loads(response_data.decode("utf-8"))
+    return response["success"], response["message"]
+
+
+def send_task_event(socket_path, status, job_name, task_id, version, task_info, timeout=60.0):
+    """
+    A function which sends a task event to the recorder daemon and waits for it to be recorded (see
+    connect_daemon and send_daemon_task_event).
+
+    :param socket_path: the path to the unix domain socket of the daemon.
+    :param status: string with the status of the event: START, FINISH or UPDATE.
+    :param job_name: The name of the job.
+    :param task_id: The unique name for the task within the job.
+    :param version: The version of the job and task.
+    :param task_info: A dictionary of information which is to be stored for the task.
+    :param timeout: the time (seconds) to wait for the daemon to respond.
+
+    :return: a (success, message) tuple, where message is None or a string describing why the event was not
+             recorded. If the daemon could not be connected to then an OSError (e.g., ConnectionRefusedError or
+             FileNotFoundError) is raised. Once connected, other errors are raised as an Exception (not an
+             OSError) as the event may have been recorded.
+    """
+    daemon_sock = connect_daemon(socket_path, timeout)
+    return send_daemon_task_event(daemon_sock, status, job_name, task_id, version, task_info)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+cjr_daemon - A long running recorder process which receives task events over a unix domain socket.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: A long running recorder process which holds the database
+#          connection and receives task events from clients (see
+#          cjrlib.cjr_client) over a unix domain socket. Events received
+#          from concurrent clients are written together in batches.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import os
+import json
+import queue
+import socketserver
+import threading
+import logging
+
+from cjrlib.cjr_db_connection import CJRDBConnection, iso_str_to_datetime
+from cjrlib.cjr_job_status import JobStatus
+from cjrlib.cjr_recorder import record_task_statuses
+
+logger = logging.getLogger(__name__)
+
+
+class _CJRPendingEvent:
+    """
+    A task event waiting to be written to the database, with the result returned to the client.
+    """
+
+    def __init__(self, task_event):
+        self.task_event = task_event
+        self.result = (False, "The event was not recorded.")
+        self.done = threading.Event()
+
+
+class _CJRDaemonRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a client connection, reading one event per line and responding once the event has been recorded.
+    """
+
+    def handle(self):
+        for event_line in self.rfile:
+            if event_line.strip() == b"":
+                continue
+            try:
+                event = json.loads(event_line.decode("utf-8"))
+                pending_event = _CJRPendingEvent((JobStatus[event["status"]], event["job_name"], event["task_id"],
+                                                  event["version"], event["task_info"],
+                                                  iso_str_to_datetime(event["time"])))
+            except Exception as error:
+                success, message = False, "Could not read the event: {}".format(error)
+            else:
+                self.server.event_queue.put(pending_event)
+                pending_event.done.wait()
+                success, message = pending_event.result
+            self.wfile.write((json.dumps({"success": success, "message": message}) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class CJRRecorderDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A recorder daemon, listening on a unix domain socket. Events are written to the database by a single
+    writer thread, which writes the events waiting in the queue together in a single transaction.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, max_batch=500, max_wait=0.05, print_progress=False):
+        """
+        :param socket_path: the path for the unix domain socket.
+        :param max_batch: the maximum number of events written within a transaction.
+        :param max_wait: the maximum time (seconds) the writer waits for further events before writing a batch.
+        :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+        """
+        if os.path.exists(socket_path):
+            # Remove the socket left behind by a previous daemon.
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _CJRDaemonRequestHandler)
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.print_progress = print_progress
+        self.event_queue = queue.Queue()
+
+        cjrdb_conn = CJRDBConnection()
+        if cjrdb_conn is None:
+            raise Exception("Could not create the connection object...")
+        cjrdb_conn.create_db_tables()
+
+        self._stop_event = threading.Event()
+        self._writer_thread = threading.Thread(target=self._write_events, name="CJRDaemonWriter")
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    def _write_events(self):
+        while not (self._stop_event.is_set() and self.event_queue.empty()):
+            try:
+                pending_events = [self.event_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Gather the events which arrive while waiting, up to the maximum batch size.
+            while len(pending_events) < self.max_batch:
+                try:
+                    pending_events.append(self.event_queue.get(timeout=self.max_wait))
+                except queue.Empty:
+                    break
+
+            if self.print_progress:
+                print("Recording {} task events.".format(len(pending_events)))
+            try:
+                results = record_task_statuses([pending_event.task_event for pending_event in pending_events],
+                                               chunk_size=len(pending_events))
+            except Exception as error:
+                logger.warning("Could not record the task events: {}".format(error))
+                results = [(False, "Could not record the event: {}".format(error))] * len(pending_events)
+            for pending_event, result in zip(pending_events, results):
+                pending_event.result = result
+                pending_event.done.set()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self._stop_event.set()
+        self._writer_thread.join()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def run_recorder_daemon(socket_path, max_batch=500, max_wait=0.05, print_progress=False):
+    """
+    A function which runs the recorder daemon until it is interrupted (e.g., Ctrl-C or SIGTERM).
+
+    :param socket_path: the path for the unix domain socket.
+    :param max_batch: the maximum number of events written within a transaction.
+    :param max_wait: the maximum time (seconds) the writer waits for further events before writing a batch.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    import signal
+    daemon_server = CJRRecorderDaemon(socket_path, max_batch, max_wait, print_progress)
+
+    def _on_sigterm(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
+    try:
+        daemon_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon_server.server_close()
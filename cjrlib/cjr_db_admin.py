@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+cjr_db_admin - Functions to administer and maintain the job progress database.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2019 Pete Bunting
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: functions to administer and maintain the job progress database.
+#
+# Author: Pete Bunting
+# Email: pfb@aber.ac.uk
+# Date: 08/02/2019
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created.
+
+import sqlalchemy
+from cjrlib.cjr_db_connection import CJRDBConnection, CJRJobName, CJRTaskInfo, CJRTaskUpdate, \
+                                     iso_str_to_datetime, create_missing_indexes, CJR_SCHEMA_VERSION
+
+
+def init_db(migrate_updates=True, print_progress=False):
+    """
+    A function which creates the database tables or upgrades an existing database to the current schema version.
+    This should be run once when a database is created or the library is upgraded, so processes recording tasks
+    do not need to make changes to the schema (see the CJR_DB_NO_DDL environmental variable).
+
+    :param migrate_updates: if True then task updates stored in the legacy TaskUpdates column are moved to the
+                            CJRTaskUpdate table (see migrate_task_updates).
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: the schema version of the database before it was initialised (None if the tables did not exist).
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    cjrdb_conn.set_print_progress(print_progress)
+    schema_version = cjrdb_conn.get_schema_version()
+    if schema_version != CJR_SCHEMA_VERSION:
+        cjrdb_conn.init_db_schema()
+    elif print_progress:
+        print("The database schema is already version {}.".format(CJR_SCHEMA_VERSION))
+    if migrate_updates:
+        migrate_task_updates(print_progress=print_progress)
+    return schema_version
+
+
+def migrate_task_updates(batch_size=1000, print_progress=False):
+    """
+    A function which moves the updates stored within the legacy TaskUpdates column of the CJRTaskInfo table
+    into the CJRTaskUpdate table, one row per update. Once a task has been migrated the TaskUpdates column is
+    set to None. Tasks are migrated in batches, with a commit per batch, so the migration can be safely
+    re-run if interrupted.
+
+    :param batch_size: the number of tasks to be migrated in each transaction.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: the number of tasks which were migrated.
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    cjrdb_conn.create_db_tables()
+
+    n_tasks = 0
+    while True:
+        db_ses_obj = cjrdb_conn.get_db_session()
+        task_rcds = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.TaskUpdates.isnot(None)).\
+                                                  limit(batch_size).all()
+        if len(task_rcds) == 0:
+            db_ses_obj.close()
+            break
+
+        for task_rcd in task_rcds:
+            for update_time_str in task_rcd.TaskUpdates:
+                db_ses_obj.add(CJRTaskUpdate(TaskID=task_rcd.TaskID, JobName=task_rcd.JobName,
+                                             Version=task_rcd.Version,
+                                             UpdateTime=iso_str_to_datetime(update_time_str),
+                                             UpdateInfo=task_rcd.TaskUpdates[update_time_str]))
+            # Use an SQL NULL rather than a JSON null so the task is not selected again.
+            task_rcd.TaskUpdates = sqlalchemy.null()
+        db_ses_obj.commit()
+        db_ses_obj.close()
+
+        n_tasks = n_tasks + len(task_rcds)
+        if print_progress:
+            print("Migrated the updates for {} tasks.".format(n_tasks))
+
+    return n_tasks
+
+
+def create_indexes(print_progress=False):
+    """
+    A function which creates any of the indexes defined for the tables which are not present within the database.
+
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: list of the names of the indexes which were created.
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    created_indexes = create_missing_indexes(cjrdb_conn.db_engine, print_progress)
+    if cjrdb_conn.db_engine.dialect.name in ["sqlite", "postgresql", "mysql"]:
+        # Update the statistics used by the query planner.
+        with cjrdb_conn.db_engine.begin() as db_conn:
+            db_conn.execute("ANALYZE")
+    return created_indexes
+
+
+def explain_queries(job_name="JobName", version=0, task_id="TaskID"):
+    """
+    A function which gets the query plan from the database for each of the queries in cjrlib.cjr_queries,
+    which can be used to check the queries are using the indexes.
+
+    :param job_name: the job name used within the queries.
+    :param version: the version used within the queries.
+    :param task_id: the task ID used within the queries.
+
+    :return: dictionary with the name of the query as the key and a tuple with the SQL and list of strings
+             with the query plan as the value.
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    db_ses_obj = cjrdb_conn.get_db_session()
+    db_dialect = cjrdb_conn.db_engine.dialect
+    if db_dialect.name == "sqlite":
+        explain_prefix = "EXPLAIN QUERY PLAN "
+    else:
+        explain_prefix = "EXPLAIN "
+
+    job_version_filter = sqlalchemy.and_(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version)
+    queries = dict()
+    queries['query_job_names'] = db_ses_obj.query(CJRJobName)
+    queries['get_job_versions'] = db_ses_obj.query(CJRTaskInfo.Version).\
+                                             filter(CJRTaskInfo.JobName == job_name).distinct()
+    queries['get_all_tasks'] = db_ses_obj.query(CJRTaskInfo).filter(job_version_filter)
+    queries['get_uncompleted_tasks'] = db_ses_obj.query(CJRTaskInfo).\
+                                                  filter(job_version_filter, CJRTaskInfo.TaskCompleted == False)
+    queries['get_task'] = db_ses_obj.query(CJRTaskInfo).filter(job_version_filter, CJRTaskInfo.TaskID == task_id)
+    queries['iter_tasks'] = db_ses_obj.query(CJRTaskInfo).filter(job_version_filter, CJRTaskInfo.TaskID > task_id).\
+                                       order_by(CJRTaskInfo.TaskID).limit(1000)
+    queries['get_job_summary'] = db_ses_obj.query(CJRTaskInfo.TaskCompleted, sqlalchemy.func.count()).\
+                                            filter(job_version_filter).group_by(CJRTaskInfo.TaskCompleted)
+    queries['get_task_updates'] = db_ses_obj.query(CJRTaskUpdate).\
+                                             filter(CJRTaskUpdate.JobName == job_name, CJRTaskUpdate.Version == version)
+
+    query_plans = dict()
+    for query_name in queries:
+        query_sql = str(queries[query_name].statement.compile(dialect=db_dialect,
+                                                              compile_kwargs={"literal_binds": True}))
+        qury_rslt = db_ses_obj.execute(explain_prefix + query_sql).fetchall()
+        query_plans[query_name] = (query_sql, [" ".join([str(val) for val in row]) for row in qury_rslt])
+    db_ses_obj.close()
+    return query_plans
@@ -32,10 +32,21 @@ cjr_db_connection - DB Connection class. Singleton class to reuse database conne
 
 import sqlalchemy
 import sqlalchemy.orm
+import sqlalchemy.exc
+import sqlalchemy.event
 from sqlalchemy.ext.declarative import declarative_base
 import os
 import os.path
+import json
+import zlib
+import hashlib
 import datetime
+import threading
+import collections
+import functools
+import random
+import time
+from cjrlib import cjr_metrics
 
 Base = declarative_base()
 
@@ -56,84 +67,1139 @@ class CJRTaskInfo(Base):
     TaskUpdates = sqlalchemy.Column(sqlalchemy.JSON)
     TaskEndInfo = sqlalchemy.Column(sqlalchemy.JSON)
     TaskCompleted = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+    # The time the task was last written (started, updated or finished), used to find the changed tasks.
+    LastModified = sqlalchemy.Column(sqlalchemy.DateTime)
+    # The time of the last event (start or update) for the task, used to find tasks which have stalled.
+    LastHeartbeat = sqlalchemy.Column(sqlalchemy.DateTime)
+    # The hash of the params and end info within the CJRPayload table, if stored within the payload store.
+    TaskParamsRef = sqlalchemy.Column(sqlalchemy.String)
+    TaskEndInfoRef = sqlalchemy.Column(sqlalchemy.String)
+    # The primary key leads with TaskID so add indexes for the queries on a job and version. The heartbeat index
+    # is also used for the queries on the completed or uncompleted tasks of a job and version.
+    __table_args__ = (sqlalchemy.Index("CJRTaskInfo_JobVersionTask_Idx", "JobName", "Version", "TaskID"),
+                      sqlalchemy.Index("CJRTaskInfo_LastModified_Idx", "LastModified"),
+                      sqlalchemy.Index("CJRTaskInfo_Heartbeat_Idx", "JobName", "Version", "TaskCompleted",
+                                       "LastHeartbeat"))
 
 
-def task_to_dict(task_rcd, datetimeobjs=False):
+class CJRTaskUpdate(Base):
+    __tablename__ = "CJRTaskUpdate"
+    UpdateID = sqlalchemy.Column(sqlalchemy.INTEGER, primary_key=True, autoincrement=True)
+    TaskID = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    JobName = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    Version = sqlalchemy.Column(sqlalchemy.INTEGER, nullable=False)
+    UpdateTime = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False)
+    UpdateInfo = sqlalchemy.Column(sqlalchemy.JSON)
+    __table_args__ = (sqlalchemy.Index("CJRTaskUpdate_JobVersionTask_Idx", "JobName", "Version", "TaskID"),)
+
+
+# The payload store: the compressed task params and end info, keyed by the hash of the JSON so identical
+# payloads are only stored once (see encode_payload).
+class CJRPayload(Base):
+    __tablename__ = "CJRPayload"
+    PayloadHash = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    Compression = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    PayloadData = sqlalchemy.Column(sqlalchemy.LargeBinary, nullable=False)
+
+
+# The registry of the job versions which have been moved to archive files (see cjrlib.cjr_archive).
+class CJRArchive(Base):
+    __tablename__ = "CJRArchive"
+    JobName = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    Version = sqlalchemy.Column(sqlalchemy.INTEGER, primary_key=True)
+    ArchiveFile = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    NTasks = sqlalchemy.Column(sqlalchemy.INTEGER, nullable=False)
+    ArchiveTime = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False)
+
+
+class CJRDBInfo(Base):
+    __tablename__ = "CJRDBInfo"
+    Key = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    Value = sqlalchemy.Column(sqlalchemy.INTEGER)
+
+
+def iso_str_to_datetime(iso_time_str):
+    """
+    A function to parse a datetime from an ISO formatted string, as created by datetime.isoformat().
+
+    :param iso_time_str: string with the ISO formatted date and time.
+
+    :return: datetime object
+    """
+    for time_fmt in ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"]:
+        try:
+            return datetime.datetime.strptime(iso_time_str, time_fmt)
+        except ValueError:
+            pass
+    raise Exception("Could not parse the date and time '{}'.".format(iso_time_str))
+
+
+def get_task_updates(db_ses_obj, job_name, version, task_id=None, task_ids=None, task_completed=None):
+    """
+    A function which retrieves the updates recorded in the CJRTaskUpdate table for a job and version, optionally
+    limited to a single task, a list of tasks or the tasks with a given completion state.
+
+    :param db_ses_obj: an sqlalchemy session object.
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task.
+    :param task_id: optionally a string for the task ID. If None then the updates for all tasks are returned.
+    :param task_ids: optionally a list of task IDs for which the updates are returned.
+    :param task_completed: optionally a boolean; if provided then only the updates for the tasks where
+                           CJRTaskInfo.TaskCompleted matches are returned.
+
+    :return: returns a dictionary with the task ID as the key and a dictionary of updates (keyed by the ISO
+             formatted update time) as the value.
+    """
+    qury = db_ses_obj.query(CJRTaskUpdate.TaskID, CJRTaskUpdate.UpdateTime, CJRTaskUpdate.UpdateInfo).\
+                      filter(CJRTaskUpdate.JobName == job_name, CJRTaskUpdate.Version == version)
+    if task_id is not None:
+        qury = qury.filter(CJRTaskUpdate.TaskID == task_id)
+    if task_ids is not None:
+        qury = qury.filter(CJRTaskUpdate.TaskID.in_(task_ids))
+    if task_completed is not None:
+        qury = qury.join(CJRTaskInfo, sqlalchemy.and_(CJRTaskInfo.JobName == CJRTaskUpdate.JobName,
+                                                      CJRTaskInfo.Version == CJRTaskUpdate.Version,
+                                                      CJRTaskInfo.TaskID == CJRTaskUpdate.TaskID)).\
+                    filter(CJRTaskInfo.TaskCompleted == task_completed)
+
+    task_updates = dict()
+    for update_rcd in qury.order_by(CJRTaskUpdate.UpdateTime):
+        if update_rcd.TaskID not in task_updates:
+            task_updates[update_rcd.TaskID] = dict()
+        task_updates[update_rcd.TaskID][update_rcd.UpdateTime.isoformat()] = update_rcd.UpdateInfo
+    return task_updates
+
+
+# The fields of the dictionaries created by task_to_dict and the CJRTaskInfo columns each field requires.
+TASK_FIELDS = ['task_id', 'job_name', 'version', 'start', 'end', 'params', 'update_info', 'end_info', 'completed',
+               'last_modified', 'last_heartbeat']
+TASK_PAYLOAD_FIELDS = ['params', 'update_info', 'end_info']
+_task_field_columns = {'task_id': ['TaskID'], 'job_name': ['JobName'], 'version': ['Version'],
+                       'start': ['StartTime'], 'end': ['EndTime', 'TaskCompleted'], 'params': ['TaskParams', 'TaskParamsRef'],
+                       'update_info': ['TaskUpdates'], 'end_info': ['TaskEndInfo', 'TaskEndInfoRef'], 'completed': ['TaskCompleted'],
+                       'last_modified': ['LastModified'], 'last_heartbeat': ['LastHeartbeat']}
+
+
+def get_task_fields(fields=None, include_payload=True):
+    """
+    A function which gets the list of task fields to be returned by a query.
+
+    :param fields: a list of field names (see TASK_FIELDS). If None then all the fields are returned.
+    :param include_payload: if False then the fields with the JSON payloads ('params', 'update_info' and
+                            'end_info') are not returned.
+
+    :return: list of field names.
+    """
+    if fields is None:
+        fields = TASK_FIELDS
+    for field in fields:
+        if field not in TASK_FIELDS:
+            raise Exception("Do not recognise the task field '{}' - options are: {}".format(field,
+                                                                                          ", ".join(TASK_FIELDS)))
+    if not include_payload:
+        fields = [field for field in fields if field not in TASK_PAYLOAD_FIELDS]
+    return [field for field in TASK_FIELDS if field in fields]
+
+
+def task_fields_load_only(fields):
+    """
+    A function which creates a query option so only the CJRTaskInfo columns needed for a list of fields are
+    loaded from the database (the other columns are deferred).
+
+    :param fields: a list of field names (see get_task_fields).
+
+    :return: sqlalchemy query option.
+    """
+    column_names = list()
+    for field in fields:
+        for column_name in _task_field_columns[field]:
+            if column_name not in column_names:
+                column_names.append(column_name)
+    return sqlalchemy.orm.load_only(*column_names)
+
+
+PAYLOAD_COMPRESSIONS = ["zlib", "zstd"]
+
+# Maximum number of (decoded) payloads held by the payload cache.
+CJR_PAYLOAD_CACHE_SIZE = int(os.environ.get('CJR_PAYLOAD_CACHE_SIZE', 1024))
+
+# Cache of the payloads read from the payload store, keyed by the payload hash. The payloads are decoded once
+# and held as functions returning a copy (see _create_json_copier), so the dictionaries returned for each task
+# are not shared.
+_payload_cache = collections.OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+
+def _get_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("zstandard is required for zstd compressed payloads - please install it.")
+    return zstandard
+
+
+def encode_payload(payload, compression="zlib", min_size=0):
+    """
+    A function which encodes a payload (e.g., task params) for the payload store. The payload is serialised as
+    JSON, with sorted keys so equal payloads have the same hash, and compressed.
+
+    :param payload: the payload, which must be JSON serialisable.
+    :param compression: the compression used: zlib or zstd (requires the zstandard package).
+    :param min_size: the minimum size (bytes) of the JSON for the payload to be stored within the payload store.
+
+    :return: (hash, compression, data) tuple or None if the payload is None or smaller than min_size, in which
+             case it is stored within the CJRTaskInfo table.
+    """
+    if payload is None:
+        return None
+    payload_json = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    if len(payload_json) < min_size:
+        return None
+    if compression == "zlib":
+        payload_data = zlib.compress(payload_json)
+    elif compression == "zstd":
+        payload_data = _get_zstandard().ZstdCompressor().compress(payload_json)
+    else:
+        raise Exception("Do not recognise the payload compression '{}' - options are: {}".format(
+                        compression, ", ".join(PAYLOAD_COMPRESSIONS)))
+    return hashlib.sha256(payload_json).hexdigest(), compression, payload_data
+
+
+def _decompress_payload(compression, payload_data):
+    if compression == "zlib":
+        return zlib.decompress(payload_data)
+    elif compression == "zstd":
+        return _get_zstandard().ZstdDecompressor().decompress(payload_data)
+    raise Exception("Do not recognise the payload compression '{}'.".format(compression))
+
+
+def _create_json_copier(json_value):
+    """
+    A function which creates a function to copy a decoded JSON value, where only the dictionaries and lists are
+    copied (the other JSON values are immutable). The structure of the value is found once, so each copy is
+    quicker than decoding the JSON again (or copy.deepcopy).
+
+    :param json_value: the decoded JSON value, which must not be changed once the function has been created.
+
+    :return: a function which is passed json_value and returns a copy.
+    """
+    json_type = type(json_value)
+    if json_type is dict:
+        item_copiers = [(key, _create_json_copier(item)) for key, item in json_value.items()
+                        if type(item) in (dict, list)]
+        if len(item_copiers) == 0:
+            return dict
+
+        def _copy_dict(dict_value):
+            dict_copy = dict(dict_value)
+            for key, item_copier in item_copiers:
+                dict_copy[key] = item_copier(dict_value[key])
+            return dict_copy
+        return _copy_dict
+    elif json_type is list:
+        item_copiers = [_create_json_copier(item) if type(item) in (dict, list) else None for item in json_value]
+        if all([item_copier is None for item_copier in item_copiers]):
+            return list
+
+        def _copy_list(list_value):
+            return [item if item_copier is None else item_copier(item)
+                    for item_copier, item in zip(item_copiers, list_value)]
+        return _copy_list
+    return lambda value: value
+
+
+def _create_payload_copier(payload_json):
+    """
+    A function which decodes a payload and creates a function (without parameters) returning a copy of it.
+    """
+    payload = json.loads(payload_json.decode("utf-8"))
+    json_copier = _create_json_copier(payload)
+    return lambda: json_copier(payload)
+
+
+def load_payloads(db_ses_obj, payload_hashes):
+    """
+    A function which gets payloads from the payload store, using the payload cache. The payloads which are not
+    cached are read from the database in batches.
+
+    :param db_ses_obj: an sqlalchemy session object.
+    :param payload_hashes: an iterable of payload hashes.
+
+    :return: dictionary with the payload hash as the key and, as the value, a function (without parameters)
+             which returns a copy of the decoded payload.
+    """
+    payloads = dict()
+    missing_hashes = list()
+    with _payload_cache_lock:
+        for payload_hash in set(payload_hashes):
+            if payload_hash in _payload_cache:
+                _payload_cache.move_to_end(payload_hash)
+                payloads[payload_hash] = _payload_cache[payload_hash]
+            else:
+                missing_hashes.append(payload_hash)
+
+    payload_tbl = CJRPayload.__table__
+    for i_start in range(0, len(missing_hashes), 500):
+        qury_rslt = db_ses_obj.execute(sqlalchemy.select([payload_tbl.c.PayloadHash, payload_tbl.c.Compression,
+                                                          payload_tbl.c.PayloadData]).
+                                       where(payload_tbl.c.PayloadHash.in_(missing_hashes[i_start:i_start+500])))
+        for payload_hash, compression, payload_data in qury_rslt:
+            payloads[payload_hash] = _create_payload_copier(_decompress_payload(compression, payload_data))
+
+    if len(missing_hashes) > 0:
+        with _payload_cache_lock:
+            for payload_hash in missing_hashes:
+                if payload_hash in payloads:
+                    _payload_cache[payload_hash] = payloads[payload_hash]
+            while len(_payload_cache) > CJR_PAYLOAD_CACHE_SIZE:
+                _payload_cache.popitem(last=False)
+    return payloads
+
+
+def get_task_payloads(db_ses_obj, task_rcds, fields=None):
+    """
+    A function which gets the payloads from the payload store for a list of CJRTaskInfo records, to be
+    passed to task_to_dict.
+
+    :param db_ses_obj: an sqlalchemy session object.
+    :param task_rcds: list of records from the CJRTaskInfo table.
+    :param fields: a list of the fields to be included within the dictionaries (see get_task_fields). If None
+                   then all the fields are included.
+
+    :return: dictionary with the payload hash as the key and, as the value, a function (without parameters)
+             which returns a copy of the decoded payload.
+    """
+    if fields is None:
+        fields = TASK_FIELDS
+    payload_hashes = set()
+    for task_rcd in task_rcds:
+        if ('params' in fields) and (task_rcd.TaskParamsRef is not None):
+            payload_hashes.add(task_rcd.TaskParamsRef)
+        if ('end_info' in fields) and (task_rcd.TaskEndInfoRef is not None):
+            payload_hashes.add(task_rcd.TaskEndInfoRef)
+    if len(payload_hashes) == 0:
+        return dict()
+    return load_payloads(db_ses_obj, payload_hashes)
+
+
+def _task_payload(task_rcd, payload, payload_hash, payloads):
+    """
+    A function which gets a task payload, which is either within the CJRTaskInfo record or, if payload_hash
+    is not None, within the payload store.
+    """
+    if payload_hash is None:
+        return payload
+    if (payloads is None) or (payload_hash not in payloads):
+        db_ses_obj = sqlalchemy.orm.object_session(task_rcd)
+        if db_ses_obj is None:
+            raise Exception("The payload '{}' has not been loaded and the task is not within a session.".format(
+                            payload_hash))
+        payloads = load_payloads(db_ses_obj, [payload_hash])
+        if payload_hash not in payloads:
+            raise Exception("The payload '{}' is not within the payload store.".format(payload_hash))
+    return payloads[payload_hash]()
+
+
+def task_to_dict(task_rcd, datetimeobjs=False, task_updates=None, fields=None, payloads=None):
     """
     A function to convert a CJRTaskInfo record to a dictionary
 
     :param task_rcd: record from the CJRTaskInfo table.
     :param datetimeobjs: If true the start_time and end_time fields are outputted as python datetime objects rather than
                          nested dictionaries.
+    :param task_updates: a dictionary of the updates for the task from the CJRTaskUpdate table (see
+                         get_task_updates). These are merged with any updates stored in the legacy TaskUpdates column.
+    :param fields: a list of the fields to be included within the dictionary (see get_task_fields). If None
+                   then all the fields are included. Only the columns needed for the fields are accessed.
+    :param payloads: a dictionary of the payloads from the payload store (see get_task_payloads). Payloads
+                     which are not within the dictionary are read from the database using the session of
+                     the record.
 
     :return: returns a dictionary
     """
+    if fields is None:
+        fields = TASK_FIELDS
     task_dict = dict()
-    task_dict['task_id'] = task_rcd.TaskID
-    task_dict['job_name'] = task_rcd.JobName
-    task_dict['version'] = task_rcd.Version
+    if 'task_id' in fields:
+        task_dict['task_id'] = task_rcd.TaskID
+    if 'job_name' in fields:
+        task_dict['job_name'] = task_rcd.JobName
+    if 'version' in fields:
+        task_dict['version'] = task_rcd.Version
     if datetimeobjs:
-        task_dict['start'] = task_rcd.StartTime
-        if task_rcd.TaskCompleted:
-            task_dict['end'] = task_rcd.EndTime
-        else:
-            task_dict['end'] = None
+        if 'start' in fields:
+            task_dict['start'] = task_rcd.StartTime
+        if 'end' in fields:
+            if task_rcd.TaskCompleted:
+                task_dict['end'] = task_rcd.EndTime
+            else:
+                task_dict['end'] = None
     else:
-        task_dict['start'] = dict()
-        task_dict['start']['year'] = task_rcd.StartTime.year
-        task_dict['start']['month'] = task_rcd.StartTime.month
-        task_dict['start']['day'] = task_rcd.StartTime.day
-        task_dict['start']['hour'] = task_rcd.StartTime.hour
-        task_dict['start']['minute'] = task_rcd.StartTime.minute
-        task_dict['start']['second'] = task_rcd.StartTime.second
-        task_dict['end'] = dict()
-        if task_rcd.TaskCompleted:
-            task_dict['end']['year'] = task_rcd.EndTime.year
-            task_dict['end']['month'] = task_rcd.EndTime.month
-            task_dict['end']['day'] = task_rcd.EndTime.day
-            task_dict['end']['hour'] = task_rcd.EndTime.hour
-            task_dict['end']['minute'] = task_rcd.EndTime.minute
-            task_dict['end']['second'] = task_rcd.EndTime.second
-
-    task_dict['params'] = task_rcd.TaskParams
-    task_dict['update_info'] = task_rcd.TaskUpdates
-    task_dict['end_info'] = task_rcd.TaskEndInfo
-    task_dict['completed'] = task_rcd.TaskCompleted
+        if 'start' in fields:
+            task_dict['start'] = dict()
+            task_dict['start']['year'] = task_rcd.StartTime.year
+            task_dict['start']['month'] = task_rcd.StartTime.month
+            task_dict['start']['day'] = task_rcd.StartTime.day
+            task_dict['start']['hour'] = task_rcd.StartTime.hour
+            task_dict['start']['minute'] = task_rcd.StartTime.minute
+            task_dict['start']['second'] = task_rcd.StartTime.second
+        if 'end' in fields:
+            task_dict['end'] = dict()
+            if task_rcd.TaskCompleted:
+                task_dict['end']['year'] = task_rcd.EndTime.year
+                task_dict['end']['month'] = task_rcd.EndTime.month
+                task_dict['end']['day'] = task_rcd.EndTime.day
+                task_dict['end']['hour'] = task_rcd.EndTime.hour
+                task_dict['end']['minute'] = task_rcd.EndTime.minute
+                task_dict['end']['second'] = task_rcd.EndTime.second
+
+    if 'params' in fields:
+        task_dict['params'] = _task_payload(task_rcd, task_rcd.TaskParams, task_rcd.TaskParamsRef, payloads)
+    if 'update_info' in fields:
+        update_info = None
+        if task_rcd.TaskUpdates is not None:
+            update_info = dict(task_rcd.TaskUpdates)
+        if task_updates:
+            if update_info is None:
+                update_info = dict()
+            update_info.update(task_updates)
+        task_dict['update_info'] = update_info
+    if 'end_info' in fields:
+        task_dict['end_info'] = _task_payload(task_rcd, task_rcd.TaskEndInfo, task_rcd.TaskEndInfoRef, payloads)
+    if 'completed' in fields:
+        task_dict['completed'] = task_rcd.TaskCompleted
+    if 'last_modified' in fields:
+        task_dict['last_modified'] = datetime_to_field(task_rcd.LastModified, datetimeobjs)
+    if 'last_heartbeat' in fields:
+        task_dict['last_heartbeat'] = datetime_to_field(task_rcd.LastHeartbeat, datetimeobjs)
     return task_dict
 
 
+def datetime_to_field(date_time, datetimeobjs=False):
+    """
+    A function which converts a datetime to the form used for the fields of the task dictionaries.
+
+    :param date_time: a python datetime object, or None.
+    :param datetimeobjs: If true the datetime object is returned rather than a nested dictionary.
+
+    :return: the datetime object or a dictionary with the year, month, day, hour, minute and second.
+    """
+    if datetimeobjs or (date_time is None):
+        return date_time
+    return {'year': date_time.year, 'month': date_time.month, 'day': date_time.day, 'hour': date_time.hour,
+            'minute': date_time.minute, 'second': date_time.second}
+
+
+def create_missing_indexes(db_engine, print_progress=False):
+    """
+    A function which creates the indexes defined for the tables which are not present within the database.
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: list of the names of the indexes which were created.
+    """
+    db_inspector = sqlalchemy.inspect(db_engine)
+    db_table_names = db_inspector.get_table_names()
+    created_indexes = list()
+    for db_table in Base.metadata.sorted_tables:
+        if db_table.name not in db_table_names:
+            continue
+        db_index_names = set([db_index['name'] for db_index in db_inspector.get_indexes(db_table.name)])
+        db_column_names = set([db_column['name'] for db_column in db_inspector.get_columns(db_table.name)])
+        for db_index in db_table.indexes:
+            # Indexes on columns added by a later schema version are created by that version's migration.
+            if not all([db_column.name in db_column_names for db_column in db_index.columns]):
+                continue
+            if db_index.name not in db_index_names:
+                if print_progress:
+                    print("Creating index '{}'.".format(db_index.name))
+                db_index.create(db_engine)
+                created_indexes.append(db_index.name)
+    return created_indexes
+
+
+def _add_table_column(db_engine, db_table, column_name):
+    """
+    A function which adds a column, defined within the table model, to an existing table if it is not present.
+
+    :return: boolean, True if the column was added.
+    """
+    db_column_names = [db_column['name'] for db_column in sqlalchemy.inspect(db_engine).get_columns(db_table.name)]
+    if column_name in db_column_names:
+        return False
+    db_column = db_table.c[column_name]
+    preparer = db_engine.dialect.identifier_preparer
+    with db_engine.begin() as db_conn:
+        db_conn.execute("ALTER TABLE {} ADD COLUMN {} {}".format(preparer.format_table(db_table),
+                                                                 preparer.format_column(db_column),
+                                                                 db_column.type.compile(dialect=db_engine.dialect)))
+    return True
+
+
+def _get_last_update_time_expr():
+    """
+    A function which creates a correlated scalar subquery for the time of the last update of a task within the
+    CJRTaskUpdate table, for use within a statement on the CJRTaskInfo table.
+
+    :return: sqlalchemy expression
+    """
+    task_tbl = CJRTaskInfo.__table__
+    update_tbl = CJRTaskUpdate.__table__
+    return sqlalchemy.select([sqlalchemy.func.max(update_tbl.c.UpdateTime)]).\
+        where(sqlalchemy.and_(update_tbl.c.JobName == task_tbl.c.JobName,
+                              update_tbl.c.Version == task_tbl.c.Version,
+                              update_tbl.c.TaskID == task_tbl.c.TaskID)).as_scalar()
+
+
+def _set_legacy_update_times(db_engine, column_name, batch_size=1000):
+    """
+    A function which sets a time column (i.e., LastModified or LastHeartbeat) of the tasks with updates still
+    within the legacy TaskUpdates column to the time of their last update, where it is later than the current
+    value.
+
+    :return: the number of tasks with legacy updates.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    time_col = task_tbl.c[column_name]
+    update_time_stmt = task_tbl.update().\
+        where(sqlalchemy.and_(task_tbl.c.JobName == sqlalchemy.bindparam("b_job_name"),
+                              task_tbl.c.TaskID == sqlalchemy.bindparam("b_task_id"),
+                              task_tbl.c.Version == sqlalchemy.bindparam("b_version"),
+                              sqlalchemy.or_(time_col.is_(None), time_col < sqlalchemy.bindparam("b_update_time")))).\
+        values({column_name: sqlalchemy.bindparam("b_update_time")})
+    with db_engine.begin() as db_conn:
+        # The last update times are found before any rows are changed, so only these are held in memory.
+        update_time_rcds = list()
+        for task_rcd in db_conn.execute(sqlalchemy.select([task_tbl.c.JobName, task_tbl.c.TaskID, task_tbl.c.Version,
+                                                           task_tbl.c.TaskUpdates]).
+                                        where(task_tbl.c.TaskUpdates.isnot(None))):
+            if task_rcd.TaskUpdates:
+                last_update_time = max([iso_str_to_datetime(update_time_str)
+                                        for update_time_str in task_rcd.TaskUpdates])
+                update_time_rcds.append({"b_job_name": task_rcd.JobName, "b_task_id": task_rcd.TaskID,
+                                         "b_version": task_rcd.Version, "b_update_time": last_update_time})
+        for i in range(0, len(update_time_rcds), batch_size):
+            db_conn.execute(update_time_stmt, update_time_rcds[i:i + batch_size])
+    return len(update_time_rcds)
+
+
+def _set_last_update_times(db_engine, column_name):
+    """
+    A function which sets a time column (i.e., LastModified or LastHeartbeat) of the tasks to the time of their
+    last update, within either the CJRTaskUpdate table or the legacy TaskUpdates column, where it is later than
+    the current value.
+
+    :return: the number of tasks with legacy updates.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    time_col = task_tbl.c[column_name]
+    last_update_time = _get_last_update_time_expr()
+    with db_engine.begin() as db_conn:
+        db_conn.execute(task_tbl.update().where(sqlalchemy.or_(time_col.is_(None), last_update_time > time_col)).
+                        where(last_update_time.isnot(None)).values({column_name: last_update_time}))
+    return _set_legacy_update_times(db_engine, column_name)
+
+
+def add_last_modified_column(db_engine, print_progress=False):
+    """
+    A function which adds the LastModified column (and index) to the CJRTaskInfo table, set to the end time
+    of the completed tasks and otherwise the time of the last update of the task, within either the
+    CJRTaskUpdate table or the legacy TaskUpdates column, or the start time of the task if it has not been
+    updated.
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    task_tbl = CJRTaskInfo.__table__
+    if _add_table_column(db_engine, task_tbl, "LastModified"):
+        if print_progress:
+            print("Added the LastModified column to the CJRTaskInfo table.")
+        with db_engine.begin() as db_conn:
+            db_conn.execute(task_tbl.update().where(task_tbl.c.LastModified.is_(None)).
+                            values(LastModified=sqlalchemy.func.coalesce(task_tbl.c.EndTime, task_tbl.c.StartTime)))
+        _set_last_update_times(db_engine, "LastModified")
+    create_missing_indexes(db_engine, print_progress)
+
+
+def add_last_heartbeat_column(db_engine, print_progress=False):
+    """
+    A function which adds the LastHeartbeat column (and index) to the CJRTaskInfo table, set to the time of
+    the last update of each task, within either the CJRTaskUpdate table or the legacy TaskUpdates column, or
+    the start time of the task if it has not been updated.
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    task_tbl = CJRTaskInfo.__table__
+    if _add_table_column(db_engine, task_tbl, "LastHeartbeat"):
+        if print_progress:
+            print("Added the LastHeartbeat column to the CJRTaskInfo table.")
+        with db_engine.begin() as db_conn:
+            db_conn.execute(task_tbl.update().where(task_tbl.c.LastHeartbeat.is_(None)).
+                            values(LastHeartbeat=task_tbl.c.StartTime))
+        _set_last_update_times(db_engine, "LastHeartbeat")
+    create_missing_indexes(db_engine, print_progress)
+
+
+def replace_job_version_completed_index(db_engine, print_progress=False):
+    """
+    A function which drops the CJRTaskInfo_JobVersionCompleted_Idx index, as its columns are the start of the
+    CJRTaskInfo_Heartbeat_Idx index, and corrects the LastHeartbeat of the tasks which were updated before the
+    column was added (previously set to the start time of the task where the updates were within the legacy
+    TaskUpdates column, including those since moved to the CJRTaskUpdate table).
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    create_missing_indexes(db_engine, print_progress)
+    task_tbl = CJRTaskInfo.__table__
+    index_names = [db_index["name"] for db_index in sqlalchemy.inspect(db_engine).get_indexes(task_tbl.name)]
+    if "CJRTaskInfo_JobVersionCompleted_Idx" in index_names:
+        # The index is no longer part of the table definition so is defined against a copy of the table.
+        legacy_task_tbl = sqlalchemy.Table(task_tbl.name, sqlalchemy.MetaData(),
+                                           sqlalchemy.Column("JobName", sqlalchemy.String))
+        sqlalchemy.Index("CJRTaskInfo_JobVersionCompleted_Idx", legacy_task_tbl.c.JobName).drop(db_engine)
+        if print_progress:
+            print("Dropped the index CJRTaskInfo_JobVersionCompleted_Idx.")
+    n_tasks = _set_last_update_times(db_engine, "LastHeartbeat")
+    if print_progress and (n_tasks > 0):
+        print("Set the LastHeartbeat of {} tasks with legacy updates.".format(n_tasks))
+
+
+def correct_last_modified_times(db_engine, print_progress=False):
+    """
+    A function which corrects the LastModified time of the uncompleted tasks which were updated before the
+    column was added (previously set to the start time of the task, so the updates were not returned by
+    cjrlib.cjr_queries.get_tasks_changed_since).
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    n_tasks = _set_last_update_times(db_engine, "LastModified")
+    if print_progress and (n_tasks > 0):
+        print("Set the LastModified of {} tasks with legacy updates.".format(n_tasks))
+
+
+def add_payload_ref_columns(db_engine, print_progress=False):
+    """
+    A function which adds the TaskParamsRef and TaskEndInfoRef columns, referencing the payload store, to the
+    CJRTaskInfo table.
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    task_tbl = CJRTaskInfo.__table__
+    for column_name in ["TaskParamsRef", "TaskEndInfoRef"]:
+        if _add_table_column(db_engine, task_tbl, column_name) and print_progress:
+            print("Added the {} column to the CJRTaskInfo table.".format(column_name))
+
+
+def add_catalog_generation(db_engine, print_progress=False):
+    """
+    A function which adds the CatalogGeneration row to the CJRDBInfo table if it is not present.
+
+    :param db_engine: the sqlalchemy engine for the database.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    """
+    with db_engine.begin() as db_conn:
+        if get_catalog_generation(db_conn) is None:
+            if print_progress:
+                print("Adding the catalog generation to the CJRDBInfo table.")
+            db_conn.execute(CJRDBInfo.__table__.insert(), {"Key": "CatalogGeneration", "Value": 0})
+
+
+def get_catalog_generation(db_conn):
+    """
+    A function which gets the catalog generation of the database, a counter incremented each time a job name
+    or job version is added to (or removed from) the database. It is used to check whether the cached job
+    names and versions (see cjrlib.cjr_queries) are still current without reading the tables.
+
+    :param db_conn: an sqlalchemy connection or session.
+
+    :return: integer or None if the database does not have a catalog generation.
+    """
+    qury_rslt = db_conn.execute(sqlalchemy.select([CJRDBInfo.__table__.c.Value]).
+                                where(CJRDBInfo.__table__.c.Key == "CatalogGeneration")).fetchone()
+    if qury_rslt is None:
+        return None
+    return qury_rslt[0]
+
+
+def bump_catalog_generation(db_conn):
+    """
+    A function which increments the catalog generation of the database, within the transaction of db_conn.
+
+    :param db_conn: an sqlalchemy connection or session.
+
+    """
+    db_info_tbl = CJRDBInfo.__table__
+    db_conn.execute(db_info_tbl.update().where(db_info_tbl.c.Key == "CatalogGeneration").
+                    values(Value=db_info_tbl.c.Value + 1))
+
+
+# Version of the database schema, incremented when the tables are changed with a
+# function to upgrade the previous version added to _schema_migrations.
+CJR_SCHEMA_VERSION = 10
+
+# Upgrades to existing databases, keyed by the schema version they upgrade to. New tables are
+# created by Base.metadata.create_all so only changes to existing tables need to be listed.
+_schema_migrations = {3: create_missing_indexes, 4: add_last_modified_column, 5: add_catalog_generation,
+                      6: add_last_heartbeat_column, 8: add_payload_ref_columns,
+                      9: replace_job_version_completed_index, 10: correct_last_modified_times}
+
+# The databases whose schema has been checked by this process.
+_checked_schema_dbs = set()
+
+
+# Maximum number of database engines held by the engine cache.
+CJR_ENGINE_CACHE_SIZE = int(os.environ.get('CJR_ENGINE_CACHE_SIZE', 8))
+
+# Cache of (engine, sessionmaker, write sessionmaker, scoped session, write scoped session, write engine) tuples
+# keyed by the database URL, ordered by when they were last used.
+_engine_cache = collections.OrderedDict()
+_engine_cache_pinned = set()
+_engine_cache_lock = threading.RLock()
+
+# The process which created the cached engines. A child process (e.g., from multiprocessing) creates its own
+# engines; the engines inherited from the parent are kept in _engine_cache_inherited so they are not garbage
+# collected, which would close the parent's connections.
+_engine_cache_pid = os.getpid()
+_engine_cache_inherited = list()
+
+# The database profile used when creating engines. The 'concurrent' profile configures SQLite databases
+# for many concurrent writers (WAL journal, busy timeout and BEGIN IMMEDIATE transactions for writes).
+_db_profile = {'profile': os.environ.get('CJR_DB_PROFILE', 'default'),
+               'busy_timeout': int(os.environ.get('CJR_DB_BUSY_TIMEOUT', 30000)),
+               'lock_retries': int(os.environ.get('CJR_DB_LOCK_RETRIES', 5)),
+               'lock_backoff': float(os.environ.get('CJR_DB_LOCK_BACKOFF', 0.1)),
+               'lock_max_backoff': float(os.environ.get('CJR_DB_LOCK_MAX_BACKOFF', 5.0)),
+               'pool_size': int(os.environ['CJR_DB_POOL_SIZE']) if 'CJR_DB_POOL_SIZE' in os.environ else None,
+               'max_overflow': int(os.environ['CJR_DB_MAX_OVERFLOW']) if 'CJR_DB_MAX_OVERFLOW' in os.environ else None}
+
+# Counts of the database lock errors and retries, see get_lock_stats.
+_lock_stats = {'lock_errors': 0, 'retries': 0, 'retries_exhausted': 0, 'lock_wait_time': 0.0, 'backoff_time': 0.0}
+_lock_stats_lock = threading.Lock()
+
+
+def _configure_sqlite_concurrent(db_engine, busy_timeout):
+    """
+    A function which adds event listeners to an SQLite engine so connections use a WAL journal and a
+    busy timeout, and transactions on connections with the 'cjr_write' execution option are started
+    with BEGIN IMMEDIATE so the write lock is taken at the start of the transaction (rather than failing
+    with a deadlock when a read transaction is upgraded to a write).
+
+    :param db_engine: the sqlalchemy engine for an SQLite database.
+    :param busy_timeout: the time, in milliseconds, SQLite will wait for a lock.
+
+    """
+    @sqlalchemy.event.listens_for(db_engine, "connect")
+    def _sqlite_on_connect(dbapi_conn, conn_record):
+        # Disable the pysqlite transaction handling so the BEGIN statement is issued in _sqlite_on_begin.
+        dbapi_conn.isolation_level = None
+        db_cursor = dbapi_conn.cursor()
+        db_cursor.execute("PRAGMA busy_timeout={}".format(int(busy_timeout)))
+        db_cursor.execute("PRAGMA journal_mode=WAL")
+        db_cursor.execute("PRAGMA synchronous=NORMAL")
+        db_cursor.close()
+
+    @sqlalchemy.event.listens_for(db_engine, "begin")
+    def _sqlite_on_begin(db_conn):
+        if db_conn.get_execution_options().get('cjr_write', False):
+            db_conn.execute("BEGIN IMMEDIATE")
+        else:
+            db_conn.execute("BEGIN")
+
+
+def _configure_pool_pid_check(db_engine):
+    """
+    A function which adds event listeners to an engine so a pooled connection is only used by the process
+    which opened it. If an engine is used in a child process (e.g., after os.fork) then the connections
+    opened by the parent are discarded, without being closed, and new connections are opened.
+
+    :param db_engine: the sqlalchemy engine.
+
+    """
+    @sqlalchemy.event.listens_for(db_engine, "connect")
+    def _pool_on_connect(dbapi_conn, conn_record):
+        conn_record.info['cjr_pid'] = os.getpid()
+
+    @sqlalchemy.event.listens_for(db_engine, "checkout")
+    def _pool_on_checkout(dbapi_conn, conn_record, conn_proxy):
+        if conn_record.info['cjr_pid'] != os.getpid():
+            # Detach the connection from the pool so it is not closed (which would affect the parent).
+            conn_record.connection = conn_proxy.connection = None
+            raise sqlalchemy.exc.DisconnectionError("Connection record belongs to pid {}, attempting to check out "
+                                                    "in pid {}".format(conn_record.info['cjr_pid'], os.getpid()))
+
+
+def _create_db_engine(db_url):
+    """
+    A function which creates a new sqlalchemy engine for a database URL, using the current database profile.
+
+    :param db_url: the sqlalchemy database URL.
+
+    :return: sqlalchemy engine
+    """
+    db_url_obj = sqlalchemy.engine.url.make_url(db_url)
+    engine_kwargs = dict()
+    if db_url_obj.get_backend_name() in ['sqlite', 'postgresql', 'mysql']:
+        # Serialise the JSON columns with a function which can be timed (see cjrlib.cjr_metrics).
+        engine_kwargs['json_serializer'] = cjr_metrics.json_dumps
+    if db_url_obj.get_backend_name() != 'sqlite':
+        # SQLite engines do not use a QueuePool so do not accept the pool size options.
+        if _db_profile['pool_size'] is not None:
+            engine_kwargs['pool_size'] = _db_profile['pool_size']
+        if _db_profile['max_overflow'] is not None:
+            engine_kwargs['max_overflow'] = _db_profile['max_overflow']
+    if (_db_profile['profile'] == 'concurrent') and (db_url_obj.get_backend_name() == 'sqlite'):
+        db_engine = sqlalchemy.create_engine(db_url, connect_args={'timeout': _db_profile['busy_timeout'] / 1000.0},
+                                             **engine_kwargs)
+        _configure_sqlite_concurrent(db_engine, _db_profile['busy_timeout'])
+    else:
+        db_engine = sqlalchemy.create_engine(db_url, **engine_kwargs)
+    _configure_pool_pid_check(db_engine)
+    cjr_metrics.inc_counter("engines_created", db_url_obj.get_backend_name())
+    return db_engine
+
+
+def _reset_engine_cache_in_child():
+    """
+    A function which is called in a child process to replace the engines inherited from the parent process.
+    The inherited engines are not disposed, as that would close the connections the parent is using.
+    """
+    global _engine_cache_lock, _engine_cache_pid
+    # The lock may have been held by another thread of the parent when the process was forked.
+    _engine_cache_lock = threading.RLock()
+    _engine_cache_inherited.extend(_engine_cache.values())
+    _engine_cache.clear()
+    _engine_cache_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engine_cache_in_child)
+
+
+def _get_db_engine_entry(db_url):
+    if _engine_cache_pid != os.getpid():
+        _reset_engine_cache_in_child()
+    with _engine_cache_lock:
+        if db_url in _engine_cache:
+            _engine_cache.move_to_end(db_url)
+            return _engine_cache[db_url]
+
+        db_engine = _create_db_engine(db_url)
+        db_write_engine = db_engine.execution_options(cjr_write=True)
+        db_sessionmaker = sqlalchemy.orm.sessionmaker(bind=db_engine)
+        db_write_sessionmaker = sqlalchemy.orm.sessionmaker(bind=db_write_engine)
+        _engine_cache[db_url] = (db_engine, db_sessionmaker, db_write_sessionmaker,
+                                 sqlalchemy.orm.scoped_session(db_sessionmaker),
+                                 sqlalchemy.orm.scoped_session(db_write_sessionmaker), db_write_engine)
+
+        # Evict the least recently used engines which are not pinned.
+        for cached_db_url in list(_engine_cache.keys()):
+            if len(_engine_cache) <= CJR_ENGINE_CACHE_SIZE:
+                break
+            if (cached_db_url != db_url) and (cached_db_url not in _engine_cache_pinned):
+                _engine_cache.pop(cached_db_url)[0].dispose()
+        return _engine_cache[db_url]
+
+
+def get_db_engine(db_url, pin=False, write=False):
+    """
+    A function which gets an sqlalchemy engine for a database URL. Engines are cached so connection pools
+    are reused between calls, with the least recently used engines disposed once there are more than
+    CJR_ENGINE_CACHE_SIZE engines.
+
+    :param db_url: the sqlalchemy database URL.
+    :param pin: if True then the engine is not evicted from the cache, until dispose_db_engines is called.
+    :param write: if True then the engine is intended for writing to the database; it shares the connection
+                  pool of the engine but, when using the 'concurrent' profile with SQLite, its transactions take
+                  the write lock when they start.
+
+    :return: sqlalchemy engine
+    """
+    with _engine_cache_lock:
+        if pin:
+            _engine_cache_pinned.add(db_url)
+        if write:
+            return _get_db_engine_entry(db_url)[5]
+        return _get_db_engine_entry(db_url)[0]
+
+
+def get_db_sessionmaker(db_url, write=False):
+    """
+    A function which gets the (cached) sqlalchemy sessionmaker for a database URL.
+
+    :param db_url: the sqlalchemy database URL.
+    :param write: if True then the sessions are intended for writing to the database. When using the
+                  'concurrent' profile with SQLite, the transactions for these sessions take the write lock
+                  when they start.
+
+    :return: sqlalchemy sessionmaker
+    """
+    if write:
+        return _get_db_engine_entry(db_url)[2]
+    return _get_db_engine_entry(db_url)[1]
+
+
+def get_db_scoped_session(db_url, write=False):
+    """
+    A function which gets the (cached) sqlalchemy scoped_session for a database URL. Calling the scoped_session
+    returns a session for the current thread, so it can be used from each thread of a thread pool. Call remove()
+    on the scoped_session when a thread has finished with its session. Each process has its own scoped_session.
+
+    :param db_url: the sqlalchemy database URL.
+    :param write: if True then the sessions are intended for writing to the database (see get_db_sessionmaker).
+
+    :return: sqlalchemy scoped_session
+    """
+    if write:
+        return _get_db_engine_entry(db_url)[4]
+    return _get_db_engine_entry(db_url)[3]
+
+
+def get_cjr_db_url(cjr_db_file=None):
+    """
+    A function which gets the database URL, defaulting to the database of the CJRDBConnection object.
+
+    :param cjr_db_file: the database URL. If None then the database defined by the CJR_DB_FILE
+                        environmental variable is used.
+
+    :return: the database URL.
+    """
+    if cjr_db_file is None:
+        cjrdb_conn = CJRDBConnection()
+        if cjrdb_conn is None:
+            raise Exception("Could not create the connection object...")
+        return cjrdb_conn.cjr_db_file
+    return cjr_db_file
+
+
+def get_cjr_db_session(cjr_db_file=None):
+    """
+    A function which gets a database session, using a cached engine for the database.
+
+    :param cjr_db_file: the database URL. If None then the database defined by the CJR_DB_FILE
+                        environmental variable is used.
+
+    :return: an sqlalchemy session object.
+    """
+    if cjr_db_file is None:
+        cjrdb_conn = CJRDBConnection()
+        if cjrdb_conn is None:
+            raise Exception("Could not create the connection object...")
+        return cjrdb_conn.get_db_session()
+    ses_sqlalc = get_db_sessionmaker(cjr_db_file)
+    return ses_sqlalc()
+
+
+def dispose_db_engines(db_url=None):
+    """
+    A function which disposes of the cached engines, closing their connections.
+
+    :param db_url: the URL of the engine to be disposed. If None then all the cached engines are disposed.
+
+    """
+    if _engine_cache_pid != os.getpid():
+        _reset_engine_cache_in_child()
+    with _engine_cache_lock:
+        if db_url is None:
+            db_urls = list(_engine_cache.keys())
+        else:
+            db_urls = [db_url]
+        for cached_db_url in db_urls:
+            _engine_cache_pinned.discard(cached_db_url)
+            if cached_db_url in _engine_cache:
+                _engine_cache.pop(cached_db_url)[0].dispose()
+
+
+def _is_db_lock_error(error):
+    """
+    A function which checks whether a database error was caused by a lock, and therefore whether
+    the operation can be retried.
+
+    :param error: the sqlalchemy exception.
+
+    :return: boolean
+    """
+    error_msg = str(getattr(error, 'orig', error)).lower()
+    for lock_msg in ['database is locked', 'database table is locked', 'database is busy',
+                     'deadlock detected', 'could not serialize access', 'lock wait timeout']:
+        if lock_msg in error_msg:
+            return True
+    return False
+
+
+def retry_on_db_lock(db_func):
+    """
+    A decorator which retries a function when it fails because the database is locked, with an exponential
+    and jittered backoff between attempts. The number of retries and backoff times are defined by the
+    CJR_DB_LOCK_RETRIES, CJR_DB_LOCK_BACKOFF and CJR_DB_LOCK_MAX_BACKOFF environmental variables (or
+    CJRDBConnection.set_db_profile). The function needs to be safe to call again if it fails.
+
+    :param db_func: the function to be wrapped.
+
+    :return: the wrapped function.
+    """
+    @functools.wraps(db_func)
+    def _retry_wrapper(*args, **kwargs):
+        n_attempt = 0
+        while True:
+            start_time = time.time()
+            try:
+                return db_func(*args, **kwargs)
+            except sqlalchemy.exc.OperationalError as error:
+                if not _is_db_lock_error(error):
+                    raise
+                wait_time = time.time() - start_time
+                retry = n_attempt < _db_profile['lock_retries']
+                backoff_time = 0.0
+                if retry:
+                    backoff_time = min(_db_profile['lock_max_backoff'], _db_profile['lock_backoff'] * (2 ** n_attempt))
+                    backoff_time = backoff_time * random.uniform(0.5, 1.5)
+                cjr_metrics.inc_counter("db_lock_errors", db_func.__name__)
+                if retry:
+                    cjr_metrics.inc_counter("db_lock_retries", db_func.__name__)
+                with _lock_stats_lock:
+                    _lock_stats['lock_errors'] += 1
+                    _lock_stats['lock_wait_time'] += wait_time
+                    if retry:
+                        _lock_stats['retries'] += 1
+                        _lock_stats['backoff_time'] += backoff_time
+                    else:
+                        _lock_stats['retries_exhausted'] += 1
+                if not retry:
+                    raise
+                time.sleep(backoff_time)
+                n_attempt = n_attempt + 1
+    return _retry_wrapper
+
+
+def get_lock_stats(reset=False):
+    """
+    A function which gets the counts of the database lock errors within this process, which can be used to tune
+    the database profile and number of concurrent writers.
+
+    :param reset: if True then the counts are reset to zero.
+
+    :return: dictionary with the number of lock errors ('lock_errors'), the number of retries ('retries'), the number
+             of operations which failed after all the retries ('retries_exhausted'), the time (seconds) spent in
+             attempts which failed with a lock error, mostly waiting on the busy timeout, ('lock_wait_time') and
+             the time (seconds) spent in the backoff between retries ('backoff_time').
+    """
+    with _lock_stats_lock:
+        lock_stats = dict(_lock_stats)
+        if reset:
+            for stat_key in _lock_stats:
+                _lock_stats[stat_key] = type(_lock_stats[stat_key])(0)
+    return lock_stats
+
+
 class CJRDBConnection:
     """
     Database connection class
     """
     _instance = None
+    _instance_lock = threading.Lock()
     print_progress = False
 
     def __new__(cls):
         """
-        Function which creates the DB connection object as a singularity model.
+        Function which creates the DB connection object as a singularity model. The object is shared by all the
+        threads of a process; the engine is created for each process (see get_db_engine) so the object can also
+        be used within child processes (e.g., a multiprocessing pool).
         """
         if cls._instance is None:
-            cls._instance = object.__new__(cls)
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = object.__new__(cls)
 
-            try:
-                cls._instance.cjr_db_file = os.environ['CJR_DB_FILE']
-            except Exception:
-                raise Exception("""Environmental variable CJR_DB_FILE was not defined and therefore
-                                   the database file has not been specified.""")
+                    try:
+                        instance.cjr_db_file = os.environ['CJR_DB_FILE']
+                    except Exception:
+                        raise Exception("""Environmental variable CJR_DB_FILE was not defined and therefore
+                                           the database file has not been specified.""")
 
-            try:
-                cls._instance.db_engine = sqlalchemy.create_engine(cls._instance.cjr_db_file)
-            except Exception as error:
-                print('Error: connection not established {}'.format(error))
-                cls._instance = None
+                    # If CJR_DB_NO_DDL is set then the tables are never created or altered by the recorder.
+                    instance.allow_schema_changes = os.environ.get('CJR_DB_NO_DDL', '').lower() not in \
+                                                    ['1', 'true', 'yes']
+
+                    # Optional local journal, if defined events are written to the journal and flushed to the
+                    # database separately (see cjrlib.cjr_journal).
+                    instance.journal_file = os.environ.get('CJR_JOURNAL_FILE', None)
+                    instance.journal_flush_interval = float(os.environ.get('CJR_JOURNAL_FLUSH_INTERVAL', 5.0))
+                    instance.journal_max_batch = int(os.environ.get('CJR_JOURNAL_MAX_BATCH', 500))
+
+                    # Optional payload store, if defined the task params and end info are compressed and
+                    # stored within the CJRPayload table (see set_payload_store).
+                    instance.payload_compression = os.environ.get('CJR_PAYLOAD_STORE', '').lower()
+                    if instance.payload_compression in ['', 'none']:
+                        instance.payload_compression = None
+                    instance.payload_min_size = int(os.environ.get('CJR_PAYLOAD_MIN_SIZE', 256))
+
+                    try:
+                        get_db_engine(instance.cjr_db_file, pin=True)
+                        cls._instance = instance
+                    except Exception as error:
+                        print('Error: connection not established {}'.format(error))
 
         return cls._instance
 
     def __init__(self):
-        self.db_engine = self._instance.db_engine
         self.cjr_db_file = self._instance.cjr_db_file
 
+    @property
+    def db_engine(self):
+        """
+        The sqlalchemy engine for the database, which is specific to the current process.
+        """
+        return get_db_engine(self.cjr_db_file)
+
+    def set_journal(self, journal_file, flush_interval=5.0, max_batch=500):
+        """
+        Function which defines a local journal file. When defined, events recorded with
+        cjrlib.cjr_recorder.record_task_status are appended to the journal file and the function returns
+        without accessing the database. The journal is flushed to the database by a background thread or
+        the cjr_flush_journal.py command (see cjrlib.cjr_journal). These parameters can also be defined
+        using the CJR_JOURNAL_FILE, CJR_JOURNAL_FLUSH_INTERVAL and CJR_JOURNAL_MAX_BATCH environmental variables.
+
+        :param journal_file: the path to the journal file, which should be on a local file system. If None then
+                             the journal is not used and events are written directly to the database.
+        :param flush_interval: the interval, in seconds, between the journal being flushed to the database.
+        :param max_batch: the maximum number of events written to the database within a single transaction.
+
+        """
+        self.journal_file = journal_file
+        self.journal_flush_interval = flush_interval
+        self.journal_max_batch = max_batch
+
+    def set_payload_store(self, compression="zlib", min_size=256):
+        """
+        Function which defines whether the task params and end info recorded by this process are stored within
+        the payload store, where they are compressed and identical payloads are only stored once. Tasks are
+        read in the same way whether or not they were recorded using the payload store. These parameters can
+        also be defined using the CJR_PAYLOAD_STORE (none, zlib or zstd) and CJR_PAYLOAD_MIN_SIZE environmental
+        variables.
+
+        :param compression: the compression used: zlib or zstd (requires the zstandard package). If None then
+                            the payload store is not used.
+        :param min_size: the minimum size (bytes) of the payload JSON for it to be stored in the payload store,
+                         smaller payloads are stored within the CJRTaskInfo table.
+
+        """
+        if (compression is not None) and (compression not in PAYLOAD_COMPRESSIONS):
+            raise Exception("Do not recognise the payload compression '{}' - options are: {}".format(
+                            compression, ", ".join(PAYLOAD_COMPRESSIONS)))
+        self.payload_compression = compression
+        self.payload_min_size = min_size
+
     def set_print_progress(self, print_progress=False):
         """
         Function which defines the parameter print_progress. If True then progress information will be printed to
@@ -146,12 +1212,48 @@ class CJRDBConnection:
 
     def create_db_tables(self):
         """
-        A function which checks whether Tables exist and if they don't
-        then create the DB Tables.
+        A function which checks whether the database schema has been created and is the current version. If it
+        has not then the schema is created or upgraded (see init_db_schema), unless schema changes have been
+        disabled (CJR_DB_NO_DDL environmental variable) in which case an exception is raised. The check is only
+        made once per process for each database.
         """
+        if self.cjr_db_file in _checked_schema_dbs:
+            return
         if self.print_progress:
             print("Check whether the tables were already present.")
-        if not self.db_engine.dialect.has_table(self.db_engine, "CJRJobName"):
+        schema_version = self.get_schema_version()
+        if schema_version != CJR_SCHEMA_VERSION:
+            if not self.allow_schema_changes:
+                raise Exception("The database schema is version {} but version {} is required - use cjr_init_db.py "
+                                "to create or upgrade the database.".format(schema_version, CJR_SCHEMA_VERSION))
+            self.init_db_schema()
+        _checked_schema_dbs.add(self.cjr_db_file)
+
+    def get_schema_version(self):
+        """
+        A function which gets the version of the schema within the database.
+
+        :return: integer version of the schema; 1 if the tables pre-date schema versioning or
+                 None if the tables have not been created.
+        """
+        if not self.db_engine.dialect.has_table(self.db_engine, "CJRDBInfo"):
+            if self.db_engine.dialect.has_table(self.db_engine, "CJRJobName"):
+                return 1
+            return None
+        db_ses_obj = self.get_db_session()
+        qury_rslt = db_ses_obj.query(CJRDBInfo.Value).filter(CJRDBInfo.Key == "SchemaVersion").one_or_none()
+        db_ses_obj.close()
+        if qury_rslt is None:
+            return 1
+        return qury_rslt.Value
+
+    def init_db_schema(self):
+        """
+        A function which creates the database tables if they don't exist, otherwise the existing tables are
+        upgraded to the current schema version.
+        """
+        schema_version = self.get_schema_version()
+        if schema_version is None:
             if self.print_progress:
                 print("Drop usage table if within the existing database.")
             Base.metadata.drop_all(self.db_engine)
@@ -160,21 +1262,92 @@ class CJRDBConnection:
                 print("Creating Usage Database.")
             Base.metadata.bind = self.db_engine
             Base.metadata.create_all()
+            add_catalog_generation(self.db_engine)
+        else:
+            # Create any new tables and then apply the migrations for the existing tables.
+            Base.metadata.create_all(self.db_engine)
+            for migrate_version in range(schema_version + 1, CJR_SCHEMA_VERSION + 1):
+                if self.print_progress:
+                    print("Upgrading the database schema to version {}.".format(migrate_version))
+                if migrate_version in _schema_migrations:
+                    _schema_migrations[migrate_version](self.db_engine)
+
+        with self.db_engine.begin() as db_conn:
+            db_conn.execute(CJRDBInfo.__table__.delete().where(CJRDBInfo.Key == "SchemaVersion"))
+            db_conn.execute(CJRDBInfo.__table__.insert(), {"Key": "SchemaVersion", "Value": CJR_SCHEMA_VERSION})
+        _checked_schema_dbs.add(self.cjr_db_file)
+
+    def set_db_profile(self, profile='default', busy_timeout=30000, lock_retries=5, lock_backoff=0.1,
+                       lock_max_backoff=5.0, pool_size=None, max_overflow=None):
+        """
+        Function which defines the database profile, used for engines created after this call; the engine for
+        this connection is recreated. These parameters can also be defined using the CJR_DB_PROFILE,
+        CJR_DB_BUSY_TIMEOUT, CJR_DB_LOCK_RETRIES, CJR_DB_LOCK_BACKOFF, CJR_DB_LOCK_MAX_BACKOFF,
+        CJR_DB_POOL_SIZE and CJR_DB_MAX_OVERFLOW environmental variables.
+
+        :param profile: either 'default' or 'concurrent'. The 'concurrent' profile configures SQLite databases for
+                        many concurrent processes: a WAL journal (so reads do not block writes), synchronous=NORMAL,
+                        a busy timeout and BEGIN IMMEDIATE transactions for writes.
+        :param busy_timeout: the time, in milliseconds, SQLite waits for a lock when using the 'concurrent' profile.
+        :param lock_retries: the number of times a write is retried when the database is locked.
+        :param lock_backoff: the initial backoff time (seconds) between retries, which is doubled on each retry.
+        :param lock_max_backoff: the maximum backoff time (seconds) between retries.
+        :param pool_size: the number of connections kept open by the connection pool of each process, which should
+                          be at least the number of threads using the database. If None then the sqlalchemy default
+                          (5) is used. Not used for SQLite databases.
+        :param max_overflow: the number of connections which can be opened in addition to pool_size when all the
+                             pooled connections are in use. If None then the sqlalchemy default (10) is used.
+                             Not used for SQLite databases.
+
+        """
+        if profile not in ['default', 'concurrent']:
+            raise Exception("Do not recognise the database profile '{}'.".format(profile))
+        _db_profile['profile'] = profile
+        _db_profile['busy_timeout'] = busy_timeout
+        _db_profile['lock_retries'] = lock_retries
+        _db_profile['lock_backoff'] = lock_backoff
+        _db_profile['lock_max_backoff'] = lock_max_backoff
+        _db_profile['pool_size'] = pool_size
+        _db_profile['max_overflow'] = max_overflow
+        dispose_db_engines(self.cjr_db_file)
+        get_db_engine(self.cjr_db_file, pin=True)
 
-    def get_db_session(self):
+    def get_db_session(self, write=False):
         """
         Get a database session object.
 
+        :param write: if True then the session is intended for writing to the database (see get_db_sessionmaker).
+
         :return: return an sqlalchemy session object.
         """
-        session = sqlalchemy.orm.sessionmaker(bind=self.db_engine)
-        ses = session()
+        with cjr_metrics.timed("get_db_session"):
+            session = get_db_sessionmaker(self.cjr_db_file, write)
+            ses = session()
         return ses
 
+    def get_db_scoped_session(self, write=False):
+        """
+        Get a thread local database session registry (see get_db_scoped_session), for use within thread pools.
+
+        For example, each worker thread can use:
+
+            db_ses_obj = cjrdb_conn.get_db_scoped_session(write=True)
+            try:
+                db_ses_obj.add(...)
+                db_ses_obj.commit()
+            finally:
+                db_ses_obj.remove()
+
+        :param write: if True then the sessions are intended for writing to the database (see get_db_sessionmaker).
+
+        :return: return an sqlalchemy scoped_session object.
+        """
+        return get_db_scoped_session(self.cjr_db_file, write)
+
     def delete_obj(self):
-        self.db_engine.dispose()
+        dispose_db_engines(self.cjr_db_file)
         self.cjr_db_file = ""
 
     def refresh_db(self):
         self.cjr_db_file = os.environ['CJR_DB_FILE']
-        self.db_engine = sqlalchemy.create_engine(self.cjr_db_file)
+        get_db_engine(self.cjr_db_file, pin=True)
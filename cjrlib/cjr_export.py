@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+cjr_export - Functions to export the tasks of a job to Parquet, CSV or JSON Lines files.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: Functions to export the tasks of a job to Parquet, CSV or
+#          JSON Lines files. Tasks are read from the database in fixed
+#          size chunks and the JSON payload columns are read as text
+#          so they are written without being decoded.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import json
+import csv
+import gzip
+import bz2
+import lzma
+import sqlalchemy
+from cjrlib import cjr_metrics
+from cjrlib.cjr_db_connection import CJRTaskInfo, CJRTaskUpdate, load_payloads, get_cjr_db_session
+
+EXPORT_FORMATS = ["JSONL", "CSV", "PARQUET"]
+EXPORT_COLUMNS = ["task_id", "job_name", "version", "start", "end", "params", "update_info", "end_info", "completed"]
+
+_text_compressors = {None: open, "gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+def _iter_task_chunks(db_ses_obj, job_name, version, chunk_size):
+    """
+    A generator which iterates through the tasks of a job (and version) in chunks, using keyset pagination on the
+    version and task ID. The JSON columns are returned as text, including the payloads within the payload store.
+
+    :return: yields lists of (task_id, job_name, version, start, end, params, update_info, end_info, completed)
+             tuples, where params, update_info and end_info are JSON strings.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    updt_tbl = CJRTaskUpdate.__table__
+    task_select = sqlalchemy.select([task_tbl.c.TaskID, task_tbl.c.JobName, task_tbl.c.Version,
+                                     task_tbl.c.StartTime, task_tbl.c.EndTime,
+                                     sqlalchemy.cast(task_tbl.c.TaskParams, sqlalchemy.Text),
+                                     sqlalchemy.cast(task_tbl.c.TaskUpdates, sqlalchemy.Text),
+                                     sqlalchemy.cast(task_tbl.c.TaskEndInfo, sqlalchemy.Text),
+                                     task_tbl.c.TaskCompleted, task_tbl.c.TaskParamsRef,
+                                     task_tbl.c.TaskEndInfoRef]).where(task_tbl.c.JobName == job_name)
+    if version is not None:
+        task_select = task_select.where(task_tbl.c.Version == version)
+
+    last_version = None
+    last_task_id = None
+    while True:
+        chunk_select = task_select
+        if last_task_id is not None:
+            chunk_select = chunk_select.where(sqlalchemy.or_(task_tbl.c.Version > last_version,
+                                                             sqlalchemy.and_(task_tbl.c.Version == last_version,
+                                                                             task_tbl.c.TaskID > last_task_id)))
+        task_rows = db_ses_obj.execute(chunk_select.order_by(task_tbl.c.Version, task_tbl.c.TaskID).
+                                       limit(chunk_size)).fetchall()
+        if len(task_rows) == 0:
+            break
+
+        # Get the updates for the tasks within the chunk, as JSON text.
+        task_updates = dict()
+        chunk_versions = dict()
+        for task_row in task_rows:
+            chunk_versions.setdefault(task_row[2], list()).append(task_row[0])
+        for chunk_version, chunk_task_ids in chunk_versions.items():
+            updt_rows = db_ses_obj.execute(
+                sqlalchemy.select([updt_tbl.c.TaskID, updt_tbl.c.UpdateTime,
+                                   sqlalchemy.cast(updt_tbl.c.UpdateInfo, sqlalchemy.Text)]).
+                where(sqlalchemy.and_(updt_tbl.c.JobName == job_name, updt_tbl.c.Version == chunk_version,
+                                      updt_tbl.c.TaskID.in_(chunk_task_ids))).
+                order_by(updt_tbl.c.UpdateTime))
+            for task_id, update_time, update_info in updt_rows:
+                if update_info is None:
+                    update_info = "null"
+                task_updates.setdefault((chunk_version, task_id), list()).\
+                    append("{}: {}".format(json.dumps(update_time.isoformat()), update_info))
+
+        # Get the payloads within the payload store for the tasks within the chunk, as JSON text (encoded as when
+        # the payload was stored).
+        payloads = dict()
+        for payload_hash, payload_copier in load_payloads(db_ses_obj, [payload_hash for task_row in task_rows
+                                                                       for payload_hash in task_row[9:]
+                                                                       if payload_hash is not None]).items():
+            payloads[payload_hash] = json.dumps(payload_copier(), sort_keys=True, separators=(",", ":"))
+
+        task_chunk = list()
+        for task_id, job_name_val, version_val, start_time, end_time, params, legacy_updates, end_info, \
+                completed, params_ref, end_info_ref in task_rows:
+            if params_ref is not None:
+                params = payloads[params_ref]
+            if end_info_ref is not None:
+                end_info = payloads[end_info_ref]
+            update_info = legacy_updates
+            if (version_val, task_id) in task_updates:
+                update_info = "{" + ", ".join(task_updates[(version_val, task_id)]) + "}"
+                if (legacy_updates is not None) and (legacy_updates != "null"):
+                    merged_updates = json.loads(legacy_updates)
+                    merged_updates.update(json.loads(update_info))
+                    update_info = json.dumps(merged_updates)
+            if not completed:
+                end_time = None
+            task_chunk.append((task_id, job_name_val, version_val, start_time, end_time, params, update_info,
+                               end_info, bool(completed)))
+        yield task_chunk
+
+        last_version = task_rows[-1][2]
+        last_task_id = task_rows[-1][0]
+
+
+def _datetime_to_str(date_time):
+    if date_time is None:
+        return None
+    return date_time.isoformat()
+
+
+def _json_or_null(json_str):
+    if json_str is None:
+        return "null"
+    return json_str
+
+
+def _export_jsonl(task_chunks, out_file, compression):
+    n_tasks = 0
+    with _text_compressors[compression](out_file, "wt") as out_file_obj:
+        for task_chunk in task_chunks:
+            lines = list()
+            for task_id, job_name, version, start_time, end_time, params, update_info, end_info, \
+                    completed in task_chunk:
+                lines.append('{{"task_id": {}, "job_name": {}, "version": {}, "start": {}, "end": {}, "params": {}, '
+                             '"update_info": {}, "end_info": {}, "completed": {}}}\n'.
+                             format(json.dumps(task_id), json.dumps(job_name), version,
+                                    json.dumps(_datetime_to_str(start_time)), json.dumps(_datetime_to_str(end_time)),
+                                    _json_or_null(params), _json_or_null(update_info), _json_or_null(end_info),
+                                    json.dumps(completed)))
+            out_file_obj.write("".join(lines))
+            n_tasks = n_tasks + len(task_chunk)
+    return n_tasks
+
+
+def _export_csv(task_chunks, out_file, compression):
+    n_tasks = 0
+    with _text_compressors[compression](out_file, "wt", newline="") as out_file_obj:
+        csv_writer = csv.writer(out_file_obj)
+        csv_writer.writerow(EXPORT_COLUMNS)
+        for task_chunk in task_chunks:
+            csv_writer.writerows([(task_id, job_name, version, _datetime_to_str(start_time),
+                                   _datetime_to_str(end_time), params, update_info, end_info, completed)
+                                  for task_id, job_name, version, start_time, end_time, params, update_info,
+                                      end_info, completed in task_chunk])
+            n_tasks = n_tasks + len(task_chunk)
+    return n_tasks
+
+
+def _export_parquet(task_chunks, out_file, compression):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("pyarrow is required to export to parquet - please install it.")
+    if compression is None:
+        compression = "none"
+    parquet_schema = pyarrow.schema([("task_id", pyarrow.string()), ("job_name", pyarrow.string()),
+                                     ("version", pyarrow.int64()), ("start", pyarrow.timestamp("us")),
+                                     ("end", pyarrow.timestamp("us")), ("params", pyarrow.string()),
+                                     ("update_info", pyarrow.string()), ("end_info", pyarrow.string()),
+                                     ("completed", pyarrow.bool_())])
+    n_tasks = 0
+    with pyarrow.parquet.ParquetWriter(out_file, parquet_schema, compression=compression) as parquet_writer:
+        for task_chunk in task_chunks:
+            task_cols = list(zip(*task_chunk))
+            parquet_writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(task_col, type=col_field.type)
+                                                                  for task_col, col_field in
+                                                                  zip(task_cols, parquet_schema)],
+                                                                 schema=parquet_schema))
+            n_tasks = n_tasks + len(task_chunk)
+    return n_tasks
+
+
+@cjr_metrics.timed_function("export_tasks")
+def export_tasks(job_name, out_file, out_format="JSONL", version=None, compression=None, chunk_size=10000,
+                 cjr_db_file=None):
+    """
+    A function which exports the tasks of a job, or a single version of a job, to a file. The tasks are read from
+    the database and written in chunks so memory use does not depend on the number of tasks. The params,
+    update_info and end_info fields are written as JSON (strings within CSV and Parquet files).
+
+    :param job_name: a string for the name of the job
+    :param out_file: the output file path.
+    :param out_format: the output format: JSONL (JSON Lines, one task per line), CSV or PARQUET (requires pyarrow).
+    :param version: an integer for the version of the tasks. If None then the tasks for all versions are exported.
+    :param compression: the compression for the output file. For JSONL and CSV files: None, gzip, bz2 or xz. For
+                        PARQUET files any compression supported by pyarrow (e.g., snappy, gzip, brotli, zstd).
+    :param chunk_size: the number of tasks read from the database and written at a time.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+
+    :return: the number of tasks exported.
+    """
+    out_format = out_format.upper()
+    if out_format not in EXPORT_FORMATS:
+        raise Exception("Do not recognise the export format '{}' - options are: {}".format(out_format,
+                                                                                          ", ".join(EXPORT_FORMATS)))
+    if (out_format != "PARQUET") and (compression not in _text_compressors):
+        raise Exception("Do not recognise the compression '{}' - options are: gzip, bz2, xz".format(compression))
+
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        task_chunks = _iter_task_chunks(db_ses_obj, job_name, version, chunk_size)
+        if out_format == "JSONL":
+            n_tasks = _export_jsonl(task_chunks, out_file, compression)
+        elif out_format == "CSV":
+            n_tasks = _export_csv(task_chunks, out_file, compression)
+        else:
+            n_tasks = _export_parquet(task_chunks, out_file, compression)
+    finally:
+        db_ses_obj.close()
+    return n_tasks
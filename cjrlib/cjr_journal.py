@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+cjr_journal - A local append only journal of task events which is flushed to the database in batches.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: A local append only journal of task events which is written
+#          to the database in batches, so recording an event does not
+#          block on the (possibly shared and busy) database.
+#
+#          Events are appended to the journal file. When flushed, the
+#          journal is renamed to '<journal>.flushing' and its events are
+#          written to the database in batches, with the offset of the
+#          last written batch stored in '<journal>.ack'. If the flush
+#          is interrupted the events after the acknowledged offset are
+#          replayed the next time the journal is flushed.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import os
+import os.path
+import json
+import datetime
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from cjrlib.cjr_job_status import JobStatus
+from cjrlib.cjr_db_connection import CJRDBConnection, iso_str_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _file_lock(lock_file, blocking=True):
+    """
+    A context manager which holds an exclusive lock on a lock file, used to coordinate the processes on a node
+    which are using the same journal. Yields True if the lock was acquired.
+
+    :param lock_file: path to the lock file.
+    :param blocking: if False and the lock is held by another process then yields False rather than waiting.
+
+    """
+    lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        locked = True
+        if fcntl is not None:
+            lock_flags = fcntl.LOCK_EX
+            if not blocking:
+                lock_flags = lock_flags | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_fd, lock_flags)
+            except (IOError, OSError):
+                locked = False
+        try:
+            yield locked
+        finally:
+            if locked and (fcntl is not None):
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    finally:
+        os.close(lock_fd)
+
+
+class CJRJournal:
+    """
+    A local journal of task events.
+    """
+
+    def __init__(self, journal_file):
+        """
+        :param journal_file: the path to the journal file, which should be on a local file system.
+        """
+        self.journal_file = journal_file
+        self.flushing_file = journal_file + ".flushing"
+        self.ack_file = journal_file + ".ack"
+        self.lock_file = journal_file + ".lock"
+        self.flush_lock_file = journal_file + ".flushlock"
+
+    def append(self, status, job_name, task_id, version, task_info, event_time=None):
+        """
+        A function which appends an event to the journal. The journal file is synced to disk before returning.
+
+        :param status: A JobStatus value specifying whether this is recording start, finish or an update.
+        :param job_name: The name of the job.
+        :param task_id: The unique name for the task within the job.
+        :param version: The version of the job and task.
+        :param task_info: A dictionary of information which is to be stored for the task.
+        :param event_time: the time of the event, if None then the current time is used.
+
+        """
+        if event_time is None:
+            event_time = datetime.datetime.now()
+        event = {"status": status.name, "job_name": job_name, "task_id": task_id, "version": version,
+                 "task_info": task_info, "time": event_time.isoformat()}
+        event_line = (json.dumps(event) + "\n").encode("utf-8")
+
+        with _file_lock(self.lock_file):
+            journal_fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # If a previous write was interrupted then terminate the partial line so this event can be read.
+                journal_size = os.fstat(journal_fd).st_size
+                if journal_size > 0:
+                    with open(self.journal_file, "rb") as journal_in:
+                        journal_in.seek(journal_size - 1)
+                        if journal_in.read(1) != b"\n":
+                            event_line = b"\n" + event_line
+                os.write(journal_fd, event_line)
+                os.fsync(journal_fd)
+            finally:
+                os.close(journal_fd)
+
+    def _read_ack(self):
+        if os.path.exists(self.ack_file):
+            with open(self.ack_file, "r") as ack_in:
+                ack_str = ack_in.read().strip()
+                if ack_str != "":
+                    return int(ack_str)
+        return 0
+
+    def _write_ack(self, offset):
+        tmp_ack_file = self.ack_file + ".tmp"
+        with open(tmp_ack_file, "w") as ack_out:
+            ack_out.write(str(offset))
+            ack_out.flush()
+            os.fsync(ack_out.fileno())
+        os.replace(tmp_ack_file, self.ack_file)
+
+    def _read_events(self, offset, max_batch):
+        """
+        A function which reads up to max_batch events from the flushing file, starting at offset.
+
+        :return: a list of event tuples and the offset of the end of the last line read.
+        """
+        events = list()
+        with open(self.flushing_file, "rb") as journal_in:
+            journal_in.seek(offset)
+            while len(events) < max_batch:
+                event_line = journal_in.readline()
+                if (len(event_line) == 0) or (not event_line.endswith(b"\n")):
+                    # End of the file or a partially written line.
+                    break
+                offset = offset + len(event_line)
+                if event_line.strip() == b"":
+                    continue
+                try:
+                    event = json.loads(event_line.decode("utf-8"))
+                    events.append((JobStatus[event["status"]], event["job_name"], event["task_id"],
+                                   event["version"], event["task_info"], iso_str_to_datetime(event["time"])))
+                except Exception as error:
+                    logger.warning("Skipping unreadable journal entry in '{}': {}".format(self.flushing_file,
+                                                                                          error))
+        return events, offset
+
+    def pending(self):
+        """
+        A function which returns whether there are events in the journal which have not been written to the database.
+
+        :return: boolean
+        """
+        for journal_file in [self.journal_file, self.flushing_file]:
+            if os.path.exists(journal_file) and (os.path.getsize(journal_file) > 0):
+                return True
+        return False
+
+    def flush(self, max_batch=500, print_progress=False):
+        """
+        A function which writes the events within the journal to the database, in batches of up to max_batch events
+        with a transaction per batch. Only one process can flush a journal at a time; if another process is flushing
+        the journal then this function returns immediately. If an error occurs writing to the database (e.g., the
+        database is not available) the error is raised and the events not written will be written the next time
+        the journal is flushed. Events are written at least once, so an event which was written to the database
+        before a crash, but not acknowledged in the journal, will be written again.
+
+        :param max_batch: the maximum number of events written in each transaction.
+        :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+        :return: a list of the events (as tuples) which were not recorded with the message why
+                 (e.g., a duplicate task start).
+        """
+        from cjrlib.cjr_recorder import record_task_statuses
+        failed_events = list()
+        with _file_lock(self.flush_lock_file, blocking=False) as locked:
+            if not locked:
+                return failed_events
+
+            while True:
+                if not os.path.exists(self.flushing_file):
+                    # Move the current journal aside so new events are appended to a new file.
+                    with _file_lock(self.lock_file):
+                        if (not os.path.exists(self.journal_file)) or (os.path.getsize(self.journal_file) == 0):
+                            break
+                        self._write_ack(0)
+                        os.replace(self.journal_file, self.flushing_file)
+
+                offset = self._read_ack()
+                while True:
+                    events, end_offset = self._read_events(offset, max_batch)
+                    if len(events) > 0:
+                        if print_progress:
+                            print("Flushing {} events from the journal.".format(len(events)))
+                        results = record_task_statuses(events, chunk_size=len(events))
+                        for event, (success, message) in zip(events, results):
+                            if not success:
+                                logger.warning("Journal event was not recorded: {}".format(message))
+                                failed_events.append((event, message))
+                    if end_offset == offset:
+                        break
+                    self._write_ack(end_offset)
+                    offset = end_offset
+
+                os.remove(self.flushing_file)
+                os.remove(self.ack_file)
+        return failed_events
+
+
+class CJRJournalFlusher(threading.Thread):
+    """
+    A background thread which periodically flushes a journal to the database.
+    """
+
+    def __init__(self, journal_file, flush_interval=5.0, max_batch=500):
+        """
+        :param journal_file: the path to the journal file.
+        :param flush_interval: the interval, in seconds, between flushes.
+        :param max_batch: the maximum number of events written in each transaction.
+        """
+        threading.Thread.__init__(self, name="CJRJournalFlusher")
+        self.daemon = True
+        self.journal = CJRJournal(journal_file)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        try:
+            self.journal.flush(self.max_batch)
+        except Exception as error:
+            # The events remain in the journal so will be written on the next flush.
+            logger.warning("Could not flush the journal to the database: {}".format(error))
+
+    def stop(self, timeout=None):
+        """
+        A function which stops the thread, after a final flush of the journal.
+
+        :param timeout: the maximum time (seconds) to wait for the thread to finish.
+
+        """
+        self._stop_event.set()
+        self.join(timeout)
+
+
+def start_journal_flusher():
+    """
+    A function which starts a background thread which flushes the journal defined by the CJRDBConnection
+    (i.e., using the CJR_JOURNAL_FILE environmental variable or CJRDBConnection.set_journal).
+
+    :return: the CJRJournalFlusher object, call stop() to do a final flush and stop the thread.
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    if cjrdb_conn.journal_file is None:
+        raise Exception("A journal file has not been defined.")
+    flusher = CJRJournalFlusher(cjrdb_conn.journal_file, cjrdb_conn.journal_flush_interval,
+                                cjrdb_conn.journal_max_batch)
+    flusher.start()
+    return flusher
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+"""
+cjr_metrics - Timing histograms and counters for the database operations, with export in the Prometheus text format.
+"""
+# This file is part of 'compute_job_recorder'
+# A library for recording compute job progress.
+#
+# Copyright 2026 agent
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Purpose: Timing histograms and counters for the database operations of
+#          the recorder and query functions, split into phases (e.g.,
+#          session, select, flush and commit), with optional sqlalchemy
+#          event hooks timing each SQL statement. The metrics are kept per
+#          process and can be read with get_metrics or exported in the
+#          Prometheus text format (format_prometheus/write_prometheus_file).
+#
+#          Metrics are disabled by default, when disabled the timers do
+#          nothing. They are enabled with enable_metrics or the following
+#          environmental variables:
+#              CJR_METRICS=1 - enable the metrics.
+#              CJR_METRICS_STATEMENTS=1 - also time each SQL statement.
+#              CJR_METRICS_FILE - a file the metrics are written to when the
+#                                 process exits, '{pid}' is replaced with the
+#                                 process ID.
+#
+# Author: agent
+# Email: agent@local
+# Date: 17/10/2026
+# Version: 1.0
+#
+# History:
+# Version 1.0 - Created 17/10/2026.
+
+import os
+import json
+import time
+import bisect
+import atexit
+import functools
+import threading
+
+# Upper bounds (seconds) of the histogram buckets.
+HISTOGRAM_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+_enabled = False
+_statement_hooks = False
+# Histograms keyed by (operation, phase): [bucket counts (the last is +Inf), sum, count].
+_histograms = dict()
+# Counters keyed by (name, operation).
+_counters = dict()
+_metrics_lock = threading.Lock()
+
+
+class _NullTimer:
+    """
+    The timer used when the metrics are disabled, which does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer:
+    """
+    A timer which adds the time within a with block to the histogram for an operation and phase.
+    """
+    __slots__ = ("operation", "phase", "start_time")
+
+    def __init__(self, operation, phase):
+        self.operation = operation
+        self.phase = phase
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        observe(self.operation, self.phase, time.perf_counter() - self.start_time)
+        if (exc_type is not None) and (self.phase == "total"):
+            inc_counter("errors", self.operation)
+        return False
+
+
+def metrics_enabled():
+    """
+    A function which returns whether the metrics are enabled.
+
+    :return: boolean
+    """
+    return _enabled
+
+
+def enable_metrics(statement_hooks=False):
+    """
+    A function which enables the metrics for this process.
+
+    :param statement_hooks: if True then sqlalchemy event hooks are added to time each SQL statement
+                            (operation 'sql', with the statement type, e.g. SELECT or INSERT, as the phase).
+
+    """
+    global _enabled
+    _enabled = True
+    if statement_hooks:
+        _add_statement_hooks()
+
+
+def disable_metrics():
+    """
+    A function which disables the metrics, including the SQL statement hooks. The recorded metrics are kept.
+    """
+    global _enabled
+    _enabled = False
+    _remove_statement_hooks()
+
+
+def reset_metrics():
+    """
+    A function which removes all the recorded metrics.
+    """
+    with _metrics_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def timed(operation, phase="total"):
+    """
+    A function which gets a context manager timing the with block for an operation and phase; if the phase is
+    'total' and an exception is raised within the block the 'errors' counter for the operation is incremented.
+    If the metrics are disabled the context manager does nothing.
+
+        with cjr_metrics.timed("record_task_start", "commit"):
+            db_ses_obj.commit()
+
+    :param operation: the name of the operation (e.g., the function name).
+    :param phase: the name of the phase within the operation.
+
+    :return: context manager
+    """
+    if not _enabled:
+        return _null_timer
+    return _Timer(operation, phase)
+
+
+def timed_function(operation):
+    """
+    A decorator which times each call of a function (phase 'total') and counts the calls which raise an exception.
+    If the metrics are disabled the function is called directly.
+
+    :param operation: the name of the operation.
+
+    :return: the decorator.
+    """
+    def _timed_decorator(func):
+        @functools.wraps(func)
+        def _timed_func(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(operation, "total"):
+                return func(*args, **kwargs)
+        return _timed_func
+    return _timed_decorator
+
+
+def observe(operation, phase, duration):
+    """
+    A function which adds a duration to the histogram for an operation and phase.
+
+    :param operation: the name of the operation.
+    :param phase: the name of the phase within the operation.
+    :param duration: the duration in seconds.
+
+    """
+    i_bucket = bisect.bisect_left(HISTOGRAM_BUCKETS, duration)
+    with _metrics_lock:
+        histogram = _histograms.get((operation, phase), None)
+        if histogram is None:
+            histogram = [[0] * (len(HISTOGRAM_BUCKETS) + 1), 0.0, 0]
+            _histograms[(operation, phase)] = histogram
+        histogram[0][i_bucket] += 1
+        histogram[1] += duration
+        histogram[2] += 1
+
+
+def inc_counter(name, operation, value=1):
+    """
+    A function which increments a counter, if the metrics are enabled.
+
+    :param name: the name of the counter (e.g., 'errors' or 'db_lock_retries').
+    :param operation: the name of the operation the counter is for.
+    :param value: the value added to the counter.
+
+    """
+    if not _enabled:
+        return
+    with _metrics_lock:
+        _counters[(name, operation)] = _counters.get((name, operation), 0) + value
+
+
+def json_dumps(json_obj):
+    """
+    The JSON serialiser used by the database engines (see cjrlib.cjr_db_connection), which times the
+    serialisation (operation 'json', phase 'serialise') when the metrics are enabled.
+    """
+    if not _enabled:
+        return json.dumps(json_obj)
+    with _Timer("json", "serialise"):
+        return json.dumps(json_obj)
+
+
+def _before_cursor_execute(db_conn, cursor, statement, parameters, context, executemany):
+    db_conn.info.setdefault("cjr_statement_start", list()).append(time.perf_counter())
+
+
+def _after_cursor_execute(db_conn, cursor, statement, parameters, context, executemany):
+    start_times = db_conn.info.get("cjr_statement_start", None)
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    if _enabled:
+        statement_words = statement.lstrip().split(None, 1)
+        observe("sql", statement_words[0].upper() if len(statement_words) > 0 else "", duration)
+
+
+def _add_statement_hooks():
+    global _statement_hooks
+    if _statement_hooks:
+        return
+    import sqlalchemy.engine
+    import sqlalchemy.event
+    # Listening on the Engine class adds the hooks to all the engines, including those already created.
+    sqlalchemy.event.listen(sqlalchemy.engine.Engine, "before_cursor_execute", _before_cursor_execute)
+    sqlalchemy.event.listen(sqlalchemy.engine.Engine, "after_cursor_execute", _after_cursor_execute)
+    _statement_hooks = True
+
+
+def _remove_statement_hooks():
+    global _statement_hooks
+    if not _statement_hooks:
+        return
+    import sqlalchemy.engine
+    import sqlalchemy.event
+    sqlalchemy.event.remove(sqlalchemy.engine.Engine, "before_cursor_execute", _before_cursor_execute)
+    sqlalchemy.event.remove(sqlalchemy.engine.Engine, "after_cursor_execute", _after_cursor_execute)
+    _statement_hooks = False
+
+
+def get_metrics():
+    """
+    A function which gets a copy of the metrics recorded by this process.
+
+    :return: dict with 'histograms', a dict keyed by operation of dicts keyed by phase with the count, sum
+             (seconds) and buckets (a list of (upper bound, cumulative count) tuples, the last upper bound is
+             float('inf')), and 'counters', a dict keyed by counter name of dicts keyed by operation.
+    """
+    metrics = {"histograms": dict(), "counters": dict()}
+    with _metrics_lock:
+        for (operation, phase), (bucket_counts, duration_sum, count) in _histograms.items():
+            cumulative_counts = list()
+            cumulative_count = 0
+            for bucket_count in bucket_counts:
+                cumulative_count = cumulative_count + bucket_count
+                cumulative_counts.append(cumulative_count)
+            metrics["histograms"].setdefault(operation, dict())[phase] = {
+                "count": count, "sum": duration_sum,
+                "buckets": list(zip(HISTOGRAM_BUCKETS + [float("inf")], cumulative_counts))}
+        for (name, operation), value in _counters.items():
+            metrics["counters"].setdefault(name, dict())[operation] = value
+    return metrics
+
+
+def _prom_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_prometheus():
+    """
+    A function which formats the metrics recorded by this process in the Prometheus text exposition format.
+    Each metric has a 'pid' label so the files written by a number of processes can be collected together.
+
+    :return: string
+    """
+    metrics = get_metrics()
+    pid = os.getpid()
+    prom_lines = list()
+    prom_lines.append("# HELP cjr_operation_duration_seconds Time spent within each operation and phase.")
+    prom_lines.append("# TYPE cjr_operation_duration_seconds histogram")
+    for operation in sorted(metrics["histograms"]):
+        for phase in sorted(metrics["histograms"][operation]):
+            histogram = metrics["histograms"][operation][phase]
+            labels = 'operation="{}",phase="{}",pid="{}"'.format(_prom_label(operation), _prom_label(phase), pid)
+            for upper_bound, cumulative_count in histogram["buckets"]:
+                le_str = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+                prom_lines.append('cjr_operation_duration_seconds_bucket{{{},le="{}"}} {}'.format(labels, le_str,
+                                                                                                 cumulative_count))
+            prom_lines.append("cjr_operation_duration_seconds_sum{{{}}} {!r}".format(labels, histogram["sum"]))
+            prom_lines.append("cjr_operation_duration_seconds_count{{{}}} {}".format(labels, histogram["count"]))
+    for name in sorted(metrics["counters"]):
+        prom_lines.append("# TYPE cjr_{}_total counter".format(name))
+        for operation in sorted(metrics["counters"][name]):
+            prom_lines.append('cjr_{}_total{{operation="{}",pid="{}"}} {}'.format(
+                name, _prom_label(operation), pid, metrics["counters"][name][operation]))
+    return "\n".join(prom_lines) + "\n"
+
+
+def write_prometheus_file(out_file):
+    """
+    A function which writes the metrics recorded by this process to a file in the Prometheus text format
+    (e.g., for the node exporter textfile collector). The file is replaced atomically.
+
+    :param out_file: the output file path, '{pid}' is replaced with the process ID.
+
+    """
+    out_file = out_file.replace("{pid}", str(os.getpid()))
+    tmp_out_file = "{}.{}.tmp".format(out_file, os.getpid())
+    with open(tmp_out_file, "w") as out_file_obj:
+        out_file_obj.write(format_prometheus())
+    os.replace(tmp_out_file, out_file)
+
+
+def _write_metrics_at_exit():
+    if _enabled and (os.environ.get('CJR_METRICS_FILE', '') != ''):
+        write_prometheus_file(os.environ['CJR_METRICS_FILE'])
+
+
+if os.environ.get('CJR_METRICS', '').lower() in ['1', 'true', 'yes']:
+    enable_metrics(statement_hooks=os.environ.get('CJR_METRICS_STATEMENTS', '').lower() in ['1', 'true', 'yes'])
+atexit.register(_write_metrics_at_exit)
@@ -29,150 +29,693 @@ cjr_queries - Class to query job progress database.
 # History:
 # Version 1.0 - Created.
 
+import os
+import json
+import base64
+import hashlib
+import time
+import datetime
+import threading
 import sqlalchemy
-from cjrlib.cjr_db_connection import CJRDBConnection, CJRJobName, CJRTaskInfo, task_to_dict
+from cjrlib import cjr_metrics
+from cjrlib.cjr_db_connection import CJRJobName, CJRTaskInfo, task_to_dict, get_task_updates, get_task_fields, \
+                                     task_fields_load_only, iso_str_to_datetime, get_catalog_generation, \
+                                     get_task_payloads, get_cjr_db_session, get_cjr_db_url
 
+# Time (seconds) the cached job names and versions are used without checking the catalog generation of the
+# database. Once expired, the cache is used if the catalog generation has not changed, otherwise the job
+# names or versions are read again. If negative then the job names and versions are not cached.
+CJR_CATALOG_CACHE_TTL = float(os.environ.get('CJR_CATALOG_CACHE_TTL', 5.0))
 
-def query_job_names(cjr_db_file=None):
+# Time (seconds) before the cursor of get_tasks_changed_since which is read again on each call, so tasks whose
+# LastModified time is before the cursor (i.e., a transaction which committed late or a recording process with
+# a slow clock) are still returned. It should be larger than the clock differences between the recording
+# processes and the duration of the recording transactions.
+CJR_CHANGES_OVERLAP = float(os.environ.get('CJR_CHANGES_OVERLAP', 30.0))
+
+# Cache of [value, catalog generation, time checked] lists keyed by (database URL, query, job name).
+_catalog_cache = dict()
+_catalog_cache_lock = threading.Lock()
+
+
+# The maximum number of task IDs listed within a query for the updates of the tasks.
+_MAX_QUERY_TASK_IDS = 500
+
+
+def _get_query_task_updates(db_ses_obj, job_name, version, task_rcds, task_completed=None):
     """
-    A function to retrieve a list of job names within the database.
+    A function which gets the updates for the tasks returned by a query on a job version (see
+    cjrlib.cjr_db_connection.get_task_updates). For a small number of tasks the task IDs are listed within the
+    query, otherwise the updates of the job version are read, limited to the tasks with the same completion
+    state as those returned by the query.
+
+    :param task_rcds: the list of CJRTaskInfo records.
+    :param task_completed: None if the query returned both the completed and uncompleted tasks, otherwise the
+                           TaskCompleted value of all the records within task_rcds.
+
+    :return: dictionary of updates keyed by the task ID.
+    """
+    if len(task_rcds) == 0:
+        return dict()
+    if len(task_rcds) <= _MAX_QUERY_TASK_IDS:
+        task_ids = [task_rcd.TaskID for task_rcd in task_rcds]
+        return get_task_updates(db_ses_obj, job_name, version, task_ids=task_ids)
+    return get_task_updates(db_ses_obj, job_name, version, task_completed=task_completed)
 
-    :return: list of strings.
 
+def invalidate_catalog_cache(cjr_db_file=None):
     """
-    if cjr_db_file is None:
-        cjrdb_conn = CJRDBConnection()
-        if cjrdb_conn is None:
-            raise Exception("Could not create the connection object...")
-        db_ses_obj = cjrdb_conn.get_db_session()
-    else:
-        db_engine = sqlalchemy.create_engine(cjr_db_file)
-        ses_sqlalc = sqlalchemy.orm.sessionmaker(bind=db_engine)
-        db_ses_obj = ses_sqlalc()
+    A function which removes the cached job names and versions, so they are read from the database on the
+    next call of query_job_names or get_job_versions. This is called by the recorder when it adds a job
+    name or version; changes made by other processes are found using the catalog generation of the database.
 
+    :param cjr_db_file: the database URL. If None then the cache is cleared for all the databases.
+
+    """
+    with _catalog_cache_lock:
+        if cjr_db_file is None:
+            _catalog_cache.clear()
+        else:
+            for cache_key in list(_catalog_cache.keys()):
+                if cache_key[0] == cjr_db_file:
+                    del _catalog_cache[cache_key]
+
+
+def _read_catalog_cached(cache_key, read_func, db_ses_obj, use_cache):
+    """
+    A function which gets the value for cache_key from the catalog cache, calling read_func(db_ses_obj) to
+    read the value from the database if it is not cached or the catalog generation has changed.
+    """
+    if (not use_cache) or (CJR_CATALOG_CACHE_TTL < 0):
+        return read_func(db_ses_obj)
+
+    with _catalog_cache_lock:
+        cache_entry = _catalog_cache.get(cache_key, None)
+        if (cache_entry is not None) and ((time.monotonic() - cache_entry[2]) < CJR_CATALOG_CACHE_TTL):
+            cjr_metrics.inc_counter("catalog_cache_hits", cache_key[1])
+            return list(cache_entry[0])
+
+    # The generation is read before the value so a change made in between is found on the next check.
+    catalog_generation = get_catalog_generation(db_ses_obj)
+    if (cache_entry is not None) and (catalog_generation is not None) and (catalog_generation == cache_entry[1]):
+        cjr_metrics.inc_counter("catalog_cache_hits", cache_key[1])
+        with _catalog_cache_lock:
+            cache_entry[2] = time.monotonic()
+        return list(cache_entry[0])
+
+    cjr_metrics.inc_counter("catalog_cache_misses", cache_key[1])
+    value = read_func(db_ses_obj)
+    if catalog_generation is not None:
+        with _catalog_cache_lock:
+            _catalog_cache[cache_key] = [value, catalog_generation, time.monotonic()]
+    return list(value)
+
+
+def _read_job_names(db_ses_obj):
+    # Only the job names with tasks within the database, so the jobs which have been fully archived are not listed.
     job_names = list()
-    qury_rslt = db_ses_obj.query(CJRJobName).all()
+    qury_rslt = db_ses_obj.query(CJRJobName).\
+        filter(sqlalchemy.exists().where(CJRTaskInfo.JobName == CJRJobName.JobName)).all()
     if qury_rslt is not None:
         for job_name_rcd in qury_rslt:
             job_names.append(job_name_rcd.JobName)
-    db_ses_obj.close()
+    return job_names
+
+
+@cjr_metrics.timed_function("query_job_names")
+def query_job_names(cjr_db_file=None, use_cache=True, include_archived=False):
+    """
+    A function to retrieve a list of job names within the database. The job names are cached within the
+    process (see CJR_CATALOG_CACHE_TTL).
+
+    :param use_cache: if False then the job names are read from the database rather than the cache.
+    :param include_archived: if True then the jobs whose versions have all been archived (see
+                             cjrlib.cjr_archive) are also returned.
+
+    :return: list of strings.
+
+    """
+    cache_key = (get_cjr_db_url(cjr_db_file), "query_job_names", None)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        job_names = _read_catalog_cached(cache_key, _read_job_names, db_ses_obj, use_cache)
+    finally:
+        db_ses_obj.close()
 
+    if include_archived:
+        from cjrlib.cjr_archive import get_archived_versions
+        for archived_version in get_archived_versions(cjr_db_file=cjr_db_file):
+            if archived_version['job_name'] not in job_names:
+                job_names.append(archived_version['job_name'])
     return job_names
 
-def get_job_versions(job_name, cjr_db_file=None):
+@cjr_metrics.timed_function("get_job_versions")
+def get_job_versions(job_name, cjr_db_file=None, use_cache=True, include_archived=False):
     """
-    A function which retrieves the list of versions available for a job.
+    A function which retrieves the list of versions available for a job. The versions are cached within the
+    process (see CJR_CATALOG_CACHE_TTL).
     :param job_name: the name of the job
+    :param use_cache: if False then the versions are read from the database rather than the cache.
+    :param include_archived: if True then the versions which have been archived (see cjrlib.cjr_archive)
+                             are also returned.
     :return: list of integers
     """
-    if cjr_db_file is None:
-        cjrdb_conn = CJRDBConnection()
-        if cjrdb_conn is None:
-            raise Exception("Could not create the connection object...")
-        db_ses_obj = cjrdb_conn.get_db_session()
-    else:
-        db_engine = sqlalchemy.create_engine(cjr_db_file)
-        ses_sqlalc = sqlalchemy.orm.sessionmaker(bind=db_engine)
-        db_ses_obj = ses_sqlalc()
-
-    versions_lst = list()
-    qury_rslt = db_ses_obj.query(CJRTaskInfo.Version).filter(CJRTaskInfo.JobName == job_name).distinct().all()
-    if qury_rslt is not None:
-        for version_rcd in qury_rslt:
-            versions_lst.append(version_rcd.Version)
-    db_ses_obj.close()
+    def _read_job_versions(db_ses_obj):
+        versions_lst = list()
+        qury_rslt = db_ses_obj.query(CJRTaskInfo.Version).filter(CJRTaskInfo.JobName == job_name).distinct().all()
+        if qury_rslt is not None:
+            for version_rcd in qury_rslt:
+                versions_lst.append(version_rcd.Version)
+        return versions_lst
+
+    cache_key = (get_cjr_db_url(cjr_db_file), "get_job_versions", job_name)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        versions_lst = _read_catalog_cached(cache_key, _read_job_versions, db_ses_obj, use_cache)
+    finally:
+        db_ses_obj.close()
 
+    if include_archived:
+        from cjrlib.cjr_archive import get_archived_versions
+        for archived_version in get_archived_versions(job_name, cjr_db_file):
+            if archived_version['version'] not in versions_lst:
+                versions_lst.append(archived_version['version'])
     return versions_lst
 
 
-def get_all_tasks(job_name, version, datetimeobjs=False, cjr_db_file=None):
+@cjr_metrics.timed_function("get_all_tasks")
+def get_all_tasks(job_name, version, datetimeobjs=False, cjr_db_file=None, fields=None, include_payload=True,
+                  include_archived=False):
     """
     A function which retrieves all the tasks associated with a job and version
 
     :param job_name: a string for the name of the job
     :param version: an integer for the version of the task.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned, reducing the data read from the database.
+    :param include_archived: if True and the version has been archived (see cjrlib.cjr_archive) then the
+                             tasks are read from the archive file.
 
     :return: returns a list of dictionaries of the tasks
     """
-    if cjr_db_file is None:
-        cjrdb_conn = CJRDBConnection()
-        if cjrdb_conn is None:
-            raise Exception("Could not create the connection object...")
-        db_ses_obj = cjrdb_conn.get_db_session()
-    else:
-        db_engine = sqlalchemy.create_engine(cjr_db_file)
-        ses_sqlalc = sqlalchemy.orm.sessionmaker(bind=db_engine)
-        db_ses_obj = ses_sqlalc()
+    fields = get_task_fields(fields, include_payload)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
 
     task_lst = list()
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name,
-                                                     CJRTaskInfo.Version == version).all()
+    qury_rslt = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(fields)).\
+                           filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version).all()
     if qury_rslt is not None:
+        task_updates = dict()
+        if 'update_info' in fields:
+            task_updates = _get_query_task_updates(db_ses_obj, job_name, version, qury_rslt)
+        payloads = get_task_payloads(db_ses_obj, qury_rslt, fields)
         for task_rcd in qury_rslt:
-            task_lst.append(task_to_dict(task_rcd, datetimeobjs))
+            task_lst.append(task_to_dict(task_rcd, datetimeobjs, task_updates.get(task_rcd.TaskID), fields,
+                                         payloads))
     db_ses_obj.close()
 
+    if include_archived and (len(task_lst) == 0):
+        from cjrlib.cjr_archive import read_archived_tasks
+        archived_tasks = read_archived_tasks(job_name, version, None, datetimeobjs, cjr_db_file, fields)
+        if archived_tasks is not None:
+            task_lst = archived_tasks
     return task_lst
 
 
-def get_uncompleted_tasks(job_name, version, datetimeobjs=False, cjr_db_file=None):
+@cjr_metrics.timed_function("get_uncompleted_tasks")
+def get_uncompleted_tasks(job_name, version, datetimeobjs=False, cjr_db_file=None, fields=None,
+                          include_payload=True):
     """
     A function which retrieves the uncompleted tasks associated with a job and version
 
     :param job_name: a string for the name of the job
     :param version: an integer for the version of the task.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned, reducing the data read from the database.
 
     :return: returns a list of dictionaries of the tasks
     """
-    if cjr_db_file is None:
-        cjrdb_conn = CJRDBConnection()
-        if cjrdb_conn is None:
-            raise Exception("Could not create the connection object...")
-        db_ses_obj = cjrdb_conn.get_db_session()
-    else:
-        db_engine = sqlalchemy.create_engine(cjr_db_file)
-        ses_sqlalc = sqlalchemy.orm.sessionmaker(bind=db_engine)
-        db_ses_obj = ses_sqlalc()
+    fields = get_task_fields(fields, include_payload)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
 
     task_lst = list()
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name,
-                                                     CJRTaskInfo.Version == version,
-                                                     CJRTaskInfo.TaskCompleted == False).all()
+    qury_rslt = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(fields)).\
+                           filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version,
+                                  CJRTaskInfo.TaskCompleted == False).all()
     if qury_rslt is not None:
+        task_updates = dict()
+        if 'update_info' in fields:
+            task_updates = _get_query_task_updates(db_ses_obj, job_name, version, qury_rslt, task_completed=False)
+        payloads = get_task_payloads(db_ses_obj, qury_rslt, fields)
         for task_rcd in qury_rslt:
-            task_lst.append(task_to_dict(task_rcd, datetimeobjs))
+            task_lst.append(task_to_dict(task_rcd, datetimeobjs, task_updates.get(task_rcd.TaskID), fields,
+                                         payloads))
     db_ses_obj.close()
 
     return task_lst
 
 
-def get_task(job_name, task_id, version, datetimeobjs=False, cjr_db_file=None):
+@cjr_metrics.timed_function("get_stalled_tasks")
+def get_stalled_tasks(job_name, version, older_than, datetimeobjs=False, cjr_db_file=None, fields=None,
+                      include_payload=False):
+    """
+    A function which retrieves the uncompleted tasks associated with a job and version which have not been
+    started or updated (i.e., their last heartbeat) within a period of time. This is a single indexed range
+    query on the LastHeartbeat column, so can be run regularly (e.g., by a watchdog) for large jobs.
+
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task.
+    :param older_than: the period without a heartbeat for a task to be stalled, either a datetime.timedelta
+                       or a number of seconds.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if True then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are also returned (Default: False).
+
+    :return: returns a list of dictionaries of the tasks, ordered by the last heartbeat (oldest first).
+    """
+    if not isinstance(older_than, datetime.timedelta):
+        older_than = datetime.timedelta(seconds=older_than)
+    heartbeat_before = datetime.datetime.now() - older_than
+    fields = get_task_fields(fields, include_payload)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+
+    task_lst = list()
+    qury_rslt = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(fields)).\
+                           filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version,
+                                  CJRTaskInfo.TaskCompleted == False,
+                                  CJRTaskInfo.LastHeartbeat < heartbeat_before).\
+                           order_by(CJRTaskInfo.LastHeartbeat).all()
+    if qury_rslt is not None:
+        task_updates = dict()
+        if 'update_info' in fields:
+            task_updates = _get_query_task_updates(db_ses_obj, job_name, version, qury_rslt, task_completed=False)
+        payloads = get_task_payloads(db_ses_obj, qury_rslt, fields)
+        for task_rcd in qury_rslt:
+            task_lst.append(task_to_dict(task_rcd, datetimeobjs, task_updates.get(task_rcd.TaskID), fields,
+                                         payloads))
+    db_ses_obj.close()
+
+    return task_lst
+
+
+@cjr_metrics.timed_function("get_task")
+def get_task(job_name, task_id, version, datetimeobjs=False, cjr_db_file=None, fields=None, include_payload=True,
+             include_archived=False):
     """
     A function which retrieves the tasks associated with a job name and ID.
 
     :param job_name: a string for the name of the job
     :param task_id: n string for the task ID.
     :param version: an integer for the version of the task.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned, reducing the data read from the database.
+    :param include_archived: if True and the version has been archived (see cjrlib.cjr_archive) then the
+                             task is read from the archive file.
 
     :return: returns a dictionary of the task or None if not task not present
     """
-    if cjr_db_file is None:
-        cjrdb_conn = CJRDBConnection()
-        if cjrdb_conn is None:
-            raise Exception("Could not create the connection object...")
-        db_ses_obj = cjrdb_conn.get_db_session()
-    else:
-        db_engine = sqlalchemy.create_engine(cjr_db_file)
-        ses_sqlalc = sqlalchemy.orm.sessionmaker(bind=db_engine)
-        db_ses_obj = ses_sqlalc()
+    fields = get_task_fields(fields, include_payload)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
 
-    task_lst = list()
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name,
-                                                     CJRTaskInfo.TaskID == task_id,
-                                                     CJRTaskInfo.Version == version).one_or_none()
+    qury_rslt = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(fields)).\
+                           filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.TaskID == task_id,
+                                  CJRTaskInfo.Version == version).one_or_none()
     task = None
     if qury_rslt is not None:
-        task = task_to_dict(qury_rslt, datetimeobjs)
+        task_updates = dict()
+        if 'update_info' in fields:
+            task_updates = get_task_updates(db_ses_obj, job_name, version, task_id)
+        payloads = get_task_payloads(db_ses_obj, [qury_rslt], fields)
+        task = task_to_dict(qury_rslt, datetimeobjs, task_updates.get(task_id), fields, payloads)
     db_ses_obj.close()
 
+    if include_archived and (task is None):
+        from cjrlib.cjr_archive import read_archived_tasks
+        archived_tasks = read_archived_tasks(job_name, version, task_id, datetimeobjs, cjr_db_file, fields)
+        if archived_tasks:
+            task = archived_tasks[0]
     return task
+
+
+def iter_tasks(job_name, version, completed=None, batch_size=1000, after_task_id=None, datetimeobjs=False,
+               cjr_db_file=None, fields=None, include_payload=True):
+    """
+    A generator which iterates through the tasks associated with a job and version, ordered by the task ID.
+    The tasks are retrieved from the database in batches using keyset pagination on the task ID, so memory
+    use does not depend on the number of tasks.
+
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task.
+    :param completed: if None all the tasks are returned, if True only the completed tasks and if False only
+                      the uncompleted tasks.
+    :param batch_size: the number of tasks retrieved from the database in each query.
+    :param after_task_id: if not None then only tasks with a task ID after this value are returned. This can
+                          be used to resume an iteration, by providing the 'task_id' of the last task returned.
+    :param datetimeobjs: If true the start and end fields are python datetime objects rather than nested dictionaries.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned, reducing the data read from the database.
+
+    :return: yields dictionaries of the tasks
+    """
+    fields = get_task_fields(fields, include_payload)
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        while True:
+            qury = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(fields)).\
+                              filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version)
+            if completed is not None:
+                qury = qury.filter(CJRTaskInfo.TaskCompleted == completed)
+            if after_task_id is not None:
+                qury = qury.filter(CJRTaskInfo.TaskID > after_task_id)
+            task_rcds = qury.order_by(CJRTaskInfo.TaskID).limit(batch_size).all()
+            if len(task_rcds) == 0:
+                break
+
+            task_ids = [task_rcd.TaskID for task_rcd in task_rcds]
+            task_updates = dict()
+            if 'update_info' in fields:
+                task_updates = get_task_updates(db_ses_obj, job_name, version, task_ids=task_ids)
+            payloads = get_task_payloads(db_ses_obj, task_rcds, fields)
+            task_dicts = [task_to_dict(task_rcd, datetimeobjs, task_updates.get(task_rcd.TaskID), fields, payloads)
+                          for task_rcd in task_rcds]
+            # Release the records so the session does not grow with the number of tasks.
+            db_ses_obj.expunge_all()
+            db_ses_obj.commit()
+            del task_rcds
+            for task_dict in task_dicts:
+                yield task_dict
+
+            if len(task_ids) < batch_size:
+                break
+            after_task_id = task_ids[-1]
+    finally:
+        db_ses_obj.close()
+
+
+def _get_changed_task_hash(task_rcd):
+    """
+    A function which gets a hash identifying a change to a task (i.e., the task key and its LastModified time),
+    used to record the changes returned within the overlap window of the cursor.
+    """
+    change_str = "{}\0{}\0{}\0{}".format(task_rcd.JobName, task_rcd.Version, task_rcd.TaskID,
+                                           task_rcd.LastModified.isoformat())
+    return hashlib.sha1(change_str.encode("utf-8")).digest()[:8]
+
+
+def _encode_changed_cursor(last_modified, change_hashes):
+    return json.dumps([last_modified.isoformat(), base64.b64encode(b"".join(sorted(change_hashes))).decode("ascii")])
+
+
+def _decode_changed_cursor(cursor):
+    try:
+        cursor_vals = json.loads(cursor)
+        if len(cursor_vals) == 4:
+            # Cursors from earlier versions are the key of the last task returned.
+            return iso_str_to_datetime(cursor_vals[0]), set()
+        modified_str, change_hashes_str = cursor_vals
+        change_hashes_bytes = base64.b64decode(change_hashes_str.encode("ascii"))
+        change_hashes = set([change_hashes_bytes[i:i + 8] for i in range(0, len(change_hashes_bytes), 8)])
+        return iso_str_to_datetime(modified_str), change_hashes
+    except Exception:
+        raise Exception("The cursor '{}' is not valid - use a cursor returned by "
+                        "get_tasks_changed_since.".format(cursor))
+
+
+@cjr_metrics.timed_function("get_tasks_changed_since")
+def get_tasks_changed_since(cursor=None, job_name=None, version=None, limit=1000, datetimeobjs=False,
+                            cjr_db_file=None, fields=None, include_payload=True, overlap=None):
+    """
+    A function which retrieves the tasks which have been started, updated or finished since a cursor returned by
+    a previous call, ordered by the time they were last modified. The query uses the index on the LastModified
+    column, so the cost depends on the number of changed tasks rather than the number of tasks in the database.
+    To follow the changes call the function repeatedly, passing the returned cursor each time.
+
+    The LastModified times are set by the clock of the process recording the task, so a task can be committed
+    with a time before the cursor (i.e., a transaction which committed late or a recording process with a slow
+    clock). Therefore, each call reads again the tasks modified within the overlap (seconds) before the cursor
+    and returns those which have not already been returned; the cursor records the changes returned within
+    the overlap, so its size depends on the number of tasks modified within the overlap. A task modified more
+    than the overlap before the cursor is missed until it is next modified. The cursor does not advance past
+    the current time of the calling process, so a recording process with a fast clock does not cause later
+    changes to be missed.
+
+    :param cursor: the cursor returned by a previous call. If None then all the tasks are returned (in pages of
+                   up to limit tasks).
+    :param job_name: optionally a string for the name of the job, if None then the tasks of all the jobs are returned.
+    :param version: optionally an integer for the version of the tasks, if None then all the versions are returned.
+    :param limit: the maximum number of tasks returned; if limit tasks are returned then call again with the
+                  returned cursor to get the remaining changes.
+    :param datetimeobjs: If true the start and end fields are python datetime objects rather than nested dictionaries.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+    :param fields: optionally a list of the fields to be returned for each task (see
+                   cjrlib.cjr_db_connection.TASK_FIELDS). Only the columns needed are read from the database.
+    :param include_payload: if False then the JSON payload fields ('params', 'update_info' and 'end_info')
+                            are not returned, reducing the data read from the database.
+    :param overlap: the time (seconds) before the cursor which is read again. If None then CJR_CHANGES_OVERLAP
+                    (the CJR_CHANGES_OVERLAP environmental variable or 30 seconds) is used.
+
+    :return: a (tasks, cursor) tuple, where tasks is a list of dictionaries of the tasks and cursor is a string to
+             be passed to the next call (the cursor passed in is returned if there are no changes).
+    """
+    if overlap is None:
+        overlap = CJR_CHANGES_OVERLAP
+    overlap_delta = datetime.timedelta(seconds=overlap)
+    fields = get_task_fields(fields, include_payload)
+    # The key columns are needed for the cursor and to get the updates for the tasks.
+    load_fields = list(fields)
+    for key_field in ['task_id', 'job_name', 'version', 'last_modified']:
+        if key_field not in load_fields:
+            load_fields.append(key_field)
+
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        qury = db_ses_obj.query(CJRTaskInfo).options(task_fields_load_only(load_fields)).\
+                          filter(CJRTaskInfo.LastModified.isnot(None))
+        if job_name is not None:
+            qury = qury.filter(CJRTaskInfo.JobName == job_name)
+        if version is not None:
+            qury = qury.filter(CJRTaskInfo.Version == version)
+        last_modified = None
+        change_hashes = set()
+        if cursor is not None:
+            last_modified, change_hashes = _decode_changed_cursor(cursor)
+            qury = qury.filter(CJRTaskInfo.LastModified >= (last_modified - overlap_delta))
+        # Enough tasks are read for limit tasks to be returned in addition to those already returned.
+        qury_rcds = qury.order_by(CJRTaskInfo.LastModified, CJRTaskInfo.JobName, CJRTaskInfo.Version,
+                                  CJRTaskInfo.TaskID).limit(limit + len(change_hashes)).all()
+
+        task_rcds = list()
+        window_hashes = list()
+        unread_hashes = set(change_hashes)
+        for task_rcd in qury_rcds:
+            change_hash = _get_changed_task_hash(task_rcd)
+            if change_hash in change_hashes:
+                unread_hashes.discard(change_hash)
+                window_hashes.append((task_rcd.LastModified, change_hash))
+            elif len(task_rcds) < limit:
+                task_rcds.append(task_rcd)
+                window_hashes.append((task_rcd.LastModified, change_hash))
+
+        task_updates = dict()
+        if 'update_info' in fields:
+            job_vers_tasks = dict()
+            for task_rcd in task_rcds:
+                job_vers_tasks.setdefault((task_rcd.JobName, task_rcd.Version), list()).append(task_rcd.TaskID)
+            for (task_job_name, task_version), task_ids in job_vers_tasks.items():
+                for task_id, task_update in get_task_updates(db_ses_obj, task_job_name, task_version,
+                                                             task_ids=task_ids).items():
+                    task_updates[(task_job_name, task_version, task_id)] = task_update
+
+        payloads = get_task_payloads(db_ses_obj, task_rcds, fields)
+        task_lst = [task_to_dict(task_rcd, datetimeobjs,
+                                 task_updates.get((task_rcd.JobName, task_rcd.Version, task_rcd.TaskID)), fields,
+                                 payloads)
+                    for task_rcd in task_rcds]
+        if len(task_rcds) > 0:
+            cursor_modified = min(task_rcds[-1].LastModified, datetime.datetime.now())
+            if last_modified is not None:
+                cursor_modified = max(cursor_modified, last_modified)
+            cursor_hashes = set([change_hash for task_modified, change_hash in window_hashes
+                                 if task_modified >= (cursor_modified - overlap_delta)])
+            if len(qury_rcds) == (limit + len(change_hashes)):
+                # The changes already returned which were not read (as the limit was reached) are kept.
+                cursor_hashes.update(unread_hashes)
+            cursor = _encode_changed_cursor(cursor_modified, cursor_hashes)
+    finally:
+        db_ses_obj.close()
+    return task_lst, cursor
+
+
+def _task_runtime_expr(dialect_name):
+    """
+    A function which creates an SQL expression for the runtime of a task, in seconds, for a database dialect.
+
+    :param dialect_name: the name of the sqlalchemy dialect (e.g., sqlite, postgresql or mysql).
+
+    :return: sqlalchemy expression
+    """
+    if dialect_name == "sqlite":
+        return (sqlalchemy.func.julianday(CJRTaskInfo.EndTime) -
+                sqlalchemy.func.julianday(CJRTaskInfo.StartTime)) * 86400.0
+    elif dialect_name == "postgresql":
+        return sqlalchemy.extract("epoch", CJRTaskInfo.EndTime - CJRTaskInfo.StartTime)
+    elif dialect_name == "mysql":
+        return sqlalchemy.func.timestampdiff(sqlalchemy.text("MICROSECOND"), CJRTaskInfo.StartTime,
+                                             CJRTaskInfo.EndTime) / 1000000.0
+    raise Exception("Runtime statistics are not supported for the '{}' database.".format(dialect_name))
+
+
+@cjr_metrics.timed_function("get_job_summary")
+def get_job_summary(job_name, version, cjr_db_file=None):
+    """
+    A function which summarises the tasks associated with a job and version. The summary is calculated
+    within the database using aggregate queries so the tasks are not retrieved.
+
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+
+    :return: returns a dictionary with the number of tasks ('n_tasks'), the number of completed tasks
+             ('n_completed'), the number of uncompleted tasks ('n_uncompleted'), the fraction of tasks which
+             have been completed ('completed_frac'), the start time of the first task ('first_start'), the end
+             time of the last completed task ('last_end') and the runtime statistics, in seconds, of the completed
+             tasks ('runtime_mean', 'runtime_min', 'runtime_max', 'runtime_p50' and 'runtime_p95'). Runtime
+             statistics are None if no tasks have been completed.
+    """
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        job_filter = sqlalchemy.and_(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version)
+
+        summary = dict()
+        summary['n_tasks'] = 0
+        summary['n_completed'] = 0
+        qury_rslt = db_ses_obj.query(CJRTaskInfo.TaskCompleted, sqlalchemy.func.count(),
+                                     sqlalchemy.func.min(CJRTaskInfo.StartTime)).\
+                               filter(job_filter).group_by(CJRTaskInfo.TaskCompleted).all()
+        summary['first_start'] = None
+        for task_completed, n_tasks, first_start in qury_rslt:
+            summary['n_tasks'] = summary['n_tasks'] + n_tasks
+            if task_completed:
+                summary['n_completed'] = summary['n_completed'] + n_tasks
+            if (first_start is not None) and ((summary['first_start'] is None) or
+                                              (first_start < summary['first_start'])):
+                summary['first_start'] = first_start
+        summary['n_uncompleted'] = summary['n_tasks'] - summary['n_completed']
+        summary['completed_frac'] = None
+        if summary['n_tasks'] > 0:
+            summary['completed_frac'] = summary['n_completed'] / float(summary['n_tasks'])
+
+        runtime_expr = _task_runtime_expr(db_ses_obj.bind.dialect.name)
+        completed_filter = sqlalchemy.and_(job_filter, CJRTaskInfo.TaskCompleted == True,
+                                           CJRTaskInfo.EndTime.isnot(None))
+        n_runtimes, runtime_mean, runtime_min, runtime_max, last_end = \
+            db_ses_obj.query(sqlalchemy.func.count(), sqlalchemy.func.avg(runtime_expr),
+                             sqlalchemy.func.min(runtime_expr), sqlalchemy.func.max(runtime_expr),
+                             sqlalchemy.func.max(CJRTaskInfo.EndTime)).filter(completed_filter).one()
+        summary['last_end'] = last_end
+        summary['runtime_mean'] = runtime_mean
+        summary['runtime_min'] = runtime_min
+        summary['runtime_max'] = runtime_max
+
+        # Percentiles are linearly interpolated between the two closest ranks, which are selected
+        # from the ordered runtimes within the database.
+        for percentile in [50, 95]:
+            runtime_pct = None
+            if n_runtimes > 0:
+                rank = (percentile / 100.0) * (n_runtimes - 1)
+                rank_offset = int(rank)
+                runtimes = [float(rcd[0]) for rcd in db_ses_obj.query(runtime_expr).filter(completed_filter).
+                                                               order_by(runtime_expr).offset(rank_offset).limit(2)]
+                runtime_pct = runtimes[0]
+                if len(runtimes) > 1:
+                    runtime_pct = runtime_pct + (runtimes[1] - runtimes[0]) * (rank - rank_offset)
+            summary['runtime_p{}'.format(percentile)] = runtime_pct
+    finally:
+        db_ses_obj.close()
+
+    return summary
+
+
+@cjr_metrics.timed_function("get_tasks_columnar")
+def get_tasks_columnar(job_name, version=None, completed=None, as_arrow=False, batch_size=10000, cjr_db_file=None):
+    """
+    A function which retrieves the tasks associated with a job (and version) as columns, rather than a
+    dictionary per task, which is much quicker to create and to use for analysis of large jobs. The columns
+    are built directly from the rows returned by the database. Requires numpy and, if as_arrow is True, pyarrow.
+
+    :param job_name: a string for the name of the job
+    :param version: an integer for the version of the task. If None then the tasks for all versions are returned.
+    :param completed: if None all the tasks are returned, if True only the completed tasks and if False only
+                      the uncompleted tasks.
+    :param as_arrow: if True then a pyarrow Table is returned rather than a dictionary of numpy arrays.
+    :param batch_size: the number of rows fetched from the database at a time.
+    :param cjr_db_file: optionally the database URL, if None then the CJR_DB_FILE environmental variable is used.
+
+    :return: a dictionary of numpy arrays (or a pyarrow Table) with the columns: 'task_id' (str), 'version' (int64),
+             'start' (datetime64[us]), 'end' (datetime64[us], NaT if not completed), 'duration' (float64 seconds,
+             NaN if not completed) and 'completed' (bool).
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise Exception("numpy is required for columnar results - please install it.")
+
+    task_tbl = CJRTaskInfo.__table__
+    task_select = sqlalchemy.select([task_tbl.c.TaskID, task_tbl.c.Version, task_tbl.c.StartTime,
+                                     task_tbl.c.EndTime, task_tbl.c.TaskCompleted]).\
+                             where(task_tbl.c.JobName == job_name)
+    if version is not None:
+        task_select = task_select.where(task_tbl.c.Version == version)
+    if completed is not None:
+        task_select = task_select.where(task_tbl.c.TaskCompleted == completed)
+    task_select = task_select.order_by(task_tbl.c.Version, task_tbl.c.TaskID)
+
+    task_ids = list()
+    versions = list()
+    start_times = list()
+    end_times = list()
+    completed_flags = list()
+    db_ses_obj = get_cjr_db_session(cjr_db_file)
+    try:
+        qury_rslt = db_ses_obj.execute(task_select)
+        while True:
+            task_rows = qury_rslt.fetchmany(batch_size)
+            if len(task_rows) == 0:
+                break
+            rows_task_ids, rows_versions, rows_start_times, rows_end_times, rows_completed = zip(*task_rows)
+            task_ids.extend(rows_task_ids)
+            versions.extend(rows_versions)
+            start_times.extend(rows_start_times)
+            end_times.extend(rows_end_times)
+            completed_flags.extend(rows_completed)
+    finally:
+        db_ses_obj.close()
+
+    completed_arr = numpy.array(completed_flags, dtype=bool)
+    task_cols = dict()
+    task_cols['task_id'] = numpy.array(task_ids, dtype=str)
+    task_cols['version'] = numpy.array(versions, dtype=numpy.int64)
+    task_cols['start'] = numpy.array(start_times, dtype='datetime64[us]')
+    task_cols['end'] = numpy.array(end_times, dtype='datetime64[us]')
+    # Only completed tasks have a valid end time.
+    task_cols['end'][~completed_arr] = numpy.datetime64('NaT')
+    task_cols['duration'] = (task_cols['end'] - task_cols['start']) / numpy.timedelta64(1, 's')
+    task_cols['completed'] = completed_arr
+
+    if as_arrow:
+        try:
+            import pyarrow
+        except ImportError:
+            raise Exception("pyarrow is required for arrow results - please install it.")
+        return pyarrow.table(task_cols)
+    return task_cols
@@ -29,17 +29,28 @@ cjr_recorder - Class to record job progress, this class is main interface to the
 # History:
 # Version 1.0 - Created.
 
-from enum import Enum
 import datetime
-import copy
-from cjrlib.cjr_db_connection import CJRDBConnection, CJRJobName, CJRTaskInfo
+import json
+import threading
+import traceback
+import functools
+import inspect
+import logging
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.ext.compiler
+import sqlalchemy.sql.expression
+from cjrlib.cjr_db_connection import CJRDBConnection, CJRJobName, CJRTaskInfo, CJRTaskUpdate, CJRPayload, \
+    retry_on_db_lock, iso_str_to_datetime, get_db_engine, bump_catalog_generation, encode_payload
+from cjrlib.cjr_journal import CJRJournal
+from cjrlib.cjr_job_status import JobStatus
+from cjrlib import cjr_metrics
+from cjrlib import cjr_queries
 
-class JobStatus(Enum):
-    START = 1
-    FINISH = 2
-    UPDATE = 3
+logger = logging.getLogger(__name__)
 
 
+@cjr_metrics.timed_function("record_task_status")
 def record_task_status(status, job_name, task_id, version, task_info, print_progress=False):
     """
     Generic function to record the status of a job to the database.
@@ -53,10 +64,23 @@ def record_task_status(status, job_name, task_id, version, task_info, print_prog
                      is expected to be the parameters for running the task.
     :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
 
+    If a journal file has been defined (see CJRDBConnection.set_journal) then the event is appended to the
+    journal and written to the database when the journal is flushed.
+
     """
     cjrdb_conn = CJRDBConnection()
     if cjrdb_conn is None:
         raise Exception("Could not create the connection object...")
+
+    if cjrdb_conn.journal_file is not None:
+        if not isinstance(status, JobStatus):
+            raise Exception("Do not recognise the status inputted.")
+        if print_progress:
+            print("Appending event to the journal '{}'...".format(cjrdb_conn.journal_file))
+        with cjr_metrics.timed("record_task_status", "journal_append"):
+            CJRJournal(cjrdb_conn.journal_file).append(status, job_name, task_id, version, task_info)
+        return
+
     cjrdb_conn.create_db_tables()
 
     if status == JobStatus.START:
@@ -69,9 +93,279 @@ def record_task_status(status, job_name, task_id, version, task_info, print_prog
         raise Exception("Do not recognise the status inputted.")
 
 
+# The write statements for each dialect (see _get_write_stmt), which are built once and compiled once per
+# engine using _compiled_cache.
+_write_stmts = dict()
+_write_stmts_lock = threading.Lock()
+_compiled_cache = sqlalchemy.util.LRUCache(100)
+
+# The job names and (job name, version) pairs known to be within each database, so the job name is only inserted
+# and the versions checked for the first task of a job version recorded by this process. Keyed by the database URL.
+_known_job_versions = dict()
+
+
+class _SQLiteInsertDoNothing(sqlalchemy.sql.expression.Insert):
+    """
+    An insert statement for SQLite (3.24 or later) which does nothing if a row with the same primary key is
+    already present (ON CONFLICT DO NOTHING). Unlike INSERT OR IGNORE other constraint errors are still raised.
+    """
+    pass
+
+
+@sqlalchemy.ext.compiler.compiles(_SQLiteInsertDoNothing, "sqlite")
+def _compile_sqlite_insert_do_nothing(insert_stmt, compiler, **kw):
+    pk_col_names = ", ".join([compiler.preparer.quote(pk_col.name) for pk_col in insert_stmt.table.primary_key])
+    return "{} ON CONFLICT ({}) DO NOTHING".format(compiler.visit_insert(insert_stmt, **kw), pk_col_names)
+
+
+def _insert_on_conflict_supported(dialect_name):
+    """
+    A function which checks whether _insert_ignore creates an ON CONFLICT DO NOTHING statement for a dialect,
+    which only ignores rows with the same primary key.
+    """
+    if dialect_name == "postgresql":
+        return True
+    elif dialect_name == "sqlite":
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def _insert_ignore(db_table, dialect_name):
+    """
+    A function which creates an insert statement which does nothing if a row with the same primary key is
+    already present (ON CONFLICT DO NOTHING, INSERT OR IGNORE or INSERT IGNORE), so whether the row was
+    inserted is given by the rowcount. For other dialects a plain insert is returned.
+    """
+    if dialect_name == "postgresql":
+        import sqlalchemy.dialects.postgresql
+        return sqlalchemy.dialects.postgresql.insert(db_table).\
+            on_conflict_do_nothing(index_elements=list(db_table.primary_key))
+    elif dialect_name == "sqlite":
+        if _insert_on_conflict_supported(dialect_name):
+            return _SQLiteInsertDoNothing(db_table)
+        return db_table.insert().prefix_with("OR IGNORE")
+    elif dialect_name == "mysql":
+        return db_table.insert().prefix_with("IGNORE")
+    return db_table.insert()
+
+
+def _update_touches_task(dialect_name):
+    """
+    A function which checks whether the 'task_update' statement also touches the task (i.e., sets LastModified
+    and LastHeartbeat) for a dialect, using an UPDATE ... RETURNING within a common table expression.
+    """
+    return dialect_name == "postgresql"
+
+
+def _get_write_stmt(dialect_name, stmt_name):
+    """
+    A function which gets one of the statements used to record the task events for a database dialect.
+
+    :param dialect_name: the name of the sqlalchemy dialect (e.g., sqlite or postgresql).
+    :param stmt_name: one of 'job_insert', 'task_insert', 'task_finish', 'task_touch', 'update_insert',
+                      'task_update' or 'payload_insert'.
+
+    :return: sqlalchemy statement
+    """
+    stmt = _write_stmts.get((dialect_name, stmt_name), None)
+    if stmt is not None:
+        return stmt
+    with _write_stmts_lock:
+        task_tbl = CJRTaskInfo.__table__
+        task_key_where = sqlalchemy.and_(task_tbl.c.JobName == sqlalchemy.bindparam("b_job_name"),
+                                         task_tbl.c.TaskID == sqlalchemy.bindparam("b_task_id"),
+                                         task_tbl.c.Version == sqlalchemy.bindparam("b_version"))
+        if stmt_name == "job_insert":
+            stmt = _insert_ignore(CJRJobName.__table__, dialect_name)
+        elif stmt_name == "task_insert":
+            # INSERT OR IGNORE and INSERT IGNORE also ignore other errors (e.g., NOT NULL) so are not used for
+            # the tasks, where an ignored row is reported as the task having already been started.
+            if _insert_on_conflict_supported(dialect_name):
+                stmt = _insert_ignore(task_tbl, dialect_name)
+            else:
+                stmt = task_tbl.insert()
+        elif stmt_name == "task_finish":
+            stmt = task_tbl.update().where(task_key_where).\
+                values(EndTime=sqlalchemy.bindparam("b_end_time"), TaskEndInfo=sqlalchemy.bindparam("b_end_info"),
+                       TaskEndInfoRef=sqlalchemy.bindparam("b_end_info_ref"), TaskCompleted=True,
+                       LastModified=sqlalchemy.bindparam("b_modified"))
+        elif stmt_name == "task_touch":
+            # Only tasks which have not been finished can be updated.
+            stmt = task_tbl.update().where(sqlalchemy.and_(task_key_where,
+                                                           sqlalchemy.or_(task_tbl.c.TaskCompleted == False,
+                                                                          task_tbl.c.TaskCompleted.is_(None)))).\
+                values(LastModified=sqlalchemy.bindparam("b_modified"),
+                       LastHeartbeat=sqlalchemy.bindparam("b_heartbeat"))
+        elif stmt_name == "update_insert":
+            stmt = CJRTaskUpdate.__table__.insert()
+        elif stmt_name == "task_update":
+            # Inserts the update only if the task is present and has not been finished, so the rowcount gives
+            # whether the update was recorded. On PostgreSQL the task is also touched within the same statement.
+            update_tbl = CJRTaskUpdate.__table__
+            task_not_completed_where = sqlalchemy.and_(task_key_where,
+                                                       sqlalchemy.or_(task_tbl.c.TaskCompleted == False,
+                                                                      task_tbl.c.TaskCompleted.is_(None)))
+            if _update_touches_task(dialect_name):
+                update_task_tbl = task_tbl.update().where(task_not_completed_where).\
+                    values(LastModified=sqlalchemy.bindparam("b_modified"),
+                           LastHeartbeat=sqlalchemy.bindparam("b_heartbeat")).\
+                    returning(task_tbl.c.TaskID, task_tbl.c.JobName, task_tbl.c.Version).cte("touched_task")
+                update_task_where = None
+            else:
+                update_task_tbl = task_tbl
+                update_task_where = task_not_completed_where
+            update_task_sel = sqlalchemy.select([
+                update_task_tbl.c.TaskID, update_task_tbl.c.JobName, update_task_tbl.c.Version,
+                sqlalchemy.bindparam("b_update_time", type_=update_tbl.c.UpdateTime.type),
+                sqlalchemy.bindparam("b_update_info", type_=update_tbl.c.UpdateInfo.type)])
+            if update_task_where is not None:
+                update_task_sel = update_task_sel.where(update_task_where)
+            stmt = update_tbl.insert().from_select(["TaskID", "JobName", "Version", "UpdateTime", "UpdateInfo"],
+                                                   update_task_sel)
+        elif stmt_name == "payload_insert":
+            stmt = _insert_ignore(CJRPayload.__table__, dialect_name)
+        else:
+            raise Exception("Do not recognise the statement '{}'.".format(stmt_name))
+        _write_stmts[(dialect_name, stmt_name)] = stmt
+    return stmt
+
+
+def _get_write_conn(cjrdb_conn):
+    """
+    A function which gets a connection, with the compiled statement cache, for writing to the database.
+    """
+    db_engine = get_db_engine(cjrdb_conn.cjr_db_file, write=True)
+    return db_engine.connect().execution_options(compiled_cache=_compiled_cache)
+
+
+def _get_task_completed(db_conn, job_name, task_id, version):
+    """
+    A function which gets the TaskCompleted value of a task, used to find why a write did not change a task.
+
+    :return: None if the task does not exist, otherwise a boolean.
+    """
+    task_tbl = CJRTaskInfo.__table__
+    qury_rslt = db_conn.execute(sqlalchemy.select([task_tbl.c.TaskCompleted]).
+                                where(sqlalchemy.and_(task_tbl.c.JobName == job_name, task_tbl.c.TaskID == task_id,
+                                                      task_tbl.c.Version == version))).fetchone()
+    if qury_rslt is None:
+        return None
+    return bool(qury_rslt[0])
+
+
+def _insert_job_versions(db_conn, db_url, job_versions):
+    """
+    A function which inserts the job names which are not already known to be within the database and, if a
+    job name or version is new to the database, increments the catalog generation so the cached job names and
+    versions are refreshed (see cjrlib.cjr_queries). This must be called before the tasks are inserted.
+
+    :param job_versions: set of (job name, version) tuples.
+
+    :return: set of the job names and (job name, version) tuples which will be known once the transaction
+             has been committed.
+    """
+    known_job_versions = _known_job_versions.get(db_url, set())
+    job_versions = set(job_versions) - known_job_versions
+    if len(job_versions) == 0:
+        return job_versions
+    job_names = set([job_name for job_name, version in job_versions]) - known_job_versions
+    n_new_job_names = 0
+    if len(job_names) > 0:
+        dialect_name = db_conn.dialect.name
+        if dialect_name not in ["sqlite", "postgresql", "mysql"]:
+            # An insert which ignores existing rows is not available so check which job names are present.
+            job_tbl = CJRJobName.__table__
+            qury_rslt = db_conn.execute(sqlalchemy.select([job_tbl.c.JobName]).
+                                        where(job_tbl.c.JobName.in_(job_names))).fetchall()
+            new_job_names = job_names - set([job_name_rcd[0] for job_name_rcd in qury_rslt])
+            if len(new_job_names) > 0:
+                db_conn.execute(job_tbl.insert(), [{"JobName": job_name} for job_name in new_job_names])
+            n_new_job_names = len(new_job_names)
+        else:
+            # Inserted one at a time as the rowcount of an executemany is not reliable for all drivers.
+            for job_name in job_names:
+                n_new_job_names += db_conn.execute(_get_write_stmt(dialect_name, "job_insert"),
+                                                   {"JobName": job_name}).rowcount
+
+    # A new job name always has new versions, otherwise check whether the versions already have tasks.
+    catalog_changed = n_new_job_names > 0
+    if not catalog_changed:
+        task_tbl = CJRTaskInfo.__table__
+        job_name_versions = dict()
+        for job_name, version in job_versions:
+            job_name_versions.setdefault(job_name, set()).add(version)
+        for job_name, versions in job_name_versions.items():
+            qury_rslt = db_conn.execute(sqlalchemy.select([task_tbl.c.Version]).
+                                        where(sqlalchemy.and_(task_tbl.c.JobName == job_name,
+                                                              task_tbl.c.Version.in_(versions))).
+                                        group_by(task_tbl.c.Version)).fetchall()
+            if len(versions - set([version_rcd[0] for version_rcd in qury_rslt])) > 0:
+                catalog_changed = True
+                break
+    if catalog_changed:
+        bump_catalog_generation(db_conn)
+    return job_versions | job_names
+
+
+def _add_known_job_versions(db_url, job_versions):
+    """
+    A function which records the job names and versions which have been committed to the database and
+    invalidates the job names and versions cached by this process.
+    """
+    if len(job_versions) > 0:
+        _known_job_versions.setdefault(db_url, set()).update(job_versions)
+        cjr_queries.invalidate_catalog_cache(db_url)
+
+
+def _encode_task_payload(cjrdb_conn, task_info, payload_rcds):
+    """
+    A function which encodes a task payload for the payload store, if it is being used (see
+    CJRDBConnection.set_payload_store). The payload store records to be inserted are added to payload_rcds.
+
+    :return: (payload, payload hash) tuple with the values for the CJRTaskInfo columns; the payload is None if
+             it is within the payload store, otherwise the payload hash is None.
+    """
+    if cjrdb_conn.payload_compression is None:
+        return task_info, None
+    encoded_payload = encode_payload(task_info, cjrdb_conn.payload_compression, cjrdb_conn.payload_min_size)
+    if encoded_payload is None:
+        return task_info, None
+    payload_hash, compression, payload_data = encoded_payload
+    payload_rcds[payload_hash] = {"PayloadHash": payload_hash, "Compression": compression,
+                                  "PayloadData": payload_data}
+    return None, payload_hash
+
+
+def _insert_payloads(db_conn, payload_rcds):
+    """
+    A function which inserts the payloads into the payload store, ignoring those already present.
+
+    :param payload_rcds: dict of CJRPayload records keyed by the payload hash.
+
+    """
+    if len(payload_rcds) == 0:
+        return
+    dialect_name = db_conn.dialect.name
+    if dialect_name not in ["sqlite", "postgresql", "mysql"]:
+        payload_tbl = CJRPayload.__table__
+        qury_rslt = db_conn.execute(sqlalchemy.select([payload_tbl.c.PayloadHash]).
+                                    where(payload_tbl.c.PayloadHash.in_(list(payload_rcds.keys())))).fetchall()
+        payload_rcds = dict(payload_rcds)
+        for payload_rcd in qury_rslt:
+            del payload_rcds[payload_rcd[0]]
+        if len(payload_rcds) == 0:
+            return
+    db_conn.execute(_get_write_stmt(dialect_name, "payload_insert"), list(payload_rcds.values()))
+
+
+@cjr_metrics.timed_function("record_task_start")
+@retry_on_db_lock
 def record_task_start(job_name, task_id, version, task_info, cjrdb_conn, print_progress=False):
     """
-    A function to record the start of a task within a job.
+    A function to record the start of a task within a job. The task is inserted using a single statement
+    (which ignores existing tasks, ON CONFLICT DO NOTHING) and whether the task was already present is given
+    by the rowcount. For other databases a duplicate key error is caught and checked against the existing task.
 
     :param job_name: The name of the job. This could be shared between a number of tasks.
     :param task_id: This is unique name for the task within the job - the combination of the job name and task ID need
@@ -84,33 +378,60 @@ def record_task_start(job_name, task_id, version, task_info, cjrdb_conn, print_p
     """
     if print_progress:
         print("Start Job...")
-    db_ses_obj = cjrdb_conn.get_db_session()
-
-    qury_rslt = db_ses_obj.query(CJRJobName).filter(CJRJobName.JobName == job_name).one_or_none()
-    if qury_rslt is None:
-        db_ses_obj.add(CJRJobName(JobName=job_name))
+    start_time = datetime.datetime.now()
+    payload_rcds = dict()
+    task_params, task_params_ref = _encode_task_payload(cjrdb_conn, task_info, payload_rcds)
+    db_conn = _get_write_conn(cjrdb_conn)
+    try:
+        db_trans = db_conn.begin()
+        try:
+            with cjr_metrics.timed("record_task_start", "write"):
+                new_job_versions = _insert_job_versions(db_conn, cjrdb_conn.cjr_db_file, [(job_name, version)])
+                _insert_payloads(db_conn, payload_rcds)
+                task_values = {"TaskID": task_id, "JobName": job_name, "Version": version, "StartTime": start_time,
+                               "TaskParams": task_params, "TaskParamsRef": task_params_ref, "TaskCompleted": False,
+                               "LastModified": start_time, "LastHeartbeat": start_time}
+                task_insert_stmt = _get_write_stmt(db_conn.dialect.name, "task_insert")
+                if _insert_on_conflict_supported(db_conn.dialect.name):
+                    n_inserted = db_conn.execute(task_insert_stmt, task_values).rowcount
+                else:
+                    try:
+                        if db_conn.dialect.name == "mysql":
+                            # A failed statement does not abort a MySQL transaction so a savepoint is not needed.
+                            n_inserted = db_conn.execute(task_insert_stmt, task_values).rowcount
+                        else:
+                            with db_conn.begin_nested():
+                                n_inserted = db_conn.execute(task_insert_stmt, task_values).rowcount
+                    except sqlalchemy.exc.IntegrityError:
+                        # Only report the task as already started if it is present, otherwise raise the error.
+                        if _get_task_completed(db_conn, job_name, task_id, version) is None:
+                            raise
+                        n_inserted = 0
+            with cjr_metrics.timed("record_task_start", "commit"):
+                db_trans.commit()
+        except sqlalchemy.exc.IntegrityError:
+            db_trans.rollback()
+            # The job name may have been removed from the database since it was cached.
+            _known_job_versions.pop(cjrdb_conn.cjr_db_file, None)
+            raise
+        except BaseException:
+            db_trans.rollback()
+            raise
+        _add_known_job_versions(cjrdb_conn.cjr_db_file, new_job_versions)
+    finally:
+        db_conn.close()
 
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name).\
-                                              filter(CJRTaskInfo.TaskID == task_id).\
-                                              filter(CJRTaskInfo.Version == version).one_or_none()
-
-    if qury_rslt is None:
-        start_time = datetime.datetime.now()
-        db_ses_obj.add(CJRTaskInfo(TaskID=task_id,  JobName=job_name, Version=version,
-                                   StartTime=start_time, TaskParams=task_info))
-    else:
-        db_ses_obj.commit()
-        db_ses_obj.close()
+    if n_inserted == 0:
         raise Exception("The task '{} - {} v{}' have already been started - change the task ID or version.".\
                         format(job_name, task_id, version))
 
-    db_ses_obj.commit()
-    db_ses_obj.close()
-
 
+@cjr_metrics.timed_function("record_task_finish")
+@retry_on_db_lock
 def record_task_finish(job_name, task_id, version, task_info, cjrdb_conn, print_progress=False):
     """
-    A function to record the end of a task within a job.
+    A function to record the end of a task within a job. The task is updated using a single statement and
+    whether the task was present is given by the rowcount.
 
     :param job_name: The name of the job. This could be shared between a number of tasks.
     :param task_id: This is unique name for the task within the job - the combination of the job name and task ID need
@@ -122,28 +443,41 @@ def record_task_finish(job_name, task_id, version, task_info, cjrdb_conn, print_
     """
     if print_progress:
         print("Finish Job...")
-    db_ses_obj = cjrdb_conn.get_db_session()
+    payload_rcds = dict()
+    task_end_info, task_end_info_ref = _encode_task_payload(cjrdb_conn, task_info, payload_rcds)
+    db_conn = _get_write_conn(cjrdb_conn)
+    try:
+        db_trans = db_conn.begin()
+        try:
+            with cjr_metrics.timed("record_task_finish", "write"):
+                end_time = datetime.datetime.now()
+                _insert_payloads(db_conn, payload_rcds)
+                n_updated = db_conn.execute(_get_write_stmt(db_conn.dialect.name, "task_finish"),
+                                            {"b_job_name": job_name, "b_task_id": task_id, "b_version": version,
+                                             "b_end_time": end_time, "b_end_info": task_end_info,
+                                             "b_end_info_ref": task_end_info_ref, "b_modified": end_time}).rowcount
+            with cjr_metrics.timed("record_task_finish", "commit"):
+                db_trans.commit()
+        except BaseException:
+            db_trans.rollback()
+            raise
+    finally:
+        db_conn.close()
 
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name). \
-        filter(CJRTaskInfo.TaskID == task_id). \
-        filter(CJRTaskInfo.Version == version).one_or_none()
-
-    if qury_rslt is not None:
-        qury_rslt.EndTime = datetime.datetime.now()
-        qury_rslt.TaskEndInfo = task_info
-        qury_rslt.TaskCompleted = True
-    else:
-        db_ses_obj.close()
+    if n_updated == 0:
         raise Exception("The task '{} - {} v{}' could not be found - check inputs.". \
                         format(job_name, task_id, version))
 
-    db_ses_obj.commit()
-    db_ses_obj.close()
-
 
+@cjr_metrics.timed_function("record_task_update")
+@retry_on_db_lock
 def record_task_update(job_name, task_id, version, task_info, cjrdb_conn, print_progress=False):
     """
-    A function to record the end of a task within a job.
+    A function to record an update for a task within a job. The update is inserted using a statement which
+    selects the task only if it has not been finished. On PostgreSQL the same statement marks the task as
+    modified, so an update is a single statement; for other databases the task is marked as modified with a
+    second statement, within the same transaction, once the update has been inserted. The task is only read from
+    the database to report why the update could not be recorded.
 
     :param job_name: The name of the job. This could be shared between a number of tasks.
     :param task_id: This is unique name for the task within the job - the combination of the job name and task ID need
@@ -155,31 +489,483 @@ def record_task_update(job_name, task_id, version, task_info, cjrdb_conn, print_
     """
     if print_progress:
         print("Update Job...")
-    db_ses_obj = cjrdb_conn.get_db_session()
+    update_time = datetime.datetime.now()
+    task_completed = None
+    db_conn = _get_write_conn(cjrdb_conn)
+    try:
+        db_trans = db_conn.begin()
+        try:
+            with cjr_metrics.timed("record_task_update", "write"):
+                # Updates are appended as rows to the CJRTaskUpdate table rather than rewriting the
+                # TaskUpdates column.
+                task_params = {"b_job_name": job_name, "b_task_id": task_id, "b_version": version,
+                               "b_modified": update_time, "b_heartbeat": update_time,
+                               "b_update_time": update_time, "b_update_info": task_info}
+                n_updated = db_conn.execute(_get_write_stmt(db_conn.dialect.name, "task_update"),
+                                            task_params).rowcount
+                if n_updated == 0:
+                    task_completed = _get_task_completed(db_conn, job_name, task_id, version)
+                elif not _update_touches_task(db_conn.dialect.name):
+                    db_conn.execute(_get_write_stmt(db_conn.dialect.name, "task_touch"), task_params)
+            with cjr_metrics.timed("record_task_update", "commit"):
+                db_trans.commit()
+        except BaseException:
+            db_trans.rollback()
+            raise
+    finally:
+        db_conn.close()
 
-    qury_rslt = db_ses_obj.query(CJRTaskInfo).filter(CJRTaskInfo.JobName == job_name). \
-        filter(CJRTaskInfo.TaskID == task_id). \
-        filter(CJRTaskInfo.Version == version).one_or_none()
-
-    if qury_rslt is not None:
-        if qury_rslt.TaskCompleted:
-            db_ses_obj.close()
-            raise Exception("The task '{} - {} v{}' has already been finished - check inputs.". \
+    if n_updated == 0:
+        if task_completed is None:
+            raise Exception("The task '{} - {} v{}' could not be found - check inputs.". \
+                            format(job_name, task_id, version))
+        raise Exception("The task '{} - {} v{}' has already been finished - check inputs.". \
                         format(job_name, task_id, version))
 
-        update_time = datetime.datetime.now()
-        task_updates_info = qury_rslt.TaskUpdates
-        if task_updates_info is None:
-            lcl_task_updates_info = dict()
-        else:
-            lcl_task_updates_info = copy.deepcopy(task_updates_info)
-        lcl_task_updates_info[update_time.isoformat()] = task_info
-        qury_rslt.TaskUpdates = lcl_task_updates_info
-    else:
+
+# The maximum number of task IDs listed within a query by _get_task_states.
+_MAX_QUERY_TASK_IDS = 500
+
+
+def _get_task_states(db_ses_obj, task_keys):
+    """
+    A function which retrieves whether a set of tasks exist and whether they have been completed using a
+    query per job name and version (and per 500 tasks).
+
+    :param db_ses_obj: an sqlalchemy session object.
+    :param task_keys: a set of (job_name, task_id, version) tuples.
+
+    :return: dictionary with the (job_name, task_id, version) tuple as the key and the TaskCompleted value. Tasks
+             which are not within the database are not included.
+    """
+    job_vers_tasks = dict()
+    for job_name, task_id, version in task_keys:
+        job_vers_tasks.setdefault((job_name, version), list()).append(task_id)
+
+    task_states = dict()
+    for (job_name, version), task_ids in job_vers_tasks.items():
+        # The number of task IDs within each query is limited, whatever the chunk size, so the number of
+        # variables is within the limits of the database (e.g., 999 for older versions of SQLite).
+        for i in range(0, len(task_ids), _MAX_QUERY_TASK_IDS):
+            qury_rslt = db_ses_obj.query(CJRTaskInfo.TaskID, CJRTaskInfo.TaskCompleted).\
+                                   filter(CJRTaskInfo.JobName == job_name, CJRTaskInfo.Version == version,
+                                          CJRTaskInfo.TaskID.in_(task_ids[i:i + _MAX_QUERY_TASK_IDS])).all()
+            for task_rcd in qury_rslt:
+                task_states[(job_name, task_rcd.TaskID, version)] = bool(task_rcd.TaskCompleted)
+    return task_states
+
+
+@cjr_metrics.timed_function("record_task_statuses_chunk")
+@retry_on_db_lock
+def _record_task_statuses_chunk(task_events, cjrdb_conn):
+    """
+    A function which records a chunk of task events within a single transaction.
+
+    :param task_events: list of (status, job_name, task_id, version, task_info, event_time) tuples.
+    :param cjrdb_conn: a CJRDBConnection object for interfacing to the database.
+
+    :return: list of (success, message) tuples, one per event.
+    """
+    db_ses_obj = cjrdb_conn.get_db_session(write=True)
+    try:
+        with cjr_metrics.timed("record_task_statuses_chunk", "select"):
+            task_states = _get_task_states(db_ses_obj, set([(evt[1], evt[2], evt[3]) for evt in task_events]))
+
+        # The tasks are marked as modified at the time they are written (rather than the time of the event, which
+        # may be earlier for events from a journal) so they are found by get_tasks_changed_since.
+        modified_time = datetime.datetime.now()
+        modified_tasks = dict()
+
+        # Check each event in order against the current state of the tasks, including events earlier in the chunk.
+        results = list()
+        start_rcds = list()
+        update_rcds = list()
+        finish_rcds = list()
+        payload_rcds = dict()
+        for status, job_name, task_id, version, task_info, event_time in task_events:
+            task_key = (job_name, task_id, version)
+            if status == JobStatus.START:
+                if task_key in task_states:
+                    results.append((False, "The task '{} - {} v{}' have already been started - change the task ID "
+                                           "or version.".format(job_name, task_id, version)))
+                    continue
+                task_states[task_key] = False
+                task_params, task_params_ref = _encode_task_payload(cjrdb_conn, task_info, payload_rcds)
+                start_rcds.append({"TaskID": task_id, "JobName": job_name, "Version": version,
+                                   "StartTime": event_time, "TaskParams": task_params,
+                                   "TaskParamsRef": task_params_ref, "TaskCompleted": False,
+                                   "LastModified": modified_time, "LastHeartbeat": event_time})
+            elif status == JobStatus.UPDATE:
+                if task_key not in task_states:
+                    results.append((False, "The task '{} - {} v{}' could not be found - check inputs.".
+                                    format(job_name, task_id, version)))
+                    continue
+                if task_states[task_key]:
+                    results.append((False, "The task '{} - {} v{}' has already been finished - check inputs.".
+                                    format(job_name, task_id, version)))
+                    continue
+                update_rcds.append({"TaskID": task_id, "JobName": job_name, "Version": version,
+                                    "UpdateTime": event_time, "UpdateInfo": task_info})
+                modified_tasks[task_key] = {"b_job_name": job_name, "b_task_id": task_id, "b_version": version,
+                                            "b_modified": modified_time, "b_heartbeat": event_time}
+            elif status == JobStatus.FINISH:
+                if task_key not in task_states:
+                    results.append((False, "The task '{} - {} v{}' could not be found - check inputs.".
+                                    format(job_name, task_id, version)))
+                    continue
+                task_states[task_key] = True
+                task_end_info, task_end_info_ref = _encode_task_payload(cjrdb_conn, task_info, payload_rcds)
+                finish_rcds.append({"b_job_name": job_name, "b_task_id": task_id, "b_version": version,
+                                    "b_end_time": event_time, "b_end_info": task_end_info,
+                                    "b_end_info_ref": task_end_info_ref, "b_modified": modified_time})
+            else:
+                results.append((False, "Do not recognise the status inputted."))
+                continue
+            results.append((True, None))
+
+        with cjr_metrics.timed("record_task_statuses_chunk", "write"):
+            db_conn = db_ses_obj.connection()
+            dialect_name = db_conn.dialect.name
+            job_versions = set([(start_rcd["JobName"], start_rcd["Version"]) for start_rcd in start_rcds])
+            job_versions = _insert_job_versions(db_conn, cjrdb_conn.cjr_db_file, job_versions)
+            _insert_payloads(db_conn, payload_rcds)
+            if len(start_rcds) > 0:
+                db_conn.execute(CJRTaskInfo.__table__.insert(), start_rcds)
+            if len(update_rcds) > 0:
+                db_conn.execute(_get_write_stmt(dialect_name, "update_insert"), update_rcds)
+                db_conn.execute(_get_write_stmt(dialect_name, "task_touch"), list(modified_tasks.values()))
+            if len(finish_rcds) > 0:
+                db_conn.execute(_get_write_stmt(dialect_name, "task_finish"), finish_rcds)
+        with cjr_metrics.timed("record_task_statuses_chunk", "commit"):
+            db_ses_obj.commit()
+        _add_known_job_versions(cjrdb_conn.cjr_db_file, job_versions)
+    except sqlalchemy.exc.IntegrityError:
+        # The job names may have been removed from the database since they were cached.
+        _known_job_versions.pop(cjrdb_conn.cjr_db_file, None)
+        raise
+    finally:
         db_ses_obj.close()
-        raise Exception("The task '{} - {} v{}' could not be found - check inputs.". \
-                        format(job_name, task_id, version))
+    return results
+
+
+def record_task_statuses(task_events, chunk_size=500, print_progress=False):
+    """
+    A function to record the status of many tasks to the database. The events are checked against the database
+    with a small number of set based queries and written in chunked transactions, which is much quicker than
+    calling record_task_status for each event. Events which are not valid (e.g., a task being started twice or
+    a missing task) are reported within the returned list and do not stop the other events being recorded.
+
+    :param task_events: an iterable of (status, job_name, task_id, version, task_info) tuples, where the parameters
+                        are the same as record_task_status. Optionally, a 6th value can be provided with the time
+                        (datetime object) of the event, otherwise the time the event was processed is used.
+    :param chunk_size: the number of events recorded within each transaction.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: a list of (success, message) tuples, one for each event in the order they were provided. success is
+             a boolean and message is None or a string describing why the event was not recorded. Errors other than
+             invalid events (e.g., the database not being available) are raised.
+
+    """
+    cjrdb_conn = CJRDBConnection()
+    if cjrdb_conn is None:
+        raise Exception("Could not create the connection object...")
+    cjrdb_conn.create_db_tables()
+
+    results = list()
+    task_events_chunk = list()
+    task_events_iter = iter(task_events)
+    while True:
+        task_event = next(task_events_iter, None)
+        if task_event is not None:
+            if len(task_event) == 5:
+                task_event = tuple(task_event) + (datetime.datetime.now(),)
+            task_events_chunk.append(tuple(task_event))
+        if (len(task_events_chunk) >= chunk_size) or ((task_event is None) and (len(task_events_chunk) > 0)):
+            if print_progress:
+                print("Recording {} task events...".format(len(task_events_chunk)))
+            try:
+                results.extend(_record_task_statuses_chunk(task_events_chunk, cjrdb_conn))
+            except sqlalchemy.exc.IntegrityError:
+                # The chunk failed (e.g., another process recorded the same task) so record the
+                # events individually so only the failing events are reported. Other errors (e.g.,
+                # the database not being available) are raised to the caller.
+                for status, job_name, task_id, version, task_info, event_time in task_events_chunk:
+                    try:
+                        results.extend(_record_task_statuses_chunk([(status, job_name, task_id, version,
+                                                                     task_info, event_time)], cjrdb_conn))
+                    except sqlalchemy.exc.IntegrityError as error:
+                        results.append((False, str(error)))
+            task_events_chunk = list()
+        if task_event is None:
+            break
+    return results
+
+
+def _parse_task_event_line(event_line):
+    """
+    A function to parse a task event from a line of JSON.
+
+    :return: a (status, job_name, task_id, version, task_info, event_time) tuple.
+    """
+    event = json.loads(event_line)
+    if not isinstance(event, dict):
+        raise Exception("The event must be a JSON object.")
+    for event_key in ["status", "jobname", "taskid"]:
+        if event_key not in event:
+            raise Exception("The event does not have a '{}' value.".format(event_key))
+    if event["status"] not in JobStatus.__members__:
+        raise Exception("Do not recognise the status '{}'.".format(event["status"]))
+    version = event.get("version", 0)
+    if isinstance(version, bool) or (not isinstance(version, int)):
+        raise Exception("The version must be an integer.")
+    event_time = datetime.datetime.now()
+    if event.get("time", None) is not None:
+        event_time = iso_str_to_datetime(event["time"])
+    return (JobStatus[event["status"]], event["jobname"], event["taskid"], version, event.get("taskinfo", dict()),
+            event_time)
+
+
+def _record_jsonl_chunk(task_events_chunk, chunk_results, print_progress):
+    if len(task_events_chunk) > 0:
+        event_results = iter(record_task_statuses(task_events_chunk, len(task_events_chunk), print_progress))
+        for chunk_result in chunk_results:
+            if chunk_result[1] is None:
+                chunk_result[1], chunk_result[2] = next(event_results)
+
+def record_task_statuses_jsonl(events_file_obj, chunk_size=500, print_progress=False):
+    """
+    A function to record task events read from a JSON Lines file (e.g., sys.stdin), with one event per line:
+
+        {"status": "START", "jobname": "job", "taskid": "task1", "version": 0, "taskinfo": {...}}
+
+    status, jobname and taskid are required; version defaults to 0, taskinfo to an empty dictionary and the
+    optional time (ISO formatted string) to the time the line is read. The lines are read and recorded in chunks
+    (see record_task_statuses), so the events for a whole job can be recorded using one connection. Lines which
+    cannot be read or events which are not valid are reported and do not stop the other events being recorded.
+
+    :param events_file_obj: a file object (in text mode) to read the events from.
+    :param chunk_size: the number of events recorded within each transaction.
+    :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+
+    :return: a list of (line_number, success, message) tuples, one for each non-empty line in the order they were
+             read. line_number starts at 1, success is a boolean and message is None or a string describing why
+             the event was not recorded.
+
+    """
+    results = list()
+    chunk_results = list()
+    task_events_chunk = list()
+    for line_number, event_line in enumerate(events_file_obj, start=1):
+        if event_line.strip() == "":
+            continue
+        try:
+            task_event = _parse_task_event_line(event_line)
+        except Exception as error:
+            chunk_results.append([line_number, False, "Could not read the event: {}".format(error)])
+            continue
+        chunk_results.append([line_number, None, None])
+        task_events_chunk.append(task_event)
+        if len(task_events_chunk) >= chunk_size:
+            _record_jsonl_chunk(task_events_chunk, chunk_results, print_progress)
+            results.extend(chunk_results)
+            chunk_results = list()
+            task_events_chunk = list()
+    _record_jsonl_chunk(task_events_chunk, chunk_results, print_progress)
+    results.extend(chunk_results)
+    return [tuple(result) for result in results]
+
+
+class TaskRecorder:
+    """
+    A context manager which records a task: START when entered, FINISH when exited and the updates in between.
+    The updates passed to update() are merged in memory and recorded by a background thread at most every
+    update_interval seconds, or sooner once max_updates updates have been merged, so the number of database
+    transactions for a task does not depend on how often update() is called. If the task raises an exception
+    then the exception is recorded in the finish information (or as an update, see finish_on_error).
+
+        with TaskRecorder("job", "task1", 0, {"input": "file.tif"}) as task_rcdr:
+            for i in range(n):
+                ...
+                task_rcdr.update({"progress": i})
+            task_rcdr.set_finish_info({"output": "out.tif"})
+
+    A TaskRecorder can also be used as a function decorator, where each call of the function is recorded as a
+    task. The task ID of each call is created from the arguments of the call, using either a format string
+    (formatted with the positional arguments and the arguments by name, including defaults) or a function
+    (called with the arguments), so each call needs to have different arguments:
+
+        @TaskRecorder("job", "tile_{tile_id}", 0)
+        def process_tile(tile_id, out_dir="out"):
+            ...
+
+        @TaskRecorder("job", lambda in_file: os.path.basename(in_file), 0)
+        def process_file(in_file):
+            ...
+    """
+
+    def __init__(self, job_name, task_id, version=0, task_params=None, update_interval=10.0, max_updates=100,
+                 finish_on_error=True, print_progress=False):
+        """
+        :param job_name: The name of the job.
+        :param task_id: The unique name for the task within the job. When used as a function decorator, this is
+                        a format string or a function used to create the task ID for each call.
+        :param version: The version of the job and task.
+        :param task_params: A dictionary of the parameters for the task, recorded with START.
+        :param update_interval: the maximum time (seconds) between the merged updates being recorded.
+        :param max_updates: the number of updates merged before they are recorded, without waiting for
+                            update_interval.
+        :param finish_on_error: if True (default) then when an exception is raised the task is finished with the
+                                exception information. If False then the exception information is recorded as an
+                                update, so the task remains uncompleted.
+        :param print_progress: a boolean to specify whether an feedback should be printed to the console (Default: False)
+        """
+        self.job_name = job_name
+        self.task_id = task_id
+        self.version = version
+        self.task_params = task_params if task_params is not None else dict()
+        self.update_interval = update_interval
+        self.max_updates = max_updates
+        self.finish_on_error = finish_on_error
+        self.print_progress = print_progress
+        self.finish_info = dict()
+        self._pending_update = None
+        self._n_pending = 0
+        self._lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+
+    def __enter__(self):
+        if callable(self.task_id):
+            raise Exception("A function to create the task ID can only be used when decorating a function.")
+        record_task_status(JobStatus.START, self.job_name, self.task_id, self.version, self.task_params,
+                           self.print_progress)
+        self._stop_event.clear()
+        self._flush_thread = threading.Thread(target=self._run_flush, name="CJRTaskRecorder")
+        self._flush_thread.daemon = True
+        self._flush_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._stop_event.set()
+        self._flush_event.set()
+        self._flush_thread.join()
+        self._flush_thread = None
+        try:
+            self.flush()
+        except Exception as error:
+            # The task is still finished and the exception raised within the block is not replaced; otherwise
+            # the error is raised once the task has been finished.
+            if exc_type is None:
+                self._record_exit(exc_type, exc_value, exc_tb)
+                raise
+            logger.warning("Could not record the update for task '{} - {} v{}': {}".format(
+                self.job_name, self.task_id, self.version, error))
+
+        if exc_type is None:
+            self._record_exit(exc_type, exc_value, exc_tb)
+        else:
+            try:
+                self._record_exit(exc_type, exc_value, exc_tb)
+            except Exception as error:
+                logger.warning("Could not record the end of task '{} - {} v{}': {}".format(
+                    self.job_name, self.task_id, self.version, error))
+        return False
+
+    def _record_exit(self, exc_type, exc_value, exc_tb):
+        """
+        A function which records the end of the task (FINISH) or, if the block raised an exception and
+        finish_on_error is False, an UPDATE with the error.
+        """
+        finish_info = self.finish_info
+        if exc_type is not None:
+            error_info = {"type": exc_type.__name__, "message": str(exc_value),
+                          "traceback": "".join(traceback.format_exception(exc_type, exc_value, exc_tb))}
+            if not self.finish_on_error:
+                record_task_status(JobStatus.UPDATE, self.job_name, self.task_id, self.version,
+                                   {"error": error_info}, self.print_progress)
+                return
+            finish_info = dict(finish_info)
+            finish_info["error"] = error_info
+        record_task_status(JobStatus.FINISH, self.job_name, self.task_id, self.version, finish_info,
+                           self.print_progress)
+
+    def __call__(self, func):
+        func_sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def _recorded_func(*args, **kwargs):
+            if callable(self.task_id):
+                task_id = self.task_id(*args, **kwargs)
+            else:
+                call_args = func_sig.bind(*args, **kwargs)
+                call_args.apply_defaults()
+                task_id = self.task_id.format(*call_args.args, **call_args.arguments)
+            with TaskRecorder(self.job_name, task_id, self.version, self.task_params, self.update_interval,
+                              self.max_updates, self.finish_on_error, self.print_progress):
+                return func(*args, **kwargs)
+        return _recorded_func
+
+    def update(self, task_info):
+        """
+        A function which adds an update for the task. Dictionaries are merged with the updates not yet recorded
+        (later values replacing earlier ones); for other values only the latest is recorded.
+
+        :param task_info: A dictionary of information on the task progress.
+
+        """
+        with self._lock:
+            if isinstance(task_info, dict) and isinstance(self._pending_update, dict):
+                self._pending_update.update(task_info)
+            elif isinstance(task_info, dict):
+                self._pending_update = dict(task_info)
+            else:
+                self._pending_update = task_info
+            self._n_pending = self._n_pending + 1
+            if self._n_pending >= self.max_updates:
+                self._flush_event.set()
+
+    def set_finish_info(self, finish_info):
+        """
+        A function which sets the information recorded with FINISH when the task exits.
+
+        :param finish_info: A dictionary of information on the completion of the task.
+
+        """
+        self.finish_info = finish_info
 
-    db_ses_obj.commit()
-    db_ses_obj.close()
+    def flush(self):
+        """
+        A function which records the merged updates which have not yet been recorded.
+        """
+        with self._lock:
+            if self._n_pending == 0:
+                return
+            pending_update = self._pending_update
+            self._pending_update = None
+            self._n_pending = 0
+        try:
+            record_task_status(JobStatus.UPDATE, self.job_name, self.task_id, self.version, pending_update,
+                               self.print_progress)
+        except Exception:
+            # Put the update back, merged with any newer updates, so it is recorded with the next flush.
+            with self._lock:
+                if isinstance(pending_update, dict) and isinstance(self._pending_update, dict):
+                    pending_update.update(self._pending_update)
+                    self._pending_update = pending_update
+                elif self._pending_update is None:
+                    self._pending_update = pending_update
+                self._n_pending = self._n_pending + 1
+            raise
 
+    def _run_flush(self):
+        while not self._stop_event.is_set():
+            self._flush_event.wait(self.update_interval)
+            self._flush_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as error:
+                logger.warning("Could not record the update for task '{} - {} v{}': {}".format(
+                    self.job_name, self.task_id, self.version, error))
@@ -33,8 +33,7 @@ $ python setup.py install
 # History:
 # Version 1.0 - Created.
 
-import setuptools
-from distutils.core import setup
+from setuptools import setup
 import os
 
 setup(name='ComputeJobRecorder',
@@ -42,8 +41,10 @@ setup(name='ComputeJobRecorder',
     description='A tool for recording a compute job progress.',
     author='Pete Bunting',
     author_email='pfb@aber.ac.uk',
-    scripts=['bin/cjr_query.py', 'bin/cjr_record.py'],
+    scripts=['bin/cjr_query.py', 'bin/cjr_record.py', 'bin/cjr_db_admin.py',
+             'bin/cjr_flush_journal.py', 'bin/cjr_init_db.py', 'bin/cjr_recorder_daemon.py'],
     packages=['cjrlib'],
+    entry_points={'console_scripts': ['cjr_benchmark = cjrlib.cjr_benchmark:main']},
     package_dir={'cjrlib': 'cjrlib'},
     license='LICENSE.txt',
     url='https://www.remotesensing.info/compute_job_recorder',